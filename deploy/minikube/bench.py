@@ -0,0 +1,577 @@
+"""Benchmark deploy.py's own orchestration against stub docker/kubectl/minikube/mvn/npm binaries.
+
+No cluster, daemon or build tool is needed: every tool is replaced by a tiny stub (this file run with
+`--stub <tool>`) that sleeps for a configurable latency, fakes just enough output/state for deploy.py to
+make progress, and can be told to fail. Scenarios run against a scratch copy of the repo, so the
+working tree and its .cache are never touched.
+
+Usage:
+  python deploy/minikube/bench.py [--repeat 3] [--latency-scale 0] [--latency "docker build=2"]
+      [--fail "minikube image load ruoyi-auth=0.5"] [--save-baseline b.json | --baseline b.json]
+"""
+
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import deploy
+
+STUB_TOOLS = ("docker", "kubectl", "minikube", "mvn", "node", "npm")
+
+# Seconds a stub sleeps, by the longest matching command prefix (scaled by --latency-scale).
+DEFAULT_LATENCY: Dict[str, float] = {
+    "mvn": 3.0,
+    "npm install": 0.5,
+    "npm run": 2.0,
+    "docker build": 0.6,
+    "docker pull": 1.0,
+    "minikube image load": 0.8,
+    "minikube image build": 1.0,
+    "minikube image ls": 0.3,
+    "kubectl apply": 0.15,
+    "kubectl exec": 0.3,
+    "kubectl get": 0.05,
+    "kubectl rollout": 0.1,
+    "kubectl watch": 0.5,  # until the watched objects report ready
+    "pod start": 15.0,  # container start to Ready, as reported in the pod status (not slept)
+}
+
+# Metrics compared against a baseline; all of them are "lower is better".
+# bytes_synced counts linked and reflinked files too: deploy.py hard-links where it can, so real copies
+# are rare and would be zero in every scenario.
+COMPARED_METRICS = ("wall_sec", "commands", "bytes_synced")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """One deploy.py run: `touch` gets a line appended first, so its content hash changes."""
+
+    name: str
+    args: Tuple[str, ...] = ()
+    touch: Optional[str] = None
+
+
+# Run in order against the same scratch tree and stub state: the first one is a cold deploy.
+SCENARIOS: Tuple[Scenario, ...] = (
+    Scenario("full"),
+    Scenario("noop"),
+    Scenario("java-change", touch="ruoyi-auth/src/main/java/com/ruoyi/auth/RuoYiAuthApplication.java"),
+    Scenario("java-change-services", ("--services", "auth"), "ruoyi-auth/src/main/java/com/ruoyi/auth/RuoYiAuthApplication.java"),
+    Scenario("ui-change-services", ("--services", "nginx"), "ruoyi-ui/src/App.vue"),
+)
+
+# Never copied into the scratch tree: build outputs and caches would make the "full" run warm.
+SCRATCH_IGNORE = (".git", "node_modules", "target", "dist", ".cache", "__pycache__", ".idea", ".vscode")
+
+
+# ---------------------------------------------------------------- stubs (run in the tool's process)
+
+
+class _StubState:
+    """Images, ConfigMaps, Deployments and databases the stubs share, in one json file guarded by a mkdir lock."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.lock = path.with_suffix(".lock")
+
+    def __enter__(self) -> dict:
+        while True:
+            try:
+                self.lock.mkdir()
+                break
+            except FileExistsError:
+                time.sleep(0.002)
+        self.data = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {}
+        for key in ("host", "node", "configmaps", "databases", "deployments"):
+            self.data.setdefault(key, {})
+        return self.data
+
+    def __exit__(self, *exc) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self.lock.rmdir()
+
+
+def _stub_id(*parts: str) -> str:
+    return "sha256:" + hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _stub_pod_ip(app: str) -> str:
+    """The pod IP of a stub Deployment, as listed by kubectl and registered in the Nacos stub."""
+    return f"10.244.0.{int(_stub_id(app)[7:15], 16) % 250 + 2}"
+
+
+def _stub_latency(cfg: dict, cmdline: str) -> float:
+    keys = [k for k in cfg["latency"] if cmdline == k or cmdline.startswith(k + " ")]
+    return cfg["latency"][max(keys, key=len)] * cfg["latency_scale"] if keys else 0.0
+
+
+def _stub_failure(cfg: dict, cmdline: str) -> Optional[int]:
+    for rule in cfg["fail"]:
+        if rule["match"] in cmdline and random.random() < rule["rate"]:
+            return rule["code"]
+    return None
+
+
+def _stub_tree_hash(root: Path) -> str:
+    h = hashlib.sha256()
+    for p in sorted(root.rglob("*")):
+        if p.is_file() and not deploy.HASH_EXCLUDE_DIRS.intersection(p.relative_to(root).parts):
+            h.update(p.relative_to(root).as_posix().encode() + b"\0" + p.read_bytes())
+    return h.hexdigest()
+
+
+def _stub_mvn(cfg: dict, args: List[str]) -> int:
+    repo = Path(cfg["repo"])
+    apps = {a.module: a for a in deploy.APP_IMAGES if a.module}
+    modules = args[args.index("-pl") + 1].split(",") if "-pl" in args else list(apps)
+    for module in modules:
+        app = apps[module]
+        jar = repo / app.jar
+        jar.parent.mkdir(parents=True, exist_ok=True)
+        # same sources -> same bytes, like a reproducible build
+        digest = _stub_tree_hash(repo / module).encode()
+        with zipfile.ZipFile(jar, "w") as zf:
+            zf.writestr(
+                "META-INF/MANIFEST.MF",
+                "Main-Class: org.springframework.boot.loader.JarLauncher\nStart-Class: com.ruoyi.Application\n",
+            )
+            zf.writestr("org/springframework/boot/loader/JarLauncher.class", b"\xca\xfe\xba\xbe" * 64)
+            for lib in ("spring-core-5.3.jar", "spring-cloud-starter-2021.jar", "nacos-client-2.2.jar"):
+                zf.writestr(f"BOOT-INF/lib/{lib}", lib.encode() * 20000)
+            zf.writestr("BOOT-INF/lib/ruoyi-common-core-3.6.jar", digest * 100)
+            zf.writestr("BOOT-INF/classes/com/ruoyi/Application.class", digest * 50)
+    return 0
+
+
+def _stub_npm(cfg: dict, args: List[str]) -> int:
+    if "run" not in args:
+        return 0
+    ui = Path(cfg["repo"]) / "ruoyi-ui"
+    dist = ui / "dist"
+    shutil.rmtree(dist, ignore_errors=True)
+    (dist / "static" / "js").mkdir(parents=True)
+    digest = _stub_tree_hash(ui / "src")
+    (dist / "index.html").write_text(f'<script src="static/js/app.{digest[:8]}.js"></script>', encoding="utf-8")
+    (dist / "static" / "js" / f"app.{digest[:8]}.js").write_text(digest * 4000, encoding="utf-8")
+    (dist / "static" / "js" / "chunk-libs.js").write_text("vendor" * 100000, encoding="utf-8")
+    return 0
+
+
+def _stub_docker(cfg: dict, args: List[str]) -> int:
+    store = "node" if os.environ.get("DOCKER_HOST") else "host"
+    if args[0] == "build":
+        context = sys.stdin.buffer.read() if args[-1] == "-" else args[-1].encode()
+        with _StubState(Path(cfg["state"])) as st:
+            st[store][args[args.index("-t") + 1]] = _stub_id(context.hex())
+        return 0
+    with _StubState(Path(cfg["state"])) as st:
+        images = st[store]
+        if args[0] == "pull":
+            name = args[1].split("@")[0]
+            images[name] = _stub_id(name)
+        elif args[0] == "tag":
+            if args[1] not in images:
+                return 1
+            images[args[2]] = images[args[1]]
+        elif args[:2] == ["image", "ls"]:
+            for tag, image_id in images.items():
+                print(tag, image_id)
+        elif args[:2] == ["image", "inspect"]:
+            fmt = args[args.index("--format") + 1] if "--format" in args else "{{.Id}}"
+            wanted = [a for a in args[2:] if not a.startswith("-") and a != fmt]
+            for tag in wanted:
+                if tag in images:
+                    repo = tag.rsplit(":", 1)[0]
+                    print(f"{images[tag]}|{tag}|{repo}@{images[tag]}" if "|" in fmt else images[tag])
+            return 0 if all(t in images for t in wanted) else 1
+    return 0
+
+
+def _stub_minikube(cfg: dict, args: List[str]) -> int:
+    if args[0] == "docker-env":
+        print("DOCKER_TLS_VERIFY=1\nDOCKER_HOST=tcp://127.0.0.1:2376\nMINIKUBE_ACTIVE_DOCKERD=minikube")
+    elif args[0] == "service":
+        print("http://127.0.0.1:30080")
+    elif args[:2] == ["image", "ls"]:
+        with _StubState(Path(cfg["state"])) as st:
+            print(json.dumps([{"id": i, "repoTags": [f"docker.io/library/{t}"]} for t, i in st["node"].items()]))
+    elif args[:2] == ["image", "load"]:
+        with _StubState(Path(cfg["state"])) as st:
+            if args[2] not in st["host"]:
+                print(f"image {args[2]} not found", file=sys.stderr)
+                return 1
+            st["node"][args[2]] = st["host"][args[2]]
+    elif args[:2] == ["image", "build"]:
+        with _StubState(Path(cfg["state"])) as st:
+            tag = args[args.index("-t") + 1]
+            st["node"][tag] = _stub_id(tag, str(time.time()))
+    return 0
+
+
+def _stub_time(t: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+
+def _stub_ready_events(cfg: dict, plural: str) -> List[dict]:
+    now = time.time()
+    started = now - cfg["latency"].get("pod start", 0.0) * cfg["latency_scale"]
+    events = []
+    revision = {deploy.DEPLOYMENT_REVISION_ANNOTATION: "1"}
+    for name in cfg["deployments"]:
+        if plural == "deployments":
+            obj = {
+                "metadata": {"name": name, "generation": 1, "annotations": revision},
+                "spec": {"replicas": 1, "selector": {"matchLabels": {"app": name}}},
+                "status": {"observedGeneration": 1, "replicas": 1, "updatedReplicas": 1, "availableReplicas": 1},
+            }
+        elif plural == "replicasets":
+            obj = {
+                "metadata": {
+                    "name": f"{name}-1",
+                    "labels": {"app": name, "pod-template-hash": "1"},
+                    "annotations": revision,
+                    "ownerReferences": [{"kind": "Deployment", "name": name}],
+                }
+            }
+        else:
+            labels = {"app": name, "pod-template-hash": "1"}
+            obj = {
+                "metadata": {"name": f"{name}-0", "labels": labels, "creationTimestamp": _stub_time(started)},
+                "status": {
+                    "phase": "Running",
+                    "conditions": [{"type": "Ready", "status": "True", "lastTransitionTime": _stub_time(now)}],
+                    "containerStatuses": [
+                        {"restartCount": 0, "state": {"running": {"startedAt": _stub_time(started)}}}
+                    ],
+                },
+            }
+        events.append({"type": "ADDED", "object": obj})
+    return events
+
+
+def _stub_kubectl(cfg: dict, args: List[str]) -> int:
+    if args[:2] == ["config", "view"]:
+        return 1  # no API server to talk to: deploy.py stays on the kubectl backend
+    if "--watch" in args:
+        time.sleep(cfg["latency"].get("kubectl watch", 0.0) * cfg["latency_scale"])
+        for event in _stub_ready_events(cfg, args[args.index("get") + 1]):
+            print(json.dumps(event, indent=2), flush=True)
+        time.sleep(3600)  # until deploy.py closes the watch
+        return 0
+    if "port-forward" in args:
+        print("Forwarding from 127.0.0.1:1 -> 8848", flush=True)
+        time.sleep(3600)
+        return 0
+    if args[-2:] == ["-f", "-"]:
+        docs = sys.stdin.read()
+        with _StubState(Path(cfg["state"])) as st:
+            for doc in docs.split("\n---\n"):
+                if doc.lstrip().startswith("{") and '"ConfigMap"' in doc:
+                    meta = json.loads(doc)["metadata"]
+                    st["configmaps"][meta["name"]] = meta.get("annotations", {}).get(deploy.CONFIG_HASH_ANNOTATION, "")
+                elif re.search(r"^kind: Deployment", doc, re.M):
+                    name = re.search(r"^metadata:\s*\n(?:\s+.*\n)*?\s+name:\s*(\S+)", doc, re.M).group(1)
+                    spec_hash = re.search(rf'{deploy.SPEC_HASH_ANNOTATION}: "(\w+)"', doc)
+                    st["deployments"][name] = spec_hash.group(1) if spec_hash else ""
+                    if f"image: {deploy.MYSQL_SEED_REPO}:" in doc:
+                        st["databases"].update(dict.fromkeys(deploy.MYSQL_IMPORTS, True))  # pod starts from seeded data
+        return 0
+    if "exec" in args and "-i" in args:
+        sys.stdin.buffer.read()  # a hot-swapped jar
+        return 0
+    if "exec" in args:
+        script = args[-1]
+        with _StubState(Path(cfg["state"])) as st:
+            for line in script.splitlines():
+                line = line.strip()
+                if line.startswith("echo '[mysql] ") and ": importing into " in line:
+                    file = line.split("] ", 1)[1].split(":", 1)[0]
+                    if file not in st["databases"]:
+                        st["databases"][file] = True
+                        print(line[6:-1])
+                    else:
+                        print(f"[mysql] {file}: up to date")
+        return 0
+    if "get" in args and "deployment" in args and "jsonpath" in " ".join(args):
+        with _StubState(Path(cfg["state"])) as st:
+            print(st["deployments"].get(args[args.index("deployment") + 1], ""))
+    elif "get" in args and "configmap" in args:
+        with _StubState(Path(cfg["state"])) as st:
+            for name, digest in st["configmaps"].items():
+                print(f"{name}={digest}")
+    elif "get" in args and "pod" in args and "json" in args:
+        app = next((a.split("=", 1)[1] for a in args if a.startswith("app=")), "pod")
+        pod = {"metadata": {"name": f"{app}-0"}, "status": {"phase": "Running", "podIP": _stub_pod_ip(app)}}
+        print(json.dumps({"items": [pod]}))
+    return 0
+
+
+STUBS = {
+    "docker": _stub_docker,
+    "kubectl": _stub_kubectl,
+    "minikube": _stub_minikube,
+    "mvn": _stub_mvn,
+    "npm": _stub_npm,
+    "node": lambda cfg, args: print("v18.20.0") or 0,
+}
+
+
+def _stub_main(tool: str, args: List[str]) -> int:
+    cfg = json.loads(Path(os.environ["RUOYI_BENCH_STUB"]).read_text(encoding="utf-8"))
+    cmdline = " ".join([tool, *args])
+    with open(cfg["log"], "a", encoding="utf-8") as log:
+        log.write(cmdline.splitlines()[0] + "\n")
+    time.sleep(_stub_latency(cfg, cmdline))
+    code = _stub_failure(cfg, cmdline)
+    if code is not None:
+        print(f"{tool}: injected failure ({cmdline[:80]})", file=sys.stderr)
+        return code
+    return STUBS[tool](cfg, args) if args else 0
+
+
+# ---------------------------------------------------------------- harness
+
+
+class _NacosStub(http.server.BaseHTTPRequestHandler):
+    """Just enough of /nacos/v1/cs/configs for the config sync; every service is registered and healthy."""
+
+    configs: Dict[Tuple[str, str, str], str] = {}
+
+    def _reply(self, status: int, body: str) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        q = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        if url.path == deploy.NACOS_NAMING_API:
+            host = {"ip": _stub_pod_ip(q.get("serviceName", "")), "healthy": True, "enabled": True}
+            self._reply(200, json.dumps({"hosts": [host]}))
+            return
+        content = self.configs.get((q.get("dataId", ""), q.get("group", ""), q.get("tenant", "")))
+        self._reply(404, "config data not exist") if content is None else self._reply(200, content)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+        q = dict(urllib.parse.parse_qsl(body, keep_blank_values=True))
+        self.configs[(q.get("dataId", ""), q.get("group", ""), q.get("tenant", ""))] = q.get("content", "")
+        self._reply(200, "true")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _write_stubs(bin_dir: Path) -> Dict[str, str]:
+    """One launcher per tool that re-enters this file as that tool's stub."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    me = Path(__file__).resolve()
+    paths = {}
+    for tool in STUB_TOOLS:
+        if os.name == "nt":
+            path = bin_dir / f"{tool}.cmd"
+            path.write_text(f'@"{sys.executable}" "{me}" --stub {tool} %*\r\n', encoding="utf-8")
+        else:
+            path = bin_dir / tool
+            path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{me}" --stub {tool} "$@"\n', encoding="utf-8")
+            path.chmod(0o755)
+        paths[tool] = str(path)
+    return paths
+
+
+def _scratch_repo(dst: Path) -> None:
+    shutil.copytree(deploy._repo_root(), dst, ignore=shutil.ignore_patterns(*SCRATCH_IGNORE), symlinks=True)
+
+
+def _parse_overrides(items: List[str], default: float) -> Dict[str, float]:
+    """`KEY=VALUE` pairs (a bare KEY takes `default`)."""
+    out = {}
+    for item in items:
+        key, _, value = item.rpartition("=") if "=" in item else (item, "", "")
+        out[key.strip()] = float(value) if value else default
+    return out
+
+
+def _summarize_trace(trace_path: Path) -> dict:
+    if not trace_path.exists():
+        return {"commands": 0, "failed_commands": 0, "bytes_synced": 0, "bytes_copied": 0, "tasks_avg": 0.0, "tasks_peak": 0}
+    trace = json.loads(trace_path.read_text(encoding="utf-8"))
+    summary = trace["otherData"]
+    sync = [e for e in trace["traceEvents"] if e["cat"] == "sync"]
+    return {
+        "commands": summary["commands"],
+        "failed_commands": summary["failed_commands"],
+        "bytes_synced": sum(int(e["args"].get("bytes_synced", 0)) for e in sync),
+        "bytes_copied": sum(int(e["args"].get("bytes_copied", 0)) for e in sync),
+        "tasks_avg": summary["parallelism"]["tasks_avg"],
+        "tasks_peak": summary["parallelism"]["tasks_peak"],
+    }
+
+
+def _run_scenarios(args: argparse.Namespace, round_no: int) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="ruoyi-bench-") as tmp:
+        work = Path(tempfile.mkdtemp(prefix="ruoyi-bench-")) if args.keep else Path(tmp)
+        repo = work / "repo"
+        _scratch_repo(repo)
+        tools = _write_stubs(work / "bin")
+        cfg = {
+            "repo": str(repo),
+            "state": str(work / "state.json"),
+            "log": str(work / "tools.log"),
+            "deployments": [s.deployment for s in deploy.SERVICES],
+            "latency": {**DEFAULT_LATENCY, **_parse_overrides(args.latency, 0.0)},
+            "latency_scale": args.latency_scale,
+            "fail": [
+                {"match": k, "rate": v, "code": 1} for k, v in _parse_overrides(args.fail, 1.0).items()
+            ],
+        }
+        (work / "stub.json").write_text(json.dumps(cfg), encoding="utf-8")
+        _NacosStub.configs = {}
+        nacos = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _NacosStub)
+        threading.Thread(target=nacos.serve_forever, name="nacos-stub", daemon=True).start()
+        env = {**os.environ, "RUOYI_BENCH_STUB": str(work / "stub.json")}
+        env.pop("DOCKER_HOST", None)
+        try:
+            for scenario in SCENARIOS:
+                if scenario.touch:
+                    with open(repo / scenario.touch, "a", encoding="utf-8") as f:
+                        f.write(f"\n// bench {round_no} {scenario.name}\n")
+                trace_path = work / f"trace-{scenario.name}.json"
+                cmd = [sys.executable, str(repo / "deploy" / "minikube" / "deploy.py"), "--trace-out", str(trace_path)]
+                cmd += ["--nacos-url", f"http://127.0.0.1:{nacos.server_address[1]}"]
+                for tool, path in tools.items():
+                    cmd += [f"--{tool}-bin", path]
+                cmd += [*scenario.args, *args.deploy_args]
+                log_path = work / f"deploy-{scenario.name}.log"
+                t0 = time.perf_counter()
+                with open(log_path, "w", encoding="utf-8") as log:
+                    code = subprocess.run(cmd, cwd=repo, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+                wall = time.perf_counter() - t0
+                results[scenario.name] = {"exit_code": code, "wall_sec": round(wall, 3), **_summarize_trace(trace_path)}
+                if code != 0 and args.verbose:
+                    print(log_path.read_text(encoding="utf-8")[-3000:], file=sys.stderr)
+        finally:
+            nacos.shutdown()
+            if args.keep:
+                print(f"[bench] kept {work}")
+    return results
+
+
+def _median_results(rounds: List[Dict[str, dict]]) -> Dict[str, dict]:
+    out: Dict[str, dict] = {}
+    for name in rounds[0]:
+        runs = [r[name] for r in rounds]
+        out[name] = {k: statistics.median(run[k] for run in runs) for k in runs[0] if k != "exit_code"}
+        out[name]["exit_code"] = max((run["exit_code"] for run in runs), key=abs)
+    return out
+
+
+def _print_results(results: Dict[str, dict]) -> None:
+    print(f"{'scenario':<22}{'exit':>5}{'wall':>9}{'forks':>7}{'failed':>7}{'synced':>11}{'copied':>11}{'par avg':>9}{'peak':>6}")
+    for name, r in results.items():
+        print(
+            f"{name:<22}{r['exit_code']:>5}{r['wall_sec']:>8.2f}s{r['commands']:>7g}{r['failed_commands']:>7g}"
+            f"{deploy._fmt_size(int(r['bytes_synced'])):>11}{deploy._fmt_size(int(r['bytes_copied'])):>11}{r['tasks_avg']:>9.2f}{r['tasks_peak']:>6g}"
+        )
+
+
+def _compare_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in base:
+                continue  # baseline saved before the metric existed
+            # small absolute slack so sub-second scenarios don't flap on scheduler noise
+            slack = 0.25 if metric == "wall_sec" else 0
+            if r[metric] > base[metric] * (1 + tolerance) + slack:
+                regressions.append(f"{name}.{metric}: {base[metric]:g} -> {r[metric]:g}")
+    return regressions
+
+
+def main() -> int:
+    if sys.argv[1:2] == ["--stub"]:
+        return _stub_main(sys.argv[2], sys.argv[3:])
+
+    parser = argparse.ArgumentParser(description="Benchmark deploy.py with stub tool binaries")
+    parser.add_argument("--repeat", type=int, default=1, help="Run every scenario N times and report medians")
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Multiply every stub latency (0 = measure pure orchestration overhead)",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="PREFIX=SEC",
+        help='Override a stub latency by command prefix, e.g. "docker build=2" (repeatable)',
+    )
+    parser.add_argument(
+        "--fail",
+        action="append",
+        default=[],
+        metavar="MATCH[=RATE]",
+        help='Make stub commands containing MATCH exit 1 with probability RATE (default 1), e.g. "minikube image load=0.3"',
+    )
+    parser.add_argument(
+        "--deploy-args",
+        nargs=argparse.REMAINDER,
+        default=[],
+        help="Extra deploy.py arguments for every scenario (must come last), e.g. --deploy-args --layered-images",
+    )
+    parser.add_argument("--json", default=None, help="Write the results to this json file")
+    parser.add_argument("--save-baseline", default=None, help="Write the results as a baseline json")
+    parser.add_argument("--baseline", default=None, help="Compare against a baseline json; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression vs the baseline (default: 10%%)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch repo, stub state and logs")
+    parser.add_argument("--verbose", action="store_true", help="Print the deploy.py output tail of failed scenarios")
+    args = parser.parse_args()
+
+    rounds = []
+    for i in range(args.repeat):
+        print(f"[bench] round {i + 1}/{args.repeat}", flush=True)
+        rounds.append(_run_scenarios(args, i))
+    results = _median_results(rounds)
+    _print_results(results)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = _compare_baseline(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"[bench] regression {line}")
+        if regressions:
+            return 1
+        print(f"[bench] no regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0 if all(r["exit_code"] == 0 for r in results.values()) or args.fail else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,14 +1,33 @@
 import argparse
+import base64
 import concurrent.futures
+import contextlib
+import datetime
+import fnmatch
+import hashlib
+import io
+import http.client
+import json
+import math
 import os
+import queue
+import random
+import re
 import shutil
+import socket
+import ssl
+import struct
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import time
+import urllib.parse
+import zipfile
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -17,11 +36,439 @@ class CmdResult:
     returncode: int
 
 
+@dataclass(frozen=True)
+class AppImage:
+    """One locally built image and the sources it is produced from.
+
+    - docker_subdir: build context under ./docker
+    - module: maven module path (for `mvn -pl`), None for the ui image
+    - jar: fat jar produced by the module, relative to the repo root
+    - sources: extra repo paths whose content feeds the image
+    """
+
+    image: str
+    docker_subdir: str
+    module: Optional[str] = None
+    jar: Optional[str] = None
+    sources: Tuple[str, ...] = ()
+
+
+APP_IMAGES: Tuple[AppImage, ...] = (
+    AppImage("ruoyi-gateway:jre17-1", "ruoyi/gateway", "ruoyi-gateway", "ruoyi-gateway/target/ruoyi-gateway.jar"),
+    AppImage("ruoyi-auth:jre17-1", "ruoyi/auth", "ruoyi-auth", "ruoyi-auth/target/ruoyi-auth.jar"),
+    AppImage(
+        "ruoyi-modules-system:jre17-1",
+        "ruoyi/modules/system",
+        "ruoyi-modules/ruoyi-system",
+        "ruoyi-modules/ruoyi-system/target/ruoyi-modules-system.jar",
+    ),
+    AppImage(
+        "ruoyi-modules-gen:jre17-1",
+        "ruoyi/modules/gen",
+        "ruoyi-modules/ruoyi-gen",
+        "ruoyi-modules/ruoyi-gen/target/ruoyi-modules-gen.jar",
+    ),
+    AppImage(
+        "ruoyi-modules-job:jre17-1",
+        "ruoyi/modules/job",
+        "ruoyi-modules/ruoyi-job",
+        "ruoyi-modules/ruoyi-job/target/ruoyi-modules-job.jar",
+    ),
+    AppImage(
+        "ruoyi-modules-file:jre17-1",
+        "ruoyi/modules/file",
+        "ruoyi-modules/ruoyi-file",
+        "ruoyi-modules/ruoyi-file/target/ruoyi-modules-file.jar",
+    ),
+    AppImage(
+        "ruoyi-visual-monitor:jre17-1",
+        "ruoyi/visual/monitor",
+        "ruoyi-visual/ruoyi-monitor",
+        "ruoyi-visual/ruoyi-monitor/target/ruoyi-visual-monitor.jar",
+    ),
+    AppImage("ruoyi-ui:latest", "nginx", sources=("ruoyi-ui",)),
+)
+
+@dataclass(frozen=True)
+class Service:
+    """A Deployment in k8s/all.yaml, the locally built image it runs and what it needs upstream."""
+
+    name: str
+    deployment: str
+    image: Optional[str] = None
+    depends_on: Tuple[str, ...] = ()
+
+
+# Service graph: --services targets are expanded with their upstream deps, which are only waited on.
+SERVICES: Tuple[Service, ...] = (
+    Service("mysql", "ruoyi-mysql"),
+    Service("redis", "ruoyi-redis"),
+    Service("nacos", "ruoyi-nacos", depends_on=("mysql",)),
+    Service("gateway", "ruoyi-gateway", "ruoyi-gateway:jre17-1", ("nacos", "redis")),
+    Service("auth", "ruoyi-auth", "ruoyi-auth:jre17-1", ("nacos", "redis")),
+    Service("system", "ruoyi-system", "ruoyi-modules-system:jre17-1", ("nacos", "redis", "mysql")),
+    Service("gen", "ruoyi-gen", "ruoyi-modules-gen:jre17-1", ("nacos", "mysql")),
+    Service("job", "ruoyi-job", "ruoyi-modules-job:jre17-1", ("nacos", "mysql")),
+    Service("file", "ruoyi-file", "ruoyi-modules-file:jre17-1", ("nacos",)),
+    Service("monitor", "ruoyi-monitor", "ruoyi-visual-monitor:jre17-1", ("nacos",)),
+    Service("nginx", "ruoyi-nginx", "ruoyi-ui:latest", ("gateway",)),
+)
+
+# Every java service is built against these, so they are part of each service's content hash.
+JAVA_SHARED_SOURCES: Tuple[str, ...] = ("pom.xml", "ruoyi-common", "ruoyi-api")
+
+# Build outputs and tool caches never count as sources.
+HASH_EXCLUDE_DIRS = {"target", "node_modules", "dist", "jar", ".git", "__pycache__", ".idea", ".vscode"}
+# Regenerated by `npm install` itself; hashing them would invalidate the ui on every run.
+HASH_EXCLUDE_FILES = {"package-lock.json", "yarn.lock", ".DS_Store"}
+
 TOOL_BIN: dict = {}
 
+# Where app images are built:
+# - host: host docker daemon, then `minikube image load` (works with every driver/runtime)
+# - minikube-docker: host docker cli pointed at the node's daemon via `minikube docker-env` (docker runtime only)
+# - minikube-build: `minikube image build` (any runtime, the context is copied into the node)
+IMAGE_BACKENDS = ("host", "minikube-docker", "minikube-build")
+IMAGE_BACKEND = "host"
+# Environment for docker cli calls that must reach the minikube node daemon (minikube-docker backend).
+NODE_DOCKER_ENV: Optional[dict] = None
+
+# k8s/all.yaml is written for this namespace; others get it rendered (_render_namespace). Host names in the
+# manifests and the patched sql are short service names, which resolve within each namespace.
+MANIFEST_NAMESPACE = "ruoyi"
+# App images are deployed under content tags (<tag>-<image hash>, see _image_tag): a tag never changes what it
+# points to, so namespaces deployed side by side share one build and load of identical images and never
+# overwrite each other's. Off for --skip-build/--only-apply, which deploy the manifest tags as they are.
+CONTENT_TAGS = True
+# Cross-process locks for steps on state shared by concurrent runs (docker daemon, minikube node, checkout).
+HOST_LOCK_DIR = Path(tempfile.gettempdir()) / "ruoyi-deploy-locks"
+
+# config_info rows in the Nacos dump: "(id,'data_id','group','content...". Content is one sql string literal
+# whose yaml lines are separated by escaped "\n" sequences.
+SQL_CONFIG_ROW = re.compile(r"^\((\d+),'([^']*)','([^']*)','")
+SQL_YAML_KEY = re.compile(r"^( *)([^\s#:'][^:']*):")
+
+# Nacos open API (auth is disabled in docker/nacos/conf/application.properties).
+NACOS_CONFIG_API = "/nacos/v1/cs/configs"
+NACOS_NAMING_API = "/nacos/v1/ns/instance/list"
+NACOS_PORT = 8848
+
+# MySQL init: sql file -> (database it is imported into, tables proving the import completed).
+MYSQL_IMPORTS = {
+    "ry_config_20250902.sql": ("ry-config", ("config_info",)),
+    "ry_20250523.sql": ("ry-cloud", ("sys_config", "sys_job")),
+}
+# Where the sha256 of each imported (patched) sql file is kept, next to the data it describes.
+MYSQL_FINGERPRINT_TABLE = "ruoyi_deploy.sql_fingerprint"
+# --mysql-seed: the patched sql is imported once, during docker build, into a datadir baked into
+# MYSQL_SEED_REPO:<sql hash>; an init container copies it into the empty data volume of a new mysql pod.
+MYSQL_SEED = False
+MYSQL_SEED_REPO = "ruoyi-mysql-seed"
+# Not /var/lib/mysql: the mysql image declares it a VOLUME, so whatever a RUN step writes there is dropped.
+MYSQL_SEED_DATADIR = "/var/lib/mysql-seed"
+
+# ConfigMaps carry the hash of their data; Deployments mounting one of ROLLING_CONFIGMAPS get it stamped into
+# their pod template, so a config change rolls exactly the workloads that consume it (and nothing else).
+# ruoyi-mysql-init is not one of them: rolling mysql would drop its emptyDir data, and changed sql files are
+# imported in place by the fingerprint check (_mysql_init_script).
+CONFIG_HASH_ANNOTATION = "ruoyi.io/content-hash"
+CONFIG_CHECKSUM_PREFIX = "ruoyi.io/config-"
+ROLLING_CONFIGMAPS = {"ruoyi-nacos-conf"}
+
+# --kube-backend api: kind -> (api prefix, plural, namespaced) for the resources deploy.py touches.
+KUBE_RESOURCES = {
+    "Namespace": ("/api/v1", "namespaces", False),
+    "ConfigMap": ("/api/v1", "configmaps", True),
+    "Service": ("/api/v1", "services", True),
+    "Pod": ("/api/v1", "pods", True),
+    "Deployment": ("/apis/apps/v1", "deployments", True),
+    "ReplicaSet": ("/apis/apps/v1", "replicasets", True),
+}
+KUBE_FIELD_MANAGER = "ruoyi-deploy"
+# Silence tolerated on an API exec stream before the command is given up on (an unresponsive API server or
+# kubelet would otherwise hang the deploy). The longest silent exec, a --hot-swap JVM restart, waits 300s.
+KUBE_EXEC_TIMEOUT_SEC = 600.0
+# Set in _deploy when the API client is usable; None means every call goes through kubectl.
+KUBE: Optional["KubeClient"] = None
+
+# Readiness monitor: pods whose container waits for one of these reasons can not become ready on their own.
+FATAL_WAIT_REASONS = {"ImagePullBackOff", "ErrImageNeverPull", "InvalidImageName", "CreateContainerConfigError"}
+# CrashLoopBackOff is expected for a while (e.g. services starting before nacos); give up after this many restarts.
+MAX_RESTARTS = 5
+# A watch stream that ends is resumed after a backoff (doubling from 1s); one that keeps ending within
+# WATCH_QUICK_EXIT_SEC of its start (bad credentials, RBAC, a crashing kubectl) fails the wait instead.
+WATCH_RESTART_BACKOFF_SEC = 1.0
+WATCH_QUICK_EXIT_SEC = 5.0
+WATCH_MAX_QUICK_EXITS = 3
+DEPLOYMENT_REVISION_ANNOTATION = "deployment.kubernetes.io/revision"
+
+# Startup waves: a wave is applied once the previous one is healthy (ready and, for java services, registered
+# in nacos), so nothing crash-loops against a database or registry that is still starting. Each wave rolls out
+# in parallel; services missing here start with the last wave.
+STARTUP_WAVES: Tuple[Tuple[str, ...], ...] = (
+    ("mysql", "redis"),
+    ("nacos",),
+    ("gateway", "auth", "system"),
+    ("gen", "job", "file", "monitor", "nginx"),
+)
+NACOS_REGISTRATION_TIMEOUT_SEC = 180
+# Generated startupProbes (java services): polled every STARTUP_PROBE_PERIOD_SEC for 3x the last measured
+# start-up (.cache/startup-times.json), rounded up to whole minutes so the pod template stays stable.
+STARTUP_PROBE_PERIOD_SEC = 2
+STARTUP_PROBE_MIN_SEC = 60
+STARTUP_PROBE_DEFAULT_SEC = 300
+
+# Base images of the dockerfiles and of the infra Deployments (mysql/redis/nacos run them directly).
+BASE_IMAGES = [
+    "eclipse-temurin:17-jre",
+    "nginx:latest",
+    "redis:7",
+    "mysql:5.7",
+    "nacos/nacos-server:latest",
+]
+# Concurrent `docker pull`s: registries and home links saturate quickly, so keep this small (--pull-jobs).
+BASE_PULL_JOBS = 3
+
+# --layered-images: java images are built from exploded fat jars on top of a shared base image
+# (JAVA_BASE_REPO:<hash>) holding the spring boot loader and the third-party jars all services have in common.
+LAYERED_IMAGES = False
+JAVA_RUNTIME_IMAGE = "eclipse-temurin:17-jre"
+JAVA_BASE_REPO = "ruoyi-java-base"
+# Per-service layers, from least to most frequently changing.
+JAR_LAYERS = ("dependencies", "snapshot-dependencies", "ruoyi-libs", "application")
+# --appcds: java images run the exploded jar from a plain classpath with a class data sharing archive
+# recorded by a training start during docker build. Flags favour start-up over peak throughput (dev cluster).
+APPCDS = False
+APPCDS_JVM_FLAGS = ("-XX:TieredStopAtLevel=1", "-Dspring.jmx.enabled=false")
+# The training start has no nacos/mysql: it runs until the service gives up, or is stopped after this long.
+APPCDS_TRAINING_SEC = 120
+
+# Pipeline resource classes: task name prefix -> class. Heavy classes get their own concurrency limit,
+# sized from the host and the planned work (see _size_pools); everything else (kubectl, waits, copies) is "light".
+TASK_CLASSES = {
+    "build:": "build",
+    "java-base": "build",
+    "layers:": "build",
+    "cds:": "build",
+    "seed:": "build",
+    "load:": "load",
+    "preload:": "load",
+    "mvn": "compile",
+    "npm": "compile",
+}
+# Expected seconds per class until a task has been timed once (.cache/task-times.json).
+DEFAULT_TASK_COST = {"build": 30.0, "load": 20.0, "compile": 120.0, "light": 2.0}
+# Rough peak memory of one docker build / image load, used to cap concurrency on small machines.
+TASK_MEMORY_GB = {"build": 1.5, "load": 0.75}
+# mvn -T threads; 0 = let maven build single-threaded. Set from --mvn-threads / host size in _deploy.
+MVN_THREADS = 0
+
+# --hot-swap: java services run under a small shell supervisor so a new jar can be streamed into the
+# running container and only the JVM restarted. The copied jar survives JVM restarts inside the supervisor
+# loop, not a container restart: a new container starts from the jar in its image again.
+HOT_SWAP = False
+HOT_SWAP_DIR = "/home/ruoyi"
+HOT_SWAP_PID_FILE = "/tmp/ruoyi-java.pid"
+HOT_SWAP_MARKER = "/tmp/ruoyi-hotswap"
+# Hash of the rendered Deployment manifest, on the Deployment itself (not the pod template: no rollout).
+SPEC_HASH_ANNOTATION = "ruoyi.io/spec-hash"
+
+# --watch: how often sources are rescanned, and how long they must stay unchanged before a redeploy starts.
+WATCH_POLL_SEC = 1.0
+WATCH_DEBOUNCE_SEC = 1.5
+
+# --bench: closed-loop HTTP load test through nginx once the stack is up (workload: bench-workload.json).
+# The gateway sits behind nginx's /prod-api/; login needs the math captcha, read back from redis.
+BENCH_API_PREFIX = "/prod-api"
+CAPTCHA_CODE_KEY = "captcha_codes:"
+BENCH_LOGIN_ROUTE = "auth/login"
+# Latency regressions below this many milliseconds are ignored (scheduler/network noise on a dev cluster).
+BENCH_SLACK_MS = 2.0
+# Warn when fewer requests than this share of `concurrency` were in flight on average (see _http_bench).
+BENCH_MIN_CONCURRENCY_SHARE = 0.9
+
+# --tune-resources: cgroup counters of every target pod are read after the rollout (covering start-up) and
+# after the --bench (or an idle) window; the tuned requests/limits/heap go to .cache/resource-profile.json,
+# which --resource-profile applies on a later deploy. Values are rounded so reruns do not churn pod templates.
+RESOURCE_PROFILE: Dict[str, dict] = {}
+RESOURCE_IDLE_WINDOW_SEC = 30
+# Start-up is counted as throttled when more than this share of its CFS periods hit the cpu limit;
+# the limit is then doubled (up to RESOURCE_MAX_CPU_M) for the next deploy.
+RESOURCE_THROTTLE_RATIO = 0.2
+RESOURCE_MAX_CPU_M = 4000
+RESOURCE_MIN_CPU_M = 10
+RESOURCE_MIN_MEMORY_MI = 64
+# Java services: memory limit = working set x 1.6 (at least JAVA_MIN_LIMIT_MI), heap (-Xmx) = 35% of it, so
+# heap plus the non-heap part of the observed working set stays under the limit.
+JAVA_LIMIT_HEADROOM = 1.6
+JAVA_MIN_LIMIT_MI = 384
+JAVA_HEAP_SHARE = 0.35
+# Prints cgroup v2 (or v1) cpu and memory counters as "key value" lines.
+CGROUP_STATS_SCRIPT = """c=/sys/fs/cgroup
+if [ -f $c/cgroup.controllers ]; then
+  cat $c/cpu.stat
+  echo memory_current $(cat $c/memory.current)
+  echo memory_peak $(cat $c/memory.peak 2>/dev/null)
+  grep '^inactive_file ' $c/memory.stat
+else
+  echo cpuacct_usage $(cat $c/cpuacct/cpuacct.usage)
+  cat $c/cpu/cpu.stat
+  echo memory_usage $(cat $c/memory/memory.usage_in_bytes)
+  echo memory_max_usage $(cat $c/memory/memory.max_usage_in_bytes)
+  grep '^total_inactive_file ' $c/memory/memory.stat
+fi
+"""
+
+
+@dataclass
+class Task:
+    """A node of the deploy pipeline graph; timings are filled in by _run_pipeline."""
+
+    name: str
+    fn: Callable[[], object]
+    deps: Tuple[str, ...] = ()
+    started: float = 0.0
+    finished: float = 0.0
+
+    @property
+    def duration(self) -> float:
+        return max(0.0, self.finished - self.started)
+
+
+class Tracer:
+    """Collects timed spans for every command, pipeline task and phase of a run.
+
+    The result is written as a Chrome trace (open in chrome://tracing or ui.perfetto.dev);
+    `otherData` carries a summary with per-command totals, exit codes and achieved parallelism.
+    """
+
+    def __init__(self) -> None:
+        self.t0 = time.time()
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._tids: Dict[int, int] = {}
+
+    def _tid(self) -> int:
+        ident = threading.get_ident()
+        with self._lock:
+            return self._tids.setdefault(ident, len(self._tids) + 1)
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "phase", **args: object):
+        """Time the enclosed block; the yielded dict can be filled with extra args (e.g. exit_code)."""
+        tid = self._tid()
+        start = time.time()
+        try:
+            yield args
+        except BaseException as e:
+            args.setdefault("error", str(e).splitlines()[0] if str(e) else type(e).__name__)
+            raise
+        finally:
+            self.add(name, cat, start, time.time(), tid=tid, **args)
+
+    def add(self, name: str, cat: str, start: float, end: float, tid: Optional[int] = None, **args: object) -> None:
+        """Record an already measured span (e.g. one readiness wait among many observed concurrently)."""
+        event = {"name": name, "cat": cat, "start": start, "end": end, "tid": tid or self._tid(), "args": args}
+        with self._lock:
+            self._events.append(event)
+
+    def events(self, cat: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            return [e for e in self._events if cat is None or e["cat"] == cat]
+
+    @staticmethod
+    def _concurrency(events: List[dict]) -> Tuple[float, int]:
+        """(busy seconds, peak number of overlapping events)."""
+        edges = sorted([(e["start"], 1) for e in events] + [(e["end"], -1) for e in events])
+        peak = cur = 0
+        for _, d in edges:
+            cur += d
+            peak = max(peak, cur)
+        return sum(e["end"] - e["start"] for e in events), peak
+
+    def summary(self) -> dict:
+        wall = time.time() - self.t0
+        cmds = self.events("cmd")
+        by_label: Dict[str, dict] = {}
+        for e in cmds:
+            agg = by_label.setdefault(e["name"], {"count": 0, "total_sec": 0.0, "failed": 0})
+            agg["count"] += 1
+            agg["total_sec"] = round(agg["total_sec"] + e["end"] - e["start"], 3)
+            if e["args"].get("exit_code", 0) != 0:
+                agg["failed"] += 1
+        task_busy, task_peak = self._concurrency(self.events("task"))
+        cmd_busy, cmd_peak = self._concurrency(cmds)
+        return {
+            "wall_sec": round(wall, 3),
+            "commands": len(cmds),
+            "api_requests": len(self.events("api")),
+            "failed_commands": sum(a["failed"] for a in by_label.values()),
+            "parallelism": {
+                "tasks_avg": round(task_busy / wall, 2) if wall else 0.0,
+                "tasks_peak": task_peak,
+                "commands_avg": round(cmd_busy / wall, 2) if wall else 0.0,
+                "commands_peak": cmd_peak,
+            },
+            "phases": {e["name"]: round(e["end"] - e["start"], 3) for e in self.events("phase")},
+            "by_command": dict(sorted(by_label.items(), key=lambda kv: -kv[1]["total_sec"])),
+        }
+
+    def write(self, path: Path) -> dict:
+        summary = self.summary()
+        trace = {
+            "traceEvents": [
+                {
+                    "name": e["name"],
+                    "cat": e["cat"],
+                    "ph": "X",
+                    "ts": int((e["start"] - self.t0) * 1e6),
+                    "dur": int((e["end"] - e["start"]) * 1e6),
+                    "pid": 1,
+                    "tid": e["tid"],
+                    "args": {k: v if isinstance(v, (int, float, str, bool)) else str(v) for k, v in e["args"].items()},
+                }
+                for e in self.events()
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": summary,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(trace, indent=1), encoding="utf-8")
+        return summary
+
+
+TRACE = Tracer()
+
+
+def _cmd_label(cmd: List[str]) -> str:
+    """Short, aggregatable name for a command, e.g. `kubectl rollout status` or `docker build`."""
+    words: List[str] = []
+    skip = False
+    for a in cmd[1:]:
+        if skip:
+            skip = False
+            continue
+        if a in ("-n", "-p", "-f", "-t", "-l", "-o", "-pl"):
+            skip = True
+            continue
+        if a.startswith("-") or Path(a).is_absolute():
+            continue
+        words.append(a)
+        if len(words) == 2:
+            break
+    return " ".join([Path(cmd[0]).stem] + words)
+
+
+def _subprocess(cmd: List[str], **kwargs: object) -> subprocess.CompletedProcess:
+    """Single entry point for every external command, so each one is traced."""
+    with TRACE.span(_cmd_label(cmd), "cmd", cmd=" ".join(cmd)) as span:
+        p = subprocess.run(cmd, **kwargs)
+        span["exit_code"] = p.returncode
+    return p
+
 
 def _run(cmd: List[str], cwd: Optional[Path] = None, env: Optional[dict] = None, check: bool = True) -> CmdResult:
-    p = subprocess.run(
+    p = _subprocess(
         cmd,
         cwd=str(cwd) if cwd else None,
         env=env,
@@ -37,7 +484,7 @@ def _run(cmd: List[str], cwd: Optional[Path] = None, env: Optional[dict] = None,
 
 
 def _run_capture(cmd: List[str], cwd: Optional[Path] = None, env: Optional[dict] = None, check: bool = True) -> str:
-    p = subprocess.run(
+    p = _subprocess(
         cmd,
         cwd=str(cwd) if cwd else None,
         env=env,
@@ -52,6 +499,34 @@ def _run_capture(cmd: List[str], cwd: Optional[Path] = None, env: Optional[dict]
     return p.stdout
 
 
+def _run_stream(cmd: List[str], write_stdin: Callable[[object], None], env: Optional[dict] = None, check: bool = True) -> CmdResult:
+    """Run cmd while write_stdin(pipe) streams its stdin (e.g. a tar build context for `docker build -`)."""
+    with TRACE.span(_cmd_label(cmd), "cmd", cmd=" ".join(cmd)) as span:
+        p = subprocess.Popen(cmd, env=env, stdin=subprocess.PIPE, stdout=sys.stdout, stderr=sys.stderr)
+        try:
+            write_stdin(p.stdin)
+        except BrokenPipeError:
+            pass  # the command exited early; its exit code tells why
+        finally:
+            try:
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = p.wait()
+        span["exit_code"] = returncode
+    if check and returncode != 0:
+        raise RuntimeError(f"Command failed ({returncode}): {' '.join(cmd)}")
+    return CmdResult(cmd=cmd, returncode=returncode)
+
+
+def _run_input(cmd: List[str], input_text: str, check: bool = True) -> CmdResult:
+    # e.g. `kubectl apply -f -` fed with generated yaml
+    p = _subprocess(cmd, input=input_text, text=True, encoding="utf-8", errors="replace")
+    if check and p.returncode != 0:
+        raise RuntimeError(f"Command failed ({p.returncode}): {' '.join(cmd)}")
+    return CmdResult(cmd=cmd, returncode=p.returncode)
+
+
 def _exe(name: str) -> str:
     return TOOL_BIN.get(name, name)
 
@@ -96,49 +571,116 @@ def _ensure_tools(args: argparse.Namespace) -> dict:
     return tools
 
 
+def _inspect_images(images: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Map tag -> (image id, repo digest or "") for those of `images` present locally, in one docker call."""
+    out = _run_capture(
+        [_exe("docker"), "image", "inspect", "--format", '{{.Id}}|{{join .RepoTags ","}}|{{join .RepoDigests ","}}', *images],
+        check=False,  # exits non-zero as soon as one of them is missing
+    )
+    found: Dict[str, Tuple[str, str]] = {}
+    for line in out.splitlines():
+        parts = line.strip().split("|")
+        if len(parts) != 3:
+            continue
+        image_id, tags, digests = parts
+        for tag in tags.split(","):
+            if tag in images:
+                repo = tag.rsplit(":", 1)[0]
+                digest = next((d for d in digests.split(",") if d.startswith(repo + "@")), "")
+                found[tag] = (image_id, digest)
+    return found
+
+
+def _base_image_pins_path() -> Path:
+    return _cache_dir() / "base-images.json"
+
+
+def _pull_base_images(missing: List[str], pins: Dict[str, dict]) -> None:
+    """Pull with bounded parallelism; docker's progress bars are captured and summarized per image.
+
+    A pinned image is pulled by digest (then tagged), so it is the same content as on the previous run.
+    """
+    print(f"[base-images] pulling {len(missing)} image(s), {BASE_PULL_JOBS} at a time: {', '.join(missing)}")
+    start = time.time()
+
+    def pull(img: str) -> Tuple[str, int, str]:
+        digest = (pins.get(img) or {}).get("digest")
+        ref = digest or img
+        p = _subprocess([_exe("docker"), "pull", ref], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace")
+        if p.returncode == 0 and digest:
+            p = _subprocess([_exe("docker"), "tag", digest, img], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        return img, p.returncode, p.stdout or ""
+
+    failed: List[Tuple[str, str]] = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BASE_PULL_JOBS, thread_name_prefix="pull") as pool:
+        for done, fut in enumerate(concurrent.futures.as_completed([pool.submit(pull, i) for i in missing]), 1):
+            img, code, output = fut.result()
+            status = "ok" if code == 0 else f"FAILED ({code})"
+            print(f"[base-images] {done}/{len(missing)} {img}: {status} at {time.time() - start:.1f}s")
+            if code != 0:
+                failed.append((img, "\n".join(output.strip().splitlines()[-5:])))
+    if failed:
+        img, tail = failed[0]
+        raise RuntimeError(
+            "Failed to pull required base image: "
+            + ", ".join(i for i, _ in failed)
+            + "\n\n"
+            + "This is usually caused by Docker registry mirror/网络限制 (e.g. mirror returns 403).\n"
+            + "Fix options:\n"
+            + "1) Disable/replace Docker registry mirrors in Docker Desktop settings\n"
+            + "2) Configure a working mirror\n"
+            + f"3) Manually `docker pull {img}` until success\n\n"
+            + f"Original error: {tail}"
+        )
+
+
 def _ensure_base_images() -> None:
     """Ensure base images exist locally.
 
     If your Docker is configured with an unreachable registry mirror (e.g. returning 403),
     pulling will fail. In that case we raise a clear error so the user can fix Docker registry mirrors.
+    Present images are never pulled again; their id/digest is pinned in .cache/base-images.json.
     """
-    base_images = [
-        "eclipse-temurin:17-jre",
-        "nginx:latest",
-        "redis:7",
-        "mysql:5.7",
-        "nacos/nacos-server:latest",
-    ]
-
-    def image_exists(img: str) -> bool:
-        p = subprocess.run([_exe("docker"), "image", "inspect", img], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return p.returncode == 0
+    path = _base_image_pins_path()
+    try:
+        pins: Dict[str, dict] = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pins = {}
+    # concurrent deploys share the daemon: one pulls, the others find the images present afterwards
+    with _host_lock("base-images"):
+        local = _inspect_images(BASE_IMAGES)
+        missing = [i for i in BASE_IMAGES if i not in local]
+        if missing:
+            _pull_base_images(missing, pins)
+            local.update(_inspect_images(missing))
+    fresh = {img: {"id": image_id, "digest": digest or (pins.get(img) or {}).get("digest", "")} for img, (image_id, digest) in local.items()}
+    if fresh != {k: pins.get(k) for k in fresh}:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(dict(pins, **fresh), indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
 
-    missing = [i for i in base_images if not image_exists(i)]
-    if not missing:
-        return
 
-    # Try pull sequentially for clearer error output.
-    for img in missing:
-        try:
-            _run([_exe("docker"), "pull", img], check=True)
-        except Exception as e:
-            raise RuntimeError(
-                "Failed to pull required base image: "
-                + img
-                + "\n\n"
-                + "This is usually caused by Docker registry mirror/网络限制 (e.g. mirror returns 403).\n"
-                + "Fix options:\n"
-                + "1) Disable/replace Docker registry mirrors in Docker Desktop settings\n"
-                + "2) Configure a working mirror\n"
-                + "3) Manually `docker pull {img}` until success\n\n"
-                + f"Original error: {e}"
-            )
+def _node_base_images(deployments: Iterable[str]) -> List[str]:
+    """Images run directly by the given Deployments that are not ours (mysql/redis/nacos)."""
+    names = set(deployments)
+    ours = {a.image for a in APP_IMAGES}
+    images = set()
+    for kind, name, text in _manifest_docs():
+        if kind == "Deployment" and name in names:
+            images.update(i for i in re.findall(r"^\s+image:\s*(\S+)", text, re.M) if i not in ours)
+    return sorted(images)
 
 
-def _build_backend_jars() -> None:
-    # Build all modules; jars are required by docker/*/dockerfile via _copy_assets.
-    _run([_exe("mvn"), "-DskipTests", "package"], cwd=_repo_root(), check=True)
+def _build_backend_jars(modules: Optional[List[str]] = None) -> None:
+    # Build all modules (or only the given ones plus what they depend on);
+    # jars are required by docker/*/dockerfile via _copy_assets.
+    cmd = [_exe("mvn"), "-DskipTests", "package"]
+    if MVN_THREADS > 0:
+        cmd += ["-T", str(MVN_THREADS)]
+    if modules:
+        cmd += ["-pl", ",".join(modules), "-am"]
+    _run(cmd, cwd=_repo_root(), check=True)
 
 
 def _build_frontend_dist() -> None:
@@ -164,547 +706,3728 @@ def _k8s_yaml() -> Path:
     return Path(__file__).resolve().parent / "k8s" / "all.yaml"
 
 
-def _copy_assets() -> None:
-    # docker/copy.sh is linux shell; on windows we implement the same copy in python
+def _cache_dir() -> Path:
+    return Path(__file__).resolve().parent / ".cache"
+
+
+@contextlib.contextmanager
+def _host_lock(name: str) -> Iterator[None]:
+    """Exclusive lock shared by every deploy.py run on this host; released by the OS if the holder dies.
+
+    Steps on shared state run once: the other runs wait, then find the work done (callers re-check).
+    """
+    HOST_LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    path = HOST_LOCK_DIR / (re.sub(r"[^\w.-]", "_", name) + ".lock")
+    start = time.time()
+    with open(path, "a+b") as f:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # gives up after ~10s of retries
+                    break
+                except OSError:
+                    pass
+        waited = time.time() - start
+        if waited > 1:
+            print(f"[lock] waited {waited:.0f}s for {name} (held by a concurrent deploy)")
+            TRACE.add(f"lock {name}", "lock", start, time.time())
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _checkout_lock(step: str) -> "contextlib.AbstractContextManager[None]":
+    """_host_lock of a step on this checkout's build dirs (target/, dist, docker/), e.g. two namespaces of one tree."""
+    return _host_lock(f"{step}-{hashlib.sha256(str(_repo_root()).encode('utf-8')).hexdigest()[:12]}")
+
+
+_HASH_MEMO: Dict[str, str] = {}
+_HASH_MEMO_LOCK = threading.Lock()
+
+
+def _hash_path(path: Path) -> str:
+    """Content hash of a file or directory tree (relative names + bytes), memoized per run."""
+    key = str(path)
+    with _HASH_MEMO_LOCK:
+        if key in _HASH_MEMO:
+            return _HASH_MEMO[key]
+
+    h = hashlib.sha256()
+    if path.is_file():
+        files = [path]
+        base = path.parent
+    elif path.is_dir():
+        files = []
+        base = path
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in HASH_EXCLUDE_DIRS)
+            files.extend(Path(root) / n for n in sorted(names) if n not in HASH_EXCLUDE_FILES)
+    else:
+        files = []
+        base = path
+        h.update(b"<missing>")
+
+    for f in files:
+        h.update(f.relative_to(base).as_posix().encode("utf-8"))
+        h.update(b"\0")
+        with f.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                h.update(chunk)
+        h.update(b"\0")
+
+    digest = h.hexdigest()
+    with _HASH_MEMO_LOCK:
+        _HASH_MEMO[key] = digest
+    return digest
+
+
+def _source_paths(app: AppImage) -> List[Path]:
+    """Repo paths whose content determines the jar/dist feeding an image."""
     repo = _repo_root()
-    dkr = _docker_dir()
+    paths: List[str] = list(app.sources)
+    if app.module:
+        paths.append(app.module)
+        parent_pom = Path(app.module).parent / "pom.xml"
+        if str(parent_pom.parent) != ".":
+            paths.append(parent_pom.as_posix())
+        paths.extend(JAVA_SHARED_SOURCES)
+    return [repo / p for p in sorted(set(paths))]
 
-    sql_src1 = repo / "sql" / "ry_20250523.sql"
-    sql_src2 = repo / "sql" / "ry_config_20250902.sql"
-    mysql_db = dkr / "mysql" / "db"
-    mysql_db.mkdir(parents=True, exist_ok=True)
 
-    if sql_src1.exists():
-        (mysql_db / sql_src1.name).write_bytes(sql_src1.read_bytes())
-    if sql_src2.exists():
-        (mysql_db / sql_src2.name).write_bytes(sql_src2.read_bytes())
+def _source_hash(app: AppImage) -> str:
+    h = hashlib.sha256()
+    for p in _source_paths(app):
+        h.update(f"{p.relative_to(_repo_root()).as_posix()}={_hash_path(p)}\n".encode("utf-8"))
+    return h.hexdigest()
 
-    # ui dist
-    ui_dist = repo / "ruoyi-ui" / "dist"
-    nginx_dist = dkr / "nginx" / "html" / "dist"
-    if ui_dist.exists():
-        if nginx_dist.exists():
-            # keep existing, but ensure directory exists
-            pass
-        nginx_dist.mkdir(parents=True, exist_ok=True)
-        # copy tree
-        for root, dirs, files in os.walk(ui_dist):
-            rel = Path(root).relative_to(ui_dist)
-            (nginx_dist / rel).mkdir(parents=True, exist_ok=True)
-            for f in files:
-                src = Path(root) / f
-                dst = nginx_dist / rel / f
-                dst.write_bytes(src.read_bytes())
 
-    # jars
-    jar_map = {
-        "ruoyi-gateway": (repo / "ruoyi-gateway" / "target" / "ruoyi-gateway.jar", dkr / "ruoyi" / "gateway" / "jar"),
-        "ruoyi-auth": (repo / "ruoyi-auth" / "target" / "ruoyi-auth.jar", dkr / "ruoyi" / "auth" / "jar"),
-        "ruoyi-visual-monitor": (
-            repo / "ruoyi-visual" / "ruoyi-monitor" / "target" / "ruoyi-visual-monitor.jar",
-            dkr / "ruoyi" / "visual" / "monitor" / "jar",
-        ),
-        "ruoyi-modules-system": (
-            repo / "ruoyi-modules" / "ruoyi-system" / "target" / "ruoyi-modules-system.jar",
-            dkr / "ruoyi" / "modules" / "system" / "jar",
-        ),
-        "ruoyi-modules-file": (
-            repo / "ruoyi-modules" / "ruoyi-file" / "target" / "ruoyi-modules-file.jar",
-            dkr / "ruoyi" / "modules" / "file" / "jar",
-        ),
-        "ruoyi-modules-job": (
-            repo / "ruoyi-modules" / "ruoyi-job" / "target" / "ruoyi-modules-job.jar",
-            dkr / "ruoyi" / "modules" / "job" / "jar",
-        ),
-        "ruoyi-modules-gen": (
-            repo / "ruoyi-modules" / "ruoyi-gen" / "target" / "ruoyi-modules-gen.jar",
-            dkr / "ruoyi" / "modules" / "gen" / "jar",
-        ),
-    }
+def _image_tag(app: AppImage) -> str:
+    """Tag an app image is built, loaded and deployed as (app.image stays its build-cache key)."""
+    return f"{app.image}-{_image_hash(app)[:12]}" if CONTENT_TAGS else app.image
 
-    missing = []
-    for name, (src, dst_dir) in jar_map.items():
-        if not src.exists():
-            missing.append(str(src))
-            continue
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        (dst_dir / src.name).write_bytes(src.read_bytes())
 
-    if missing:
-        raise RuntimeError(
-            "Missing jar build outputs. Please build the project first (e.g. mvn -DskipTests package). Missing:\n"
-            + "\n".join(missing)
-        )
+def _image_hash(app: AppImage) -> str:
+    # sources + the docker build context (dockerfile, conf; copied build outputs are excluded)
+    h = hashlib.sha256()
+    h.update(_source_hash(app).encode("utf-8"))
+    h.update(_hash_path(_docker_dir() / app.docker_subdir).encode("utf-8"))
+    if LAYERED_IMAGES and app.jar:
+        h.update(b"layered v2")  # v2: generated dockerfile without VOLUME
+    if APPCDS and app.jar:
+        h.update(" ".join(("appcds", str(APPCDS_TRAINING_SEC)) + APPCDS_JVM_FLAGS).encode("utf-8"))
+    return h.hexdigest()
 
 
-def _write_patched_sql(tmp_dir: Path) -> List[Path]:
-    """Prepare SQL files for mysql init.
+class BuildCache:
+    """Persistent per-image build state, stored as json under deploy/minikube/.cache.
 
-    We patch Nacos config SQL so that in-cluster services can start:
-    - mysql host: ruoyi-mysql
-    - redis host: ruoyi-redis
-    - nacos addr: ruoyi-nacos
+    Each image records the source hash its jar/dist was built from, the hash and
+    docker image ID of the last build, and the image ID last loaded into minikube.
+    A disabled cache never matches, so every stage runs (but state is still recorded).
     """
+
+    def __init__(self, path: Path, enabled: bool = True) -> None:
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = self._read()
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8")).get("images", {})
+        except (OSError, ValueError):
+            return {}
+
+    def refresh(self) -> None:
+        """Pick up what concurrent runs (other namespaces of this checkout) recorded since we loaded."""
+        with self._lock:
+            self._data.update(self._read())
+
+    def get(self, image: str, field: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._data.get(image, {}).get(field)
+
+    def update(self, image: str, **fields: str) -> None:
+        # merged into the file as it is now: concurrent runs write their own entries into it too
+        with self._lock, _checkout_lock("build-cache"):
+            data = self._read()
+            data.setdefault(image, {}).update(fields)
+            self._data.update(data)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"images": data}, indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def _stale_sources(cache: BuildCache, apps: Iterable[AppImage]) -> Tuple[List[AppImage], List[AppImage]]:
+    """Split apps into (java, ui) whose source hash differs from the one their artifact was built from."""
     repo = _repo_root()
-    sql_dir = repo / "sql"
-    candidates = [
-        sql_dir / "ry_20250523.sql",
-        sql_dir / "ry_config_20250902.sql",
-    ]
-    out_files: List[Path] = []
-    for src in candidates:
-        if not src.exists():
-            continue
-        content = src.read_text(encoding="utf-8", errors="ignore")
-        if "ry_config" in src.name or "config" in src.name:
-            content = content.replace("jdbc:mysql://localhost:3306/ry-cloud", "jdbc:mysql://ruoyi-mysql:3306/ry-cloud")
-            content = content.replace("server-addr: 127.0.0.1:8848", "server-addr: ruoyi-nacos:8848")
-            content = content.replace("server-addr: 127.0.0.1:8718", "server-addr: ruoyi-nacos:8718")
-            content = content.replace("host: localhost\n    port: 6379", "host: ruoyi-redis\n    port: 6379")
-            content = content.replace("host: localhost", "host: ruoyi-redis")
-            content = content.replace("host: 127.0.0.1", "host: ruoyi-redis")
-            content = content.replace("jdbc:mysql://localhost:3306/ry-config", "jdbc:mysql://ruoyi-mysql:3306/ry-config")
-            content = content.replace("classpath:mapper/**/*.xml", "classpath*:mapper/**/*.xml")
-
-        dst = tmp_dir / src.name
-        dst.write_text(content, encoding="utf-8")
-        out_files.append(dst)
-    if not out_files:
-        raise RuntimeError("No SQL files found under ./sql to initialize mysql")
-    return out_files
+    stale_java: List[AppImage] = []
+    stale_ui: List[AppImage] = []
+    for app in apps:
+        if app.module:
+            if cache.get(app.image, "source_hash") != _source_hash(app) or not (repo / app.jar).exists():
+                stale_java.append(app)
+        elif cache.get(app.image, "source_hash") != _source_hash(app) or not (repo / "ruoyi-ui" / "dist").exists():
+            stale_ui.append(app)
+    return stale_java, stale_ui
 
 
-def _apply_configmaps(ns: str) -> None:
-    # Ensure namespace exists before creating configmaps.
-    # DO NOT apply the whole manifest here, otherwise mysql may start before SQL configmap is populated.
-    ns_yaml = _run_capture([_exe("kubectl"), "create", "ns", ns, "--dry-run=client", "-o", "yaml"], check=False)
-    if ns_yaml.strip():
-        subprocess.run(
-            [_exe("kubectl"), "apply", "-f", "-"],
-            input=ns_yaml,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            check=True,
-        )
+def _build_java(cache: BuildCache, stale: List[AppImage]) -> None:
+    with _checkout_lock("mvn"):
+        cache.refresh()
+        stale = _stale_sources(cache, stale)[0]
+        if not stale:
+            print("[cache] jars were just built by a concurrent deploy of this checkout, skipping mvn")
+            return
+        if len(stale) == len([a for a in APP_IMAGES if a.module]):
+            _build_backend_jars()
+        else:
+            _build_backend_jars([a.module for a in stale])
+        for a in stale:
+            cache.update(a.image, source_hash=_source_hash(a))
 
-    repo_docker = _docker_dir()
-    nacos_props = repo_docker / "nacos" / "conf" / "application.properties"
-    if not nacos_props.exists():
-        raise RuntimeError(f"Missing nacos config file: {nacos_props}")
-
-    with tempfile.TemporaryDirectory(prefix="ruoyi-minikube-") as td:
-        tmp_dir = Path(td)
-        sql_files = _write_patched_sql(tmp_dir)
-
-        # mysql init configmap (multiple sql files)
-        cmd = [
-            _exe("kubectl"),
-            "-n",
-            ns,
-            "create",
-            "configmap",
-            "ruoyi-mysql-init",
-        ]
-        for f in sql_files:
-            cmd.append(f"--from-file={f.name}={str(f)}")
-        cmd += ["--dry-run=client", "-o", "yaml"]
-        yaml_out = _run_capture(cmd, check=True)
-        subprocess.run(
-            [_exe("kubectl"), "apply", "-f", "-"],
-            input=yaml_out,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            check=True,
-        )
 
-        # nacos application.properties configmap
-        cmd2 = [
-            _exe("kubectl"),
-            "-n",
-            ns,
-            "create",
-            "configmap",
-            "ruoyi-nacos-conf",
-            f"--from-file=application.properties={str(nacos_props)}",
-            "--dry-run=client",
-            "-o",
-            "yaml",
-        ]
-        yaml_out2 = _run_capture(cmd2, check=True)
-        subprocess.run(
-            [_exe("kubectl"), "apply", "-f", "-"],
-            input=yaml_out2,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            check=True,
+def _build_ui(cache: BuildCache, stale: List[AppImage]) -> None:
+    with _checkout_lock("npm"):
+        cache.refresh()
+        stale = _stale_sources(cache, stale)[1]
+        if not stale:
+            print("[cache] ui dist was just built by a concurrent deploy of this checkout, skipping npm")
+            return
+        _build_frontend_dist()
+        for a in stale:
+            cache.update(a.image, source_hash=_source_hash(a))
+
+
+def _local_image_ids(env: Optional[dict] = None) -> Dict[str, str]:
+    """Map `repo:tag` -> full image ID for every image in the host docker daemon (single call).
+
+    Pass NODE_DOCKER_ENV as env to list the minikube node daemon instead.
+    """
+    out = _run_capture(
+        [_exe("docker"), "image", "ls", "--no-trunc", "--format", "{{.Repository}}:{{.Tag}} {{.ID}}"],
+        env=env,
+        check=False,
+    )
+    ids: Dict[str, str] = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            ids[parts[0]] = parts[1]
+    return ids
+
+
+def _minikube_images() -> Optional[Dict[str, str]]:
+    """Map `repo:tag` -> image ID for images in the minikube node, or None if they cannot be listed."""
+    out = _run_capture([_exe("minikube"), "image", "ls", "--format", "json"], check=False)
+    try:
+        items = json.loads(out)
+    except ValueError:
+        return None
+    images: Dict[str, str] = {}
+    for item in items:
+        for t in item.get("repoTags") or []:
+            for prefix in ("docker.io/library/", "docker.io/"):
+                if t.startswith(prefix):
+                    t = t[len(prefix):]
+                    break
+            images[t] = item.get("id", "")
+    return images
+
+
+def _minikube_image_tags() -> Optional[set]:
+    """Image tags present in the minikube node, or None if they cannot be listed."""
+    images = _minikube_images()
+    return None if images is None else set(images)
+
+
+def _minikube_docker_env() -> dict:
+    """Environment that points the docker cli at the minikube node's daemon."""
+    try:
+        out = _run_capture([_exe("minikube"), "docker-env", "--shell", "none"])
+    except RuntimeError as e:
+        raise RuntimeError(
+            "`minikube docker-env` failed; the minikube-docker backend needs the docker container runtime. "
+            f"Use --image-backend minikube-build instead.\n{e}"
         )
+    env = dict(os.environ)
+    for line in out.splitlines():
+        if "=" in line:
+            k, v = line.split("=", 1)
+            env[k.strip()] = v.strip().strip('"')
+    return env
 
 
-def _build_images_parallel(images: List[str], docker_compose_yml: Path) -> None:
-    # IMPORTANT:
-    # docker-compose.yml in this repo sets some base images as official names (e.g. mysql:5.7, nginx).
-    # If we run `docker compose build`, it may overwrite/tag official image names locally.
-    # Here we always build with explicit tags matching our K8s manifests.
-    repo_docker = _docker_dir()
-
-    build_plan = {
-        # ui
-        "ruoyi-ui:latest": (repo_docker / "nginx", repo_docker / "nginx" / "dockerfile"),
-        # apps
-        "ruoyi-gateway:jre17-1": (repo_docker / "ruoyi" / "gateway", repo_docker / "ruoyi" / "gateway" / "dockerfile"),
-        "ruoyi-auth:jre17-1": (repo_docker / "ruoyi" / "auth", repo_docker / "ruoyi" / "auth" / "dockerfile"),
-        "ruoyi-modules-system:jre17-1": (repo_docker / "ruoyi" / "modules" / "system", repo_docker / "ruoyi" / "modules" / "system" / "dockerfile"),
-        "ruoyi-modules-gen:jre17-1": (repo_docker / "ruoyi" / "modules" / "gen", repo_docker / "ruoyi" / "modules" / "gen" / "dockerfile"),
-        "ruoyi-modules-job:jre17-1": (repo_docker / "ruoyi" / "modules" / "job", repo_docker / "ruoyi" / "modules" / "job" / "dockerfile"),
-        "ruoyi-modules-file:jre17-1": (repo_docker / "ruoyi" / "modules" / "file", repo_docker / "ruoyi" / "modules" / "file" / "dockerfile"),
-        "ruoyi-visual-monitor:jre17-1": (repo_docker / "ruoyi" / "visual" / "monitor", repo_docker / "ruoyi" / "visual" / "monitor" / "dockerfile"),
-    }
+def _built_image_ids() -> Dict[str, str]:
+    """Image IDs in whichever daemon IMAGE_BACKEND builds into."""
+    if IMAGE_BACKEND == "minikube-build":
+        return _minikube_images() or {}
+    return _local_image_ids(NODE_DOCKER_ENV if IMAGE_BACKEND == "minikube-docker" else None)
 
-    def build_one(img: str) -> CmdResult:
-        if img not in build_plan:
-            raise RuntimeError(f"No build plan for image: {img}")
-        context_dir, dockerfile = build_plan[img]
-        return _run([
-            _exe("docker"),
-            "build",
-            "-t",
-            img,
-            "-f",
-            str(dockerfile),
-            str(context_dir),
-        ])
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(6, len(images))) as ex:
-        futs = [ex.submit(build_one, s) for s in images]
-        for f in concurrent.futures.as_completed(futs):
-            f.result()
+def _image_cache_fields() -> Tuple[str, str]:
+    # Host and node daemons have different image IDs, so they are cached separately.
+    if IMAGE_BACKEND == "host":
+        return "image_hash", "image_id"
+    return "node_image_hash", "node_image_id"
 
 
-def _minikube_load_parallel(images: List[str]) -> None:
-    def load_one(img: str) -> CmdResult:
-        return _run([_exe("minikube"), "image", "load", img])
+def _images_needing_build(cache: BuildCache, apps: Iterable[AppImage]) -> List[str]:
+    built = _built_image_ids()
+    hash_field, id_field = _image_cache_fields()
+    stale = []
+    for app in apps:
+        image_id = built.get(_image_tag(app))
+        if image_id and CONTENT_TAGS and cache.enabled:
+            continue  # built from these very inputs, possibly by a deploy of another namespace or checkout
+        if not image_id or cache.get(app.image, hash_field) != _image_hash(app) or cache.get(app.image, id_field) != image_id:
+            stale.append(app.image)
+    return stale
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(6, len(images))) as ex:
-        futs = [ex.submit(load_one, i) for i in images]
-        for f in concurrent.futures.as_completed(futs):
-            f.result()
 
+def _images_needing_load(cache: BuildCache, apps: Iterable[AppImage]) -> List[str]:
+    local = _local_image_ids()
+    in_node = _minikube_image_tags()
+    stale = []
+    for app in apps:
+        tag = _image_tag(app)
+        if CONTENT_TAGS and cache.enabled and in_node is not None and tag in in_node:
+            continue
+        image_id = local.get(tag)
+        if image_id and cache.get(app.image, "loaded_id") == image_id and (in_node is None or tag in in_node):
+            continue
+        stale.append(app.image)
+    return stale
 
-def _kubectl_apply(ns: str) -> None:
-    _run([_exe("kubectl"), "apply", "-f", str(_k8s_yaml())])
 
+def _resolve_services(spec: str) -> Tuple[List[Service], List[Service]]:
+    """Parse a comma separated --services value.
 
-def _wait_rollout(ns: str, deployments: Iterable[str], timeout_sec: int = 600) -> None:
-    start = time.time()
-    for d in deployments:
-        left = max(30, timeout_sec - int(time.time() - start))
-        _run([_exe("kubectl"), "-n", ns, "rollout", "status", f"deploy/{d}", f"--timeout={left}s"], check=True)
+    Accepts short names (auth) or deployment names (ruoyi-auth).
+    Returns (targets, upstream) where upstream are transitive deps that are not targets themselves.
+    """
+    by_name = {s.name: s for s in SERVICES}
+    by_name.update({s.deployment: s for s in SERVICES})
 
+    targets: List[Service] = []
+    for raw in spec.split(","):
+        key = raw.strip()
+        if not key:
+            continue
+        if key not in by_name:
+            raise RuntimeError(
+                f"Unknown service: {key}. Valid: {', '.join(s.name for s in SERVICES)}"
+            )
+        if by_name[key] not in targets:
+            targets.append(by_name[key])
+    if not targets:
+        raise RuntimeError("--services is empty")
 
-def _get_single_pod_name(ns: str, label_selector: str) -> str:
-    out = _run_capture([
-        _exe("kubectl"),
-        "-n",
-        ns,
-        "get",
-        "pod",
-        "-l",
-        label_selector,
-        "-o",
-        "jsonpath={.items[0].metadata.name}",
-    ])
-    name = out.strip()
-    if not name:
-        raise RuntimeError(f"No pod found for selector: {label_selector} in ns={ns}")
-    return name
+    upstream: List[Service] = []
+    stack = [d for t in targets for d in t.depends_on]
+    while stack:
+        dep = by_name[stack.pop()]
+        if dep in targets or dep in upstream:
+            continue
+        upstream.append(dep)
+        stack.extend(dep.depends_on)
+    # keep manifest order for stable output
+    order = {s.name: i for i, s in enumerate(SERVICES)}
+    upstream.sort(key=lambda s: order[s.name])
+    return targets, upstream
 
 
-def _mysql_exec(ns: str, pod: str, shell_cmd: str, check: bool = True) -> CmdResult:
-    return _run([
-        _exe("kubectl"),
-        "-n",
-        ns,
-        "exec",
-        pod,
-        "--",
-        "sh",
-        "-lc",
-        shell_cmd,
-    ], check=check)
+def _apps_for(services: Iterable[Service]) -> List[AppImage]:
+    images = {s.image for s in services if s.image}
+    return [a for a in APP_IMAGES if a.image in images]
 
 
-def _mysql_sql(ns: str, pod: str, database: str, sql: str, check: bool = True) -> CmdResult:
-    # Run a single SQL statement (safe quoting for our fixed strings)
-    cmd = [
-        _exe("kubectl"),
-        "-n",
-        ns,
-        "exec",
-        pod,
-        "--",
-        "mysql",
-        "--default-character-set=utf8mb4",
-        "-uroot",
-        "-ppassword",
-        f"--database={database}",
-        "-e",
-        sql,
-    ]
-    return _run(cmd, check=check)
+@dataclass
+class SyncStats:
+    copied: int = 0
+    reflinked: int = 0
+    linked: int = 0
+    skipped: int = 0
+    pruned: int = 0
+    bytes_copied: int = 0
+    bytes_reflinked: int = 0
+    bytes_linked: int = 0
+
+    @property
+    def bytes_synced(self) -> int:
+        """Bytes of every file brought up to date, however cheaply (a link still means the file changed)."""
+        return self.bytes_copied + self.bytes_reflinked + self.bytes_linked
+
+    def trace_args(self) -> Dict[str, int]:
+        return {
+            "bytes_synced": self.bytes_synced,
+            "bytes_copied": self.bytes_copied,
+            "bytes_reflinked": self.bytes_reflinked,
+            "bytes_linked": self.bytes_linked,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.copied} copied ({_fmt_size(self.bytes_copied)}), "
+            f"{self.reflinked} reflinked ({_fmt_size(self.bytes_reflinked)}), "
+            f"{self.linked} linked ({_fmt_size(self.bytes_linked)}), "
+            f"{self.skipped} unchanged, {self.pruned} pruned"
+        )
+
+
+# Placeholder files tracked in git inside the copy targets (e.g. docker/nginx/html/dist/readme.txt).
+SYNC_KEEP_FILES = {"readme.txt"}
+_FICLONE = 0x40049409  # linux ioctl: copy-on-write clone (btrfs, xfs, ...)
 
 
-def _fix_ry_config_redis_host(ns: str) -> None:
-    """Fix common misconfig where services try to connect Redis at localhost inside K8s.
+def _same_content(a: Path, b: Path) -> bool:
+    ha, hb = hashlib.sha256(), hashlib.sha256()
+    for path, h in ((a, ha), (b, hb)):
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                h.update(chunk)
+    return ha.digest() == hb.digest()
 
-    We patch ry-config.config_info in-place to replace:
-    - host: localhost
-    - host: 127.0.0.1
-    with:
-    - host: ruoyi-redis
 
-    Why:
-    - Some services (notably ruoyi-system) may pull dataId=ruoyi-system or ruoyi-system.yml (not -dev),
-      so patching only *-dev.yml is not sufficient.
+def _reflink(src: Path, dst: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with src.open("rb") as s, dst.open("wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return True
+        except OSError:
+            return False
+
+
+def _sync_file(src: Path, dst: Path, stats: SyncStats) -> None:
+    """Make dst identical to src without rewriting it when it already is.
+
+    Unchanged = same size and mtime (or same content hash). Otherwise try a reflink,
+    then a hard link, then a streamed copy; the result replaces dst atomically.
     """
-    mysql_pod = _get_single_pod_name(ns, "app=ruoyi-mysql")
+    st = src.stat()
+    try:
+        dt = dst.stat()
+    except FileNotFoundError:
+        dt = None
+    if dt is not None and dt.st_size == st.st_size:
+        if dt.st_mtime_ns == st.st_mtime_ns or _same_content(src, dst):
+            stats.skipped += 1
+            return
 
-    # Patch all ruoyi-related dataIds to be robust.
-    # Avoid changing unrelated configs by restricting to ruoyi-%
-    _mysql_sql(
-        ns,
-        mysql_pod,
-        "ry-config",
-        "UPDATE config_info "
-        "SET content=REPLACE(REPLACE(content,'host: localhost','host: ruoyi-redis'),'host: 127.0.0.1','host: ruoyi-redis'), "
-        "    gmt_modified=NOW() "
-        "WHERE data_id LIKE 'ruoyi-%';",
-        check=True,
-    )
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".sync-tmp")
+    if tmp.exists():
+        tmp.unlink()
+    if _reflink(src, tmp):
+        shutil.copystat(src, tmp)
+        stats.reflinked += 1
+        stats.bytes_reflinked += st.st_size
+    else:
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            os.link(src, tmp)
+            stats.linked += 1
+            stats.bytes_linked += st.st_size
+        except OSError:
+            # streams in chunks (sendfile where available); mtime is kept so the next run can skip cheaply
+            shutil.copyfile(src, tmp)
+            shutil.copystat(src, tmp)
+            stats.copied += 1
+            stats.bytes_copied += st.st_size
+    os.replace(tmp, dst)
 
 
-def _ensure_mysql_initialized(ns: str) -> None:
-    # Make sure mysql is ready first.
-    _wait_rollout(ns, ["ruoyi-mysql"], timeout_sec=600)
+def _sync_tree(src_dir: Path, dst_dir: Path, stats: SyncStats, prune: bool = True) -> None:
+    """Mirror src_dir into dst_dir; with prune, files no longer in src_dir are removed."""
+    seen = set()
+    for root, _, files in os.walk(src_dir):
+        rel = Path(root).relative_to(src_dir)
+        for f in files:
+            _sync_file(Path(root) / f, dst_dir / rel / f, stats)
+            seen.add((rel / f).as_posix())
+    if not prune or not dst_dir.exists():
+        return
+    for root, _, files in os.walk(dst_dir, topdown=False):
+        rel = Path(root).relative_to(dst_dir)
+        for f in files:
+            if (rel / f).as_posix() not in seen and f not in SYNC_KEEP_FILES:
+                (Path(root) / f).unlink()
+                stats.pruned += 1
+        if Path(root) != dst_dir and not any(Path(root).iterdir()):
+            Path(root).rmdir()
 
-    mysql_pod = _get_single_pod_name(ns, "app=ruoyi-mysql")
 
-    # ---- Nacos config DB (ry-config) ----
-    # NOTE: It's not enough to check the database exists; we must ensure core tables exist.
-    # Otherwise Nacos will crash or behave incorrectly.
-    db_check_cmd = "mysql -uroot -ppassword -N -e \"SHOW DATABASES LIKE 'ry-config';\""
-    out = _run_capture([
-        _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", db_check_cmd
-    ], check=False).strip()
-
-    # Import init SQL files explicitly (idempotent for CREATE DATABASE IF EXISTS patterns)
-    # Note: files are mounted from ConfigMap into /docker-entrypoint-initdb.d
-    _mysql_exec(ns, mysql_pod, "ls -la /docker-entrypoint-initdb.d", check=True)
-
-    # Ensure databases exist, then import into the right database explicitly.
-    _mysql_exec(
-        ns,
-        mysql_pod,
-        "mysql -uroot -ppassword -e \"CREATE DATABASE IF NOT EXISTS `ry-config` DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;\"",
-        check=True,
-    )
-    _mysql_exec(
-        ns,
-        mysql_pod,
-        "mysql --default-character-set=utf8mb4 -uroot -ppassword ry-config < /docker-entrypoint-initdb.d/ry_config_20250902.sql",
-        check=True,
-    )
-
-    # Verify ry-config core table exists (Nacos config_info)
-    cfg_table_check_cmd = "mysql --default-character-set=utf8mb4 -uroot -ppassword -N -D ry-config -e \"SHOW TABLES LIKE 'config_info';\""
-    cfg = _run_capture([
-        _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", cfg_table_check_cmd
-    ], check=False).strip()
-    if cfg != "config_info":
-        # Retry import with --force once (handles partial imports)
-        _mysql_exec(
-            ns,
-            mysql_pod,
-            "mysql --default-character-set=utf8mb4 --force -uroot -ppassword ry-config < /docker-entrypoint-initdb.d/ry_config_20250902.sql",
-            check=False,
-        )
-        cfg2 = _run_capture([
-            _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", cfg_table_check_cmd
-        ], check=False).strip()
-        if cfg2 != "config_info":
-            raise RuntimeError("MySQL init incomplete: table ry-config.config_info not found after importing ry_config_20250902.sql")
-
-    _mysql_exec(
-        ns,
-        mysql_pod,
-        "mysql -uroot -ppassword -e \"CREATE DATABASE IF NOT EXISTS `ry-cloud` DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;\"",
-        check=True,
-    )
-    _mysql_exec(
-        ns,
-        mysql_pod,
-        "mysql --default-character-set=utf8mb4 -uroot -ppassword ry-cloud < /docker-entrypoint-initdb.d/ry_20250523.sql",
-        check=False,
-    )
+def _copy_sql_assets() -> None:
+    repo = _repo_root()
+    mysql_db = _docker_dir() / "mysql" / "db"
+    stats = SyncStats()
+    with TRACE.span("sync:sql", "sync") as span:
+        for name in ("ry_20250523.sql", "ry_config_20250902.sql"):
+            src = repo / "sql" / name
+            if src.exists():
+                _sync_file(src, mysql_db / name, stats)
+        span.update(stats.trace_args())
 
-    # Verify key table exists in ry-cloud for ruoyi modules
-    # (avoid service CrashLoop with 'Table ry-cloud.sys_config doesn't exist')
-    # Avoid backticks (shell command substitution) by selecting DB via -D.
-    table_check_cmd = "mysql --default-character-set=utf8mb4 -uroot -ppassword -D ry-cloud -N -e \"SHOW TABLES LIKE 'sys_config';\""
-    t = _run_capture([
-        _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", table_check_cmd
-    ], check=False).strip()
-    if t != "sys_config":
-        # Retry import once in case of transient failure
-        _mysql_exec(
-            ns,
-            mysql_pod,
-            "mysql --default-character-set=utf8mb4 -uroot -ppassword ry-cloud < /docker-entrypoint-initdb.d/ry_20250523.sql",
-            check=False,
-        )
-        t2 = _run_capture([
-            _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", table_check_cmd
-        ], check=False).strip()
-        if t2 != "sys_config":
-            raise RuntimeError("MySQL init incomplete: table ry-cloud.sys_config not found after importing ry_20250523.sql")
-
-    # Also verify sys_job exists (ruoyi-job depends on it)
-    job_check_cmd = "mysql --default-character-set=utf8mb4 -uroot -ppassword -D ry-cloud -N -e \"SHOW TABLES LIKE 'sys_job';\""
-    j = _run_capture([
-        _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", job_check_cmd
-    ], check=False).strip()
-    if j != "sys_job":
-        _mysql_exec(
-            ns,
-            mysql_pod,
-            "mysql --default-character-set=utf8mb4 --force -uroot -ppassword ry-cloud < /docker-entrypoint-initdb.d/ry_20250523.sql",
-            check=False,
-        )
-        j2 = _run_capture([
-            _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", job_check_cmd
-        ], check=False).strip()
-        if j2 != "sys_job":
-            raise RuntimeError("MySQL init incomplete: table ry-cloud.sys_job not found after importing ry_20250523.sql")
 
-    # Re-check database still exists (paranoia check)
-    out2 = _run_capture([
-        _exe("kubectl"), "-n", ns, "exec", mysql_pod, "--", "sh", "-lc", db_check_cmd
-    ], check=False).strip()
-    if out2 != "ry-config":
-        raise RuntimeError("MySQL init failed: ry-config database not found after importing SQL")
+def _copy_assets(apps: Optional[Iterable[AppImage]] = None) -> None:
+    # docker/copy.sh is linux shell; on windows we implement the same copy in python
+    apps = list(APP_IMAGES if apps is None else apps)
+    repo = _repo_root()
+    dkr = _docker_dir()
 
+    # ui dist (pruned: old hashed bundles would otherwise pile up in the nginx image)
+    ui_dist = repo / "ruoyi-ui" / "dist"
+    nginx_dist = dkr / "nginx" / "html" / "dist"
+    if ui_dist.exists() and any(not a.module for a in apps):
+        stats = SyncStats()
+        with TRACE.span("sync:ui-dist", "sync") as span:
+            _sync_tree(ui_dist, nginx_dist, stats, prune=True)
+            span.update(stats.trace_args())
+        print(f"[sync] ui dist: {stats}")
 
-def _restart_and_wait(ns: str, deployment: str, timeout_sec: int = 600) -> None:
-    _run([_exe("kubectl"), "-n", ns, "rollout", "restart", f"deploy/{deployment}"])
-    _wait_rollout(ns, [deployment], timeout_sec=timeout_sec)
+    # jars
+    jar_map = {
+        Path(a.jar).stem: (repo / a.jar, dkr / a.docker_subdir / "jar") for a in apps if a.jar
+    }
 
+    missing = []
+    for name, (src, dst_dir) in jar_map.items():
+        if not src.exists():
+            missing.append(str(src))
+            continue
+        stats = SyncStats()
+        with TRACE.span(f"sync:{name}", "sync") as span:
+            _sync_file(src, dst_dir / src.name, stats)
+            span.update(stats.trace_args())
+        print(f"[sync] {name}.jar: {stats}")
 
-def _print_access(ns: str) -> None:
-    # Print url from minikube service
-    _run([_exe("minikube"), "service", "-n", ns, "ruoyi-nginx", "--url"], check=False)
+    if missing:
+        raise RuntimeError(
+            "Missing jar build outputs. Please build the project first (e.g. mvn -DskipTests package). Missing:\n"
+            + "\n".join(missing)
+        )
 
 
-def _cleanup(ns: str) -> None:
-    _run([_exe("kubectl"), "delete", "ns", ns, "--ignore-not-found=true"], check=False)
+@dataclass(frozen=True)
+class SqlRule:
+    """One entry of sql-rewrite.json: replace `find` with `replace`, scoped to sql files (glob), Nacos
+    data_ids (glob; rules with a data_id only apply inside config_info rows) and a yaml section
+    (dotted key path the matched line must be nested under, e.g. "spring.redis")."""
 
+    name: str
+    find: str
+    replace: str
+    files: str = "*"
+    data_id: Optional[str] = None
+    section: Optional[str] = None
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Deploy RuoYi-Cloud to minikube")
-    parser.add_argument("--namespace", default="ruoyi")
-    parser.add_argument("--skip-build", action="store_true", help="Skip docker build")
-    parser.add_argument("--only-apply", action="store_true", help="Only kubectl apply and wait")
-    parser.add_argument("--cleanup", action="store_true", help="Delete namespace and exit")
-    parser.add_argument("--docker-bin", default=None)
-    parser.add_argument("--kubectl-bin", default=None)
-    parser.add_argument("--minikube-bin", default=None)
-    parser.add_argument("--mvn-bin", default=None)
-    parser.add_argument("--node-bin", default=None)
-    parser.add_argument("--npm-bin", default=None)
-    args = parser.parse_args()
+    def applies(self, file: str, data_id: Optional[str], section: str) -> bool:
+        if not fnmatch.fnmatchcase(file, self.files):
+            return False
+        if self.data_id is not None and (data_id is None or not fnmatch.fnmatchcase(data_id, self.data_id)):
+            return False
+        return self.section is None or section == self.section or section.startswith(self.section + ".")
 
-    global TOOL_BIN
-    TOOL_BIN = _ensure_tools(args)
-    _ensure_base_images()
 
-    if args.cleanup:
-        _cleanup(args.namespace)
-        return 0
+def _sql_rules_path() -> Path:
+    return Path(__file__).resolve().parent / "sql-rewrite.json"
 
-    if not _k8s_yaml().exists():
-        raise RuntimeError(f"k8s manifest not found: {_k8s_yaml()}")
 
-    # Ensure namespace in yaml matches
-    if args.namespace != "ruoyi":
-        raise RuntimeError("This initial version only supports namespace 'ruoyi' (hardcoded in yaml).")
-
-    if not args.only_apply:
-        # build backend and frontend in parallel for speed
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as ex:
-            fut_backend = ex.submit(_build_backend_jars)
-            fut_frontend = ex.submit(_build_frontend_dist)
-            fut_backend.result()
-            fut_frontend.result()
-
-        _copy_assets()
-
-        if not args.skip_build:
-            docker_compose = _docker_dir() / "docker-compose.yml"
-            imgs_to_build = [
-                "ruoyi-gateway:jre17-1",
-                "ruoyi-auth:jre17-1",
-                "ruoyi-modules-system:jre17-1",
-                "ruoyi-modules-gen:jre17-1",
-                "ruoyi-modules-job:jre17-1",
-                "ruoyi-modules-file:jre17-1",
-                "ruoyi-visual-monitor:jre17-1",
-                "ruoyi-ui:latest",
-            ]
-            _build_images_parallel(imgs_to_build, docker_compose)
-
-        # Ensure images are available in minikube runtime (safe even if already there)
-        imgs = [
-            "ruoyi-gateway:jre17-1",
-            "ruoyi-auth:jre17-1",
-            "ruoyi-modules-system:jre17-1",
-            "ruoyi-modules-gen:jre17-1",
-            "ruoyi-modules-job:jre17-1",
-            "ruoyi-modules-file:jre17-1",
-            "ruoyi-visual-monitor:jre17-1",
-            "ruoyi-ui:latest",
-        ]
-        _minikube_load_parallel(imgs)
+def _load_sql_rules(path: Path) -> List[SqlRule]:
+    try:
+        return [SqlRule(**r) for r in json.loads(path.read_text(encoding="utf-8"))["rules"]]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(f"Invalid sql rewrite rules {path}: {e}")
 
-    # Create/Update configmaps for mysql init and nacos config (must happen before pods start)
-    _apply_configmaps(args.namespace)
 
-    _kubectl_apply(args.namespace)
+class SqlRewriter:
+    """Single-pass, line-streaming rewriter for the sql dumps.
 
-    # Ensure mysql schema/config DB are initialized, then restart nacos (depends on ry-config)
-    _ensure_mysql_initialized(args.namespace)
+    All `find` strings are compiled into one alternation, so each line is scanned once whatever the
+    number of rules. Every match is checked against the scope of the rules sharing that literal;
+    config_info rows are tracked to know the current data_id and yaml section.
+    """
 
-    # Fix common localhost Redis misconfig in ry-config before restarting services.
-    _fix_ry_config_redis_host(args.namespace)
+    def __init__(self, rules: List[SqlRule]) -> None:
+        self.rules: Dict[str, List[SqlRule]] = {}
+        for r in rules:
+            self.rules.setdefault(r.find, []).append(r)
+        literals = sorted(self.rules, key=len, reverse=True)  # longest first, like a trie would
+        self.pattern = re.compile("|".join(map(re.escape, literals))) if literals else None
+        self.hits: Dict[str, int] = {r.name: 0 for r in rules}
 
-    _restart_and_wait(args.namespace, "ruoyi-nacos", timeout_sec=900)
+    def rewrite(self, file: str, lines: Iterable[str], out: io.TextIOBase) -> None:
+        data_id: Optional[str] = None
+        stack: List[Tuple[int, str]] = []  # (indent, key) of the enclosing yaml keys
+        for line in lines:
+            row = SQL_CONFIG_ROW.match(line)
+            if row:
+                data_id, stack = row.group(2), []
+            if data_id is None or self.pattern is None:
+                out.write(self._sub(file, None, "", line) if self.pattern else line)
+                continue
+            # rewrite yaml line by yaml line to know each line's section
+            pieces = line.split("\\n")
+            for i, piece in enumerate(pieces):
+                text = piece[row.end():] if (row and i == 0) else piece
+                key = SQL_YAML_KEY.match(text)
+                if key:
+                    indent = len(key.group(1))
+                    while stack and stack[-1][0] >= indent:
+                        stack.pop()
+                    section = ".".join(k for _, k in stack)
+                    stack.append((indent, key.group(2).strip()))
+                else:
+                    section = ".".join(k for _, k in stack)
+                pieces[i] = self._sub(file, data_id, section, piece)
+            out.write("\\n".join(pieces))
+            if line.rstrip().endswith(";"):
+                data_id = None  # end of the insert statement
 
-    deployments = [
-        "ruoyi-mysql",
-        "ruoyi-redis",
-        "ruoyi-nacos",
-        "ruoyi-gateway",
-        "ruoyi-auth",
-        "ruoyi-system",
-        "ruoyi-gen",
-        "ruoyi-job",
-        "ruoyi-file",
-        "ruoyi-monitor",
-        "ruoyi-nginx",
-    ]
-    _wait_rollout(args.namespace, deployments, timeout_sec=900)
-    _print_access(args.namespace)
-    return 0
+    def _sub(self, file: str, data_id: Optional[str], section: str, text: str) -> str:
+        def replace(m: "re.Match[str]") -> str:
+            for rule in self.rules[m.group(0)]:
+                if rule.applies(file, data_id, section):
+                    self.hits[rule.name] += 1
+                    return rule.replace
+            return m.group(0)
+
+        return self.pattern.sub(replace, text)
+
+    def report(self) -> None:
+        hit = [f"{name} x{n}" for name, n in self.hits.items() if n]
+        unused = [name for name, n in self.hits.items() if not n]
+        print(f"[sql] rewrite rules: {', '.join(hit) or 'none matched'}" + (f"; no match: {', '.join(unused)}" if unused else ""))
+
+
+def _patched_sql() -> Dict[str, str]:
+    """Prepare SQL files for mysql init, keyed by file name (the ConfigMap payload).
+
+    We patch Nacos config SQL so that in-cluster services can start (mysql host: ruoyi-mysql,
+    redis host: ruoyi-redis, nacos addr: ruoyi-nacos, ...); the rules live in sql-rewrite.json.
+    """
+    sql_dir = _repo_root() / "sql"
+    rewriter = SqlRewriter(_load_sql_rules(_sql_rules_path()))
+    payload: Dict[str, str] = {}
+    with TRACE.span("sql-patch") as span:
+        for name in MYSQL_IMPORTS:
+            src = sql_dir / name
+            if not src.exists():
+                continue
+            buf = io.StringIO()
+            with src.open(encoding="utf-8", errors="ignore", newline="") as f:
+                rewriter.rewrite(name, f, buf)
+            payload[name] = buf.getvalue()
+        span.update(rewriter.hits)
+    if not payload:
+        raise RuntimeError("No SQL files found under ./sql to initialize mysql")
+    rewriter.report()
+    return payload
+
+
+class KubeClient:
+    """Thin Kubernetes API client: apply/get/watch/logs/exec over pooled keep-alive connections.
+
+    Credentials come from one `kubectl config view --minify --flatten` call; after that no kubectl
+    process is forked and the TLS handshake is paid once per pooled connection instead of per call.
+    Only token and client-certificate auth are supported (what minikube writes); anything else makes
+    from_kubeconfig raise and the caller falls back to kubectl.
+    """
+
+    def __init__(self, server: str, ssl_ctx: Optional[ssl.SSLContext] = None, token: Optional[str] = None) -> None:
+        url = urllib.parse.urlsplit(server)
+        self.https = url.scheme == "https"
+        self.host = url.hostname or "localhost"
+        self.port = url.port or (443 if self.https else 80)
+        self.ssl_ctx = ssl_ctx
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_kubeconfig(cls) -> "KubeClient":
+        cfg = json.loads(_run_capture([_exe("kubectl"), "config", "view", "--minify", "--flatten", "-o", "json"]))
+        cluster = cfg["clusters"][0]["cluster"]
+        user = (cfg.get("users") or [{}])[0].get("user") or {}
+        if "exec" in user or "auth-provider" in user:
+            raise RuntimeError("kubeconfig uses an auth plugin")
+        ctx = ssl.create_default_context()
+        if cluster.get("insecure-skip-tls-verify"):
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        elif cluster.get("certificate-authority-data"):
+            ctx.load_verify_locations(cadata=base64.b64decode(cluster["certificate-authority-data"]).decode())
+        if user.get("client-certificate-data"):
+            # ssl only loads key pairs from files; they are read immediately and removed with the directory.
+            with tempfile.TemporaryDirectory(prefix="ruoyi-kube-") as td:
+                cert, key = Path(td) / "client.crt", Path(td) / "client.key"
+                cert.write_bytes(base64.b64decode(user["client-certificate-data"]))
+                key.write_bytes(base64.b64decode(user["client-key-data"]))
+                ctx.load_cert_chain(str(cert), str(key))
+        client = cls(cluster["server"], ctx, user.get("token"))
+        client.request("GET", "/version", label="version")
+        return client
+
+    def _connect(self, timeout: Optional[float] = 60) -> http.client.HTTPConnection:
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, context=self.ssl_ctx, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    @staticmethod
+    def path(kind: str, ns: Optional[str] = None, name: Optional[str] = None, sub: Optional[str] = None) -> str:
+        prefix, plural, namespaced = KUBE_RESOURCES[kind]
+        parts = [prefix] + (["namespaces", ns] if namespaced and ns else []) + [plural]
+        parts += [p for p in (name, sub) if p]
+        return "/".join(parts)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[str] = None,
+        content_type: str = "application/json",
+        query: Optional[dict] = None,
+        label: str = "",
+        ok_missing: bool = False,
+    ) -> object:
+        """JSON (or text) body of the response; raises RuntimeError on API errors (404 -> None if ok_missing)."""
+        if query:
+            path += "?" + urllib.parse.urlencode(query, doseq=True)
+        headers = dict(self.headers, Accept="application/json")
+        if body is not None:
+            headers["Content-Type"] = content_type
+        with TRACE.span(f"api {method} {label}".strip(), "api", path=path) as span:
+            for attempt in (1, 2):
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                conn = conn or self._connect()
+                try:
+                    conn.request(method, path, body=body.encode("utf-8") if body is not None else None, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionError):
+                    conn.close()  # pooled connection went stale while idle; retry once on a fresh one
+                    if attempt == 2:
+                        raise
+            with self._lock:
+                self._idle.append(conn)
+            span["status"] = resp.status
+        if resp.status == 404 and ok_missing:
+            return None
+        text = data.decode("utf-8", errors="replace")
+        parsed = json.loads(text) if resp.getheader("Content-Type", "").startswith("application/json") else text
+        if resp.status >= 400:
+            message = parsed.get("message", text) if isinstance(parsed, dict) else text
+            raise RuntimeError(f"API {method} {path} failed ({resp.status}): {message}")
+        return parsed
+
+    def apply(self, ns: str, kind: str, name: str, manifest: str) -> dict:
+        """Server-side apply of one YAML/JSON document (the API equivalent of `kubectl apply`)."""
+        return self.request(
+            "PATCH",
+            self.path(kind, ns, name),
+            manifest,
+            content_type="application/apply-patch+yaml",
+            query={"fieldManager": KUBE_FIELD_MANAGER, "force": "true"},
+            label=f"apply {kind}",
+        )
+
+    def get(self, ns: Optional[str], kind: str, name: Optional[str] = None, **query: str) -> Optional[dict]:
+        return self.request("GET", self.path(kind, ns, name), query=query or None, label=f"get {kind}", ok_missing=True)
+
+    def delete(self, ns: Optional[str], kind: str, name: str) -> None:
+        self.request("DELETE", self.path(kind, ns, name), label=f"delete {kind}", ok_missing=True)
+
+    def restart(self, ns: str, deployment: str) -> None:
+        """Same patch as `kubectl rollout restart`."""
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        patch = {"spec": {"template": {"metadata": {"annotations": {"kubectl.kubernetes.io/restartedAt": stamp}}}}}
+        self.request(
+            "PATCH",
+            self.path("Deployment", ns, deployment),
+            json.dumps(patch),
+            content_type="application/strategic-merge-patch+json",
+            label="restart Deployment",
+        )
+
+    def logs(self, ns: str, pod: str, tail: int, previous: bool = False) -> str:
+        query = {"tailLines": str(tail)}
+        if previous:
+            query["previous"] = "true"
+        try:
+            out = self.request("GET", self.path("Pod", ns, pod, "log"), query=query, label="logs", ok_missing=True)
+        except RuntimeError:
+            return ""  # e.g. no previous container
+        return out if isinstance(out, str) else ""
+
+    def watch(self, ns: str, kind: str) -> Tuple[Iterator[dict], Callable[[], None]]:
+        """(watch events, close) on a dedicated connection; existing objects arrive first as ADDED events."""
+        conn = self._connect(timeout=None)
+        path = self.path(kind, ns) + "?watch=true"
+        with TRACE.span(f"api WATCH {kind}", "api", path=path):
+            conn.request("GET", path, headers=dict(self.headers, Accept="application/json"))
+            resp = conn.getresponse()
+            sock = conn.sock
+        if resp.status >= 400:
+            raise RuntimeError(f"API watch {path} failed ({resp.status}): {resp.read()[:200]!r}")
+
+        def events() -> Iterator[dict]:
+            try:
+                for line in resp:
+                    if line.strip():
+                        yield json.loads(line)
+            except (OSError, ValueError, http.client.HTTPException):
+                return  # closed by close() or by the server; the caller restarts the watch
+            finally:
+                conn.close()
+
+        def close() -> None:
+            # only shut the socket down: the reading thread sees EOF and closes the connection itself
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+
+        return events(), close
+
+    def exec(
+        self, ns: str, pod: str, argv: List[str], stdin: Optional[bytes] = None, timeout: float = KUBE_EXEC_TIMEOUT_SEC
+    ) -> Tuple[int, str, str]:
+        """(exit code, stdout, stderr) of argv run in the pod, via the websocket exec subresource.
+
+        v4.channel.k8s.io can not half-close stdin, so argv must stop reading by itself (e.g. `head -c N`).
+        Fails once connecting, sending or waiting for output stalls for longer than `timeout` seconds.
+        """
+        query = [("command", a) for a in argv] + [("stdout", "true"), ("stderr", "true")]
+        if stdin is not None:
+            query.append(("stdin", "true"))
+        path = self.path("Pod", ns, pod, "exec") + "?" + urllib.parse.urlencode(query)
+        with TRACE.span(f"api exec {argv[0]}", "api", path=path) as span:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=timeout)
+                if self.https:
+                    sock = self.ssl_ctx.wrap_socket(sock, server_hostname=self.host)
+                with sock, sock.makefile("rb") as f:
+                    request = [
+                        f"GET {path} HTTP/1.1",
+                        f"Host: {self.host}:{self.port}",
+                        "Connection: Upgrade",
+                        "Upgrade: websocket",
+                        f"Sec-WebSocket-Key: {base64.b64encode(os.urandom(16)).decode()}",
+                        "Sec-WebSocket-Version: 13",
+                        "Sec-WebSocket-Protocol: v4.channel.k8s.io",
+                    ] + [f"{k}: {v}" for k, v in self.headers.items()]
+                    sock.sendall(("\r\n".join(request) + "\r\n\r\n").encode())
+                    status_line = f.readline().decode("latin-1")
+                    while f.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    if " 101 " not in status_line:
+                        raise RuntimeError(f"API exec in {pod} failed: {status_line.strip()}")
+                    for i in range(0, len(stdin or b""), 1 << 20):
+                        sock.sendall(_ws_frame(b"\0" + stdin[i : i + (1 << 20)]))
+                    streams = {1: bytearray(), 2: bytearray(), 3: bytearray()}
+                    channel = 1
+                    while True:
+                        head = f.read(2)
+                        if len(head) < 2:
+                            break
+                        opcode, size = head[0] & 0x0F, head[1] & 0x7F
+                        if size == 126:
+                            size = struct.unpack(">H", f.read(2))[0]
+                        elif size == 127:
+                            size = struct.unpack(">Q", f.read(8))[0]
+                        mask = f.read(4) if head[1] & 0x80 else b""
+                        payload = f.read(size)
+                        if mask:
+                            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+                        if opcode == 8:  # close
+                            break
+                        if opcode == 9:  # ping -> masked pong
+                            pong_mask = os.urandom(4)
+                            masked = bytes(b ^ pong_mask[i % 4] for i, b in enumerate(payload))
+                            sock.sendall(bytes([0x8A, 0x80 | len(payload)]) + pong_mask + masked)
+                            continue
+                        if opcode in (1, 2) and payload:
+                            channel, payload = payload[0], payload[1:]
+                        if channel in streams:
+                            streams[channel] += payload
+            except socket.timeout as e:
+                cmd = " ".join(argv)[:80]
+                raise RuntimeError(f"API exec in {pod} stalled: nothing received for {timeout:g}s ({cmd})") from e
+            status = json.loads(streams[3] or b"{}")
+            code = 0
+            if status.get("status") == "Failure":
+                causes = (status.get("details") or {}).get("causes") or []
+                code = next((int(c["message"]) for c in causes if c.get("reason") == "ExitCode"), 1)
+            span["exit_code"] = code
+        decode = lambda b: bytes(b).decode("utf-8", errors="replace")  # noqa: E731
+        return code, decode(streams[1]), decode(streams[2])
+
+
+def _ws_frame(payload: bytes) -> bytes:
+    """One masked binary websocket frame (clients must mask), xor-ed as a big int to stay fast for jars."""
+    n = len(payload)
+    if n < 126:
+        head = bytes([0x82, 0x80 | n])
+    elif n < 65536:
+        head = bytes([0x82, 0x80 | 126]) + struct.pack(">H", n)
+    else:
+        head = bytes([0x82, 0x80 | 127]) + struct.pack(">Q", n)
+    mask = os.urandom(4)
+    key = (mask * (n // 4 + 1))[:n]
+    return head + mask + (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+
+
+def _connect_kube_client() -> Optional[KubeClient]:
+    try:
+        client = KubeClient.from_kubeconfig()
+    except Exception as e:  # any kubeconfig/TLS/connection problem: keep working through kubectl
+        print(f"[kube] API client unavailable ({e}); falling back to kubectl")
+        return None
+    print(f"[kube] using the API server at {client.host}:{client.port} directly")
+    return client
+
+
+def _apply_docs(ns: str, docs: List[Tuple[str, str, str]]) -> None:
+    """Apply (kind, name, yaml/json text) documents, in order, through the API client or `kubectl apply`."""
+    if not docs:
+        return
+    if KUBE:
+        for kind, name, text in docs:
+            KUBE.apply(ns, kind, name, text)
+        return
+    _run_input([_exe("kubectl"), "apply", "-f", "-"], "---\n".join(text for _, _, text in docs))
+
+
+def _configmap_doc(ns: str, name: str, data: Dict[str, str]) -> Tuple[str, str, str, str]:
+    """(kind, name, manifest, content hash): what `kubectl create configmap --from-file ... --dry-run -o yaml`
+    renders, without the fork, annotated with the hash of its data."""
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    manifest = {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {"name": name, "namespace": ns, "annotations": {CONFIG_HASH_ANNOTATION: digest}},
+        "data": data,
+    }
+    return "ConfigMap", name, json.dumps(manifest, ensure_ascii=False) + "\n", digest
+
+
+_CONFIGMAP_DOCS: Dict[str, List[Tuple[str, str, str, str]]] = {}
+_CONFIGMAP_DOCS_LOCK = threading.Lock()
+
+
+def _configmap_docs(ns: str) -> List[Tuple[str, str, str, str]]:
+    """The mysql-init and nacos-conf ConfigMaps, rendered once per run (the SQL rewrite is not free)."""
+    with _CONFIGMAP_DOCS_LOCK:
+        if ns not in _CONFIGMAP_DOCS:
+            nacos_props = _docker_dir() / "nacos" / "conf" / "application.properties"
+            if not nacos_props.exists():
+                raise RuntimeError(f"Missing nacos config file: {nacos_props}")
+            _CONFIGMAP_DOCS[ns] = [
+                # mysql init configmap (multiple sql files)
+                _configmap_doc(ns, "ruoyi-mysql-init", _patched_sql()),
+                # nacos application.properties configmap
+                _configmap_doc(ns, "ruoyi-nacos-conf", {"application.properties": nacos_props.read_text(encoding="utf-8")}),
+            ]
+        return _CONFIGMAP_DOCS[ns]
+
+
+def _configmap_data(ns: str, name: str) -> Dict[str, str]:
+    text = next(text for _, cm, text, _ in _configmap_docs(ns) if cm == name)
+    return json.loads(text)["data"]
+
+
+def _live_configmap_hashes(ns: str, names: List[str]) -> Dict[str, str]:
+    """Content-hash annotation of the ConfigMaps currently in the cluster (missing ones are left out)."""
+    if KUBE:
+        live = {n: KUBE.get(ns, "ConfigMap", n) for n in names}
+        return {
+            n: ((obj.get("metadata") or {}).get("annotations") or {}).get(CONFIG_HASH_ANNOTATION, "")
+            for n, obj in live.items()
+            if obj
+        }
+    key = CONFIG_HASH_ANNOTATION.replace(".", "\\.")
+    out = _run_capture(
+        [_exe("kubectl"), "-n", ns, "get", "configmap", *names, "--ignore-not-found", "-o",
+         "jsonpath={range .items[*]}{.metadata.name}={.metadata.annotations." + key + "}{\"\\n\"}{end}"],
+        check=False,
+    )
+    return dict(line.split("=", 1) for line in out.splitlines() if "=" in line)
+
+
+def _stamp_config_checksums(text: str, hashes: Dict[str, str]) -> str:
+    """Add a pod-template annotation per mounted ConfigMap to a Deployment manifest, so that a changed
+    ConfigMap rolls its consumers on apply while an unchanged one leaves them alone."""
+    mounted = [n for n in re.findall(r"configMap:\s*\n\s+name:\s*(\S+)", text) if n in hashes]
+    m = re.search(r"^ *template:[ \t]*\n( *)metadata:[ \t]*\n", text, re.M)
+    if not mounted or not m:
+        return text
+    indent = m.group(1) + "  "
+    lines = "".join(f'{indent}  {CONFIG_CHECKSUM_PREFIX}{n}: "{hashes[n]}"\n' for n in mounted)
+    existing = re.compile(rf"{indent}annotations:[ \t]*\n").match(text, m.end())
+    if existing:
+        return text[: existing.end()] + lines + text[existing.end():]
+    return text[: m.end()] + f"{indent}annotations:\n" + lines + text[m.end():]
+
+
+def _apply_configmaps(ns: str) -> None:
+    # Ensure namespace exists before creating configmaps.
+    # DO NOT apply the whole manifest here, otherwise mysql may start before SQL configmap is populated.
+    configmaps = _configmap_docs(ns)
+    live = _live_configmap_hashes(ns, [name for _, name, _, _ in configmaps])
+    changed = [(kind, name, text) for kind, name, text, digest in configmaps if live.get(name) != digest]
+    for _, name, _, _ in configmaps:
+        if name in live and all(name != c[1] for c in changed):
+            print(f"[configmaps] {name} unchanged, skipping apply")
+    if not changed:
+        return
+    docs = [] if live else [("Namespace", ns, json.dumps({"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": ns}}) + "\n")]
+    _apply_docs(ns, docs + changed)
+
+
+def _dockerfile_sources(dockerfile: Path) -> Optional[List[str]]:
+    """Context paths read by the dockerfile's COPY/ADD, or None if they cannot be determined statically."""
+    text = re.sub(r"\\[ \t]*\r?\n", " ", dockerfile.read_text(encoding="utf-8", errors="replace"))
+    sources: List[str] = []
+    for line in text.splitlines():
+        parts = line.strip().split(None, 1)
+        if len(parts) < 2 or parts[0].upper() not in ("COPY", "ADD"):
+            continue
+        rest = parts[1].strip()
+        try:
+            args = json.loads(rest) if rest.startswith("[") else rest.split()
+        except ValueError:
+            return None
+        if any(a.startswith("--from") for a in args):
+            continue  # copies from another stage/image, not from the context
+        args = [a for a in args if not a.startswith("--")]
+        if len(args) < 2:
+            return None
+        for src in args[:-1]:
+            if "://" in src or "$" in src or src.startswith("<<"):
+                return None
+            sources.append(src)
+    return sources
+
+
+def _context_files(context_dir: Path, dockerfile: Path) -> Optional[List[str]]:
+    """Exactly the files a build needs (dockerfile + COPY/ADD sources), relative to the context."""
+    sources = _dockerfile_sources(dockerfile)
+    if sources is None:
+        return None
+    files = {dockerfile.relative_to(context_dir).as_posix()}
+    for src in sources:
+        src = src.lstrip("/")
+        while src.startswith("./"):
+            src = src[2:]
+        matches = list(context_dir.glob(src)) if any(c in src for c in "*?[") else [context_dir / src]
+        for m in matches:
+            if m.is_dir():
+                for root, _, names in os.walk(m):
+                    files.update((Path(root) / n).relative_to(context_dir).as_posix() for n in names)
+            elif m.exists():
+                files.add(m.relative_to(context_dir).as_posix())
+    return sorted(files)
+
+
+def _dir_size(path: Path) -> int:
+    return sum((Path(root) / n).stat().st_size for root, _, names in os.walk(path) for n in names)
+
+
+def _docker_build(tag: str, context_dir: Path) -> CmdResult:
+    """Build `context_dir/dockerfile` as `tag` with the selected IMAGE_BACKEND.
+
+    With the docker cli backends only the files the dockerfile actually COPYs are sent,
+    streamed as a tar to `docker build -`; the context size is reported per image.
+    """
+    dockerfile = context_dir / "dockerfile"
+    files = _context_files(context_dir, dockerfile)
+    full = _dir_size(context_dir)
+    if files is None:
+        print(f"[context] {tag}: {_fmt_size(full)} (full directory, COPY sources not resolvable)")
+    else:
+        size = sum((context_dir / f).stat().st_size for f in files)
+        print(f"[context] {tag}: {len(files)} files, {_fmt_size(size)} (directory {_fmt_size(full)})")
+
+    if IMAGE_BACKEND == "minikube-build":
+        # dockerfile is given relative to the context, which is copied into the node
+        return _run(
+            [_exe("minikube"), "image", "build", "-t", tag, "-f", dockerfile.name, str(context_dir)],
+            cwd=context_dir,
+        )
+    env = NODE_DOCKER_ENV if IMAGE_BACKEND == "minikube-docker" else None
+    if files is None:
+        return _run(
+            [
+                _exe("docker"),
+                "build",
+                "-t",
+                tag,
+                "-f",
+                str(dockerfile),
+                str(context_dir),
+            ],
+            env=env,
+        )
+
+    def write_context(pipe: object) -> None:
+        with tarfile.open(fileobj=pipe, mode="w|") as tar:
+            for f in files:
+                tar.add(str(context_dir / f), arcname=f, recursive=False)
+
+    return _run_stream([_exe("docker"), "build", "-t", tag, "-f", dockerfile.name, "-"], write_context, env=env)
+
+
+def _build_image(app: AppImage, cache: Optional[BuildCache] = None, context_dir: Optional[Path] = None) -> Optional[CmdResult]:
+    # IMPORTANT:
+    # docker-compose.yml in this repo sets some base images as official names (e.g. mysql:5.7, nginx).
+    # If we run `docker compose build`, it may overwrite/tag official image names locally.
+    # Here we always build with explicit tags matching our K8s manifests.
+    # hash before building so edits made during the build are picked up next run
+    image_hash, tag = _image_hash(app), _image_tag(app)
+    jar = _repo_root() / app.jar if app.jar else None
+    deps_hash = _jar_deps_hash(jar) if jar and jar.exists() else ""
+    # a content tag is built once: a concurrent deploy may have built it while we waited
+    with _host_lock(f"build-{tag}") if CONTENT_TAGS else contextlib.nullcontext():
+        if CONTENT_TAGS and tag in _built_image_ids():
+            print(f"[build] {tag} was just built by a concurrent deploy")
+            res: Optional[CmdResult] = None
+        else:
+            res = _docker_build(tag, context_dir or _docker_dir() / app.docker_subdir)
+    if cache is not None:
+        image_id = _built_image_ids().get(tag, "")
+        hash_field, id_field = _image_cache_fields()
+        # deps_hash: what --hot-swap compares a rebuilt jar against
+        cache.update(app.image, **{hash_field: image_hash, id_field: image_id, "deps_hash": deps_hash})
+    return res
+
+
+def _fmt_size(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.2f}GB"
+
+
+def _jar_layer(entry: str) -> str:
+    """Layer of a fat jar entry: loader and third-party jars change rarely, project code often."""
+    if entry.startswith("org/springframework/boot/loader/"):
+        return "spring-boot-loader"
+    if entry.startswith("BOOT-INF/lib/"):
+        name = entry[len("BOOT-INF/lib/"):]
+        if name.startswith("ruoyi-"):
+            return "ruoyi-libs"
+        if "SNAPSHOT" in name:
+            return "snapshot-dependencies"
+        return "dependencies"
+    return "application"
+
+
+def _extract_entries(zf: zipfile.ZipFile, infos: Iterable[zipfile.ZipInfo], dest: Path) -> int:
+    """Extract entries keeping their zip timestamps (stable layer content); returns bytes written."""
+    total = 0
+    for info in infos:
+        if info.is_dir():
+            continue
+        target = dest / info.filename
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with zf.open(info) as src, target.open("wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        ts = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(target, (ts, ts))
+        total += info.file_size
+    return total
+
+
+def _layered_context(app: AppImage) -> Path:
+    return _cache_dir() / "layered" / app.docker_subdir.replace("/", "-")
+
+
+def _shared_java_libs() -> Dict[str, int]:
+    """Third-party jars (entry -> crc) present with identical content in every built service jar."""
+    shared: Optional[Dict[str, int]] = None
+    for app in APP_IMAGES:
+        jar = _repo_root() / app.jar if app.jar else None
+        if not jar or not jar.exists():
+            continue
+        with zipfile.ZipFile(jar) as zf:
+            libs = {i.filename: i.CRC for i in zf.infolist() if not i.is_dir() and _jar_layer(i.filename) == "dependencies"}
+        shared = libs if shared is None else {k: v for k, v in shared.items() if libs.get(k) == v}
+    return shared or {}
+
+
+def _build_java_base() -> Tuple[str, Dict[str, int]]:
+    """Build (unless present) the base image shared by all layered java images; returns (tag, libs in it)."""
+    libs = _shared_java_libs()
+    jars = [_repo_root() / a.jar for a in APP_IMAGES if a.jar and (_repo_root() / a.jar).exists()]
+    if not jars:
+        raise RuntimeError("No service jar found to build the shared java base image from")
+
+    dockerfile = (
+        "# generated by deploy/minikube/deploy.py (--layered-images), do not edit\n"
+        f"FROM {JAVA_RUNTIME_IMAGE}\n"
+        "RUN mkdir -p /home/ruoyi\n"
+        "WORKDIR /home/ruoyi\n"
+        "COPY dependencies/ ./\n"
+        "COPY spring-boot-loader/ ./\n"
+    )
+    h = hashlib.sha256(dockerfile.encode("utf-8"))
+    h.update(json.dumps(sorted(libs.items())).encode("utf-8"))
+    tag = f"{JAVA_BASE_REPO}:{h.hexdigest()[:12]}"
+    with _host_lock(JAVA_BASE_REPO):  # shared by every namespace; content-addressed, so built once
+        if tag in _built_image_ids():
+            print(f"[layers] shared base {tag} up to date ({len(libs)} jars)")
+            return tag, libs
+
+        ctx = _cache_dir() / "layered" / "base"
+        shutil.rmtree(ctx, ignore_errors=True)
+        ctx.mkdir(parents=True)
+        with zipfile.ZipFile(jars[0]) as zf:
+            infos = zf.infolist()
+            size = _extract_entries(zf, [i for i in infos if i.filename in libs], ctx / "dependencies")
+            _extract_entries(zf, [i for i in infos if _jar_layer(i.filename) == "spring-boot-loader"], ctx / "spring-boot-loader")
+        (ctx / "spring-boot-loader").mkdir(exist_ok=True)
+        (ctx / "dockerfile").write_text(dockerfile, encoding="utf-8")
+        print(f"[layers] building shared base {tag}: {len(libs)} jars, {_fmt_size(size)}")
+        _docker_build(tag, ctx)
+    return tag, libs
+
+
+def _explode_jar(app: AppImage, base: Dict[str, object]) -> Path:
+    """Split a service fat jar into per-layer dirs with a generated dockerfile on top of the shared base."""
+    jar = _repo_root() / app.jar
+    if not jar.exists():
+        raise RuntimeError(f"Missing jar build output: {jar}")
+    base_tag = str(base["tag"])
+    base_libs: Dict[str, int] = base["libs"]  # type: ignore[assignment]
+
+    # No VOLUME: it would give every container an anonymous volume populated with a copy of the whole app.
+    header = [
+        "# generated by deploy/minikube/deploy.py (--layered-images), do not edit",
+        f"FROM {base_tag}",
+        "WORKDIR /home/ruoyi",
+    ]
+    ctx = _layered_context(app)
+    marker = ctx / ".source"
+    header_hash = hashlib.sha256("\n".join(header).encode("utf-8")).hexdigest()[:16]
+    source = f"{_hash_path(jar)} {header_hash}"
+    if marker.exists() and marker.read_text(encoding="utf-8") == source:
+        return ctx
+
+    shutil.rmtree(ctx, ignore_errors=True)
+    ctx.mkdir(parents=True)
+    sizes: Dict[str, int] = {}
+    with zipfile.ZipFile(jar) as zf:
+        groups: Dict[str, List[zipfile.ZipInfo]] = {layer: [] for layer in JAR_LAYERS}
+        for info in zf.infolist():
+            layer = _jar_layer(info.filename)
+            if layer == "spring-boot-loader" or base_libs.get(info.filename) == info.CRC:
+                continue  # already in the shared base
+            groups[layer].append(info)
+        for layer, infos in groups.items():
+            sizes[layer] = _extract_entries(zf, infos, ctx / layer)
+
+    lines = header + [f"COPY {layer}/ ./" for layer in JAR_LAYERS if sizes[layer]]
+    lines.append('ENTRYPOINT ["java","org.springframework.boot.loader.JarLauncher"]')
+    (ctx / "dockerfile").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    marker.write_text(source, encoding="utf-8")
+    print(
+        f"[layers] {app.image}: "
+        + ", ".join(f"{layer} {_fmt_size(sizes[layer])}" for layer in JAR_LAYERS)
+        + f" (+{len(base_libs)} shared jars in {base_tag})"
+    )
+    return ctx
+
+
+def _appcds_dir(app: AppImage) -> Path:
+    return _cache_dir() / "appcds" / app.docker_subdir.replace("/", "-")
+
+
+def _appcds_context(app: AppImage) -> Path:
+    """Unpack a fat jar into a plain-classpath build context whose dockerfile trains a CDS archive.
+
+    Classes of the nested-jar loader can not be archived, so the libraries are copied out as-is and the
+    application classes repacked into app.jar; training and runtime share the classpath through app.args.
+    """
+    jar = _repo_root() / app.jar
+    if not jar.exists():
+        raise RuntimeError(f"Missing jar build output: {jar}")
+    ctx = _appcds_dir(app)
+    marker = ctx / ".source"
+    source = _hash_path(jar)
+    if marker.exists() and marker.read_text(encoding="utf-8") == source:
+        return ctx
+
+    shutil.rmtree(ctx, ignore_errors=True)
+    ctx.mkdir(parents=True)
+    with zipfile.ZipFile(jar) as zf:
+        manifest = zf.read("META-INF/MANIFEST.MF").decode("utf-8", errors="replace")
+        start_class = re.search(r"^Start-Class:\s*(\S+)", manifest, re.M)
+        if not start_class:
+            raise RuntimeError(f"{jar} has no Start-Class (not a spring boot jar?)")
+        libs = sorted(
+            (i for i in zf.infolist() if i.filename.startswith("BOOT-INF/lib/") and not i.is_dir()), key=lambda i: i.filename
+        )
+        size = _extract_entries(zf, libs, ctx)
+        classes = [i for i in zf.infolist() if i.filename.startswith("BOOT-INF/classes/") and not i.is_dir()]
+        with zipfile.ZipFile(ctx / "app.jar", "w", zipfile.ZIP_DEFLATED) as out:
+            for info in classes:
+                entry = zipfile.ZipInfo(info.filename[len("BOOT-INF/classes/"):], info.date_time)
+                entry.compress_type = zipfile.ZIP_DEFLATED
+                out.writestr(entry, zf.read(info))
+    classpath = ":".join(["app.jar"] + [i.filename for i in libs])
+    (ctx / "app.args").write_text(f"-cp {classpath}\n{start_class.group(1)}\n", encoding="utf-8")
+    flags = " ".join(APPCDS_JVM_FLAGS)
+    entrypoint = json.dumps(["java", "-XX:SharedArchiveFile=app.jsa", *APPCDS_JVM_FLAGS, "@app.args"])
+    (ctx / "dockerfile").write_text(
+        "# generated by deploy/minikube/deploy.py (--appcds), do not edit\n"
+        f"FROM {JAVA_RUNTIME_IMAGE}\n"
+        "WORKDIR /home/ruoyi\n"
+        "COPY BOOT-INF/ BOOT-INF/\n"
+        "COPY app.jar app.args ./\n"
+        "# training start without nacos/mysql; the classes loaded until it exits are archived\n"
+        f"RUN timeout -s TERM {APPCDS_TRAINING_SEC} java -XX:ArchiveClassesAtExit=app.jsa {flags} @app.args"
+        " > /tmp/cds-training.log 2>&1;"
+        " test -s app.jsa || { tail -n 30 /tmp/cds-training.log; exit 1; }\n"
+        f"ENTRYPOINT {entrypoint}\n",
+        encoding="utf-8",
+    )
+    marker.write_text(source, encoding="utf-8")
+    print(f"[appcds] {app.image}: {len(libs)} jars, {_fmt_size(size)}, {len(classes)} application entries, main {start_class.group(1)}")
+    return ctx
+
+
+def _minikube_load(img: str, cache: Optional[BuildCache] = None, key: Optional[str] = None) -> Optional[CmdResult]:
+    """Load an image into the node; `key` is its build-cache entry (default: the tag). Tags that never change
+    content (base/seed images, content-tagged app images) are not loaded again when a concurrent deploy
+    loaded them while we waited for the lock."""
+    res = None
+    with _host_lock(f"load-{img}"):
+        if (cache is None or CONTENT_TAGS) and img in (_minikube_image_tags() or set()):
+            print(f"[load] {img} already in minikube (loaded by a concurrent deploy)")
+        else:
+            res = _run([_exe("minikube"), "image", "load", img])
+    if cache is not None:
+        image_id = _run_capture([_exe("docker"), "image", "inspect", "--format", "{{.Id}}", img], check=False).strip()
+        if image_id:
+            cache.update(key or img, loaded_id=image_id)
+    return res
+
+
+def _manifest_docs() -> List[Tuple[str, str, str]]:
+    """Split k8s/all.yaml into (kind, metadata.name, text) documents."""
+    text = _k8s_yaml().read_text(encoding="utf-8")
+    docs = []
+    for doc in re.split(r"^---[ \t]*$", text, flags=re.M):
+        if not doc.strip():
+            continue
+        kind = re.search(r"^kind:\s*(\S+)", doc, re.M)
+        name = re.search(r"^metadata:\s*\n\s+name:\s*(\S+)", doc, re.M)
+        docs.append((kind.group(1) if kind else "", name.group(1) if name else "", doc.strip("\n") + "\n"))
+    return docs
+
+
+def _kubectl_apply_services(ns: str, services: Iterable[Service], include_namespace: bool = False) -> None:
+    """Apply only the Service/Deployment documents of the given services (plus the Namespace if asked)."""
+    _apply_docs(ns, _render_service_docs(ns, services, include_namespace))
+
+
+def _render_service_docs(ns: str, services: Iterable[Service], include_namespace: bool = False) -> List[Tuple[str, str, str]]:
+    """The Service/Deployment documents of the given services as applied to ns."""
+    names = {s.deployment for s in services}
+    docs = [
+        (kind, name, text)
+        for kind, name, text in _manifest_docs()
+        if (kind in ("Service", "Deployment") and name in names) or (include_namespace and kind == "Namespace")
+    ]
+    rendered = []
+    for kind, name, text in docs:
+        if kind == "Deployment":
+            text = _render_deployment(ns, name, text)
+        rendered.append((kind, ns if kind == "Namespace" else name, _render_namespace(ns, kind, text)))
+    return rendered
+
+
+def _render_namespace(ns: str, kind: str, text: str) -> str:
+    """Move a manifest document from MANIFEST_NAMESPACE to ns."""
+    if ns == MANIFEST_NAMESPACE:
+        return text
+    if kind == "Namespace":
+        return re.sub(r"^(metadata:\s*\n\s+name:[ \t]*)\S+", lambda m: m.group(1) + ns, text, count=1, flags=re.M)
+    text = re.sub(r"^(  namespace:[ \t]*)\S+", lambda m: m.group(1) + ns, text, count=1, flags=re.M)
+    # a node port can only be taken once per cluster: other namespaces get a free one assigned
+    return re.sub(r"^[ \t]+nodePort:.*\n", "", text, flags=re.M)
+
+
+def _render_deployment(ns: str, name: str, text: str) -> str:
+    """A Deployment manifest as applied: the namespace's app image, config checksums, the --mysql-seed init
+    container, --resource-profile requests/limits, startupProbes of the java services, and in --hot-swap
+    mode the jar supervisor."""
+    image_app = next((a for s in SERVICES if s.deployment == name for a in APP_IMAGES if a.image == s.image), None)
+    if image_app:
+        tag = _image_tag(image_app)
+        text = re.sub(r"^([ \t]+image:[ \t]*)\S+", lambda m: m.group(1) + tag, text, count=1, flags=re.M)
+    if "configMap:" in text:
+        hashes = {cm: digest for _, cm, _, digest in _configmap_docs(ns) if cm in ROLLING_CONFIGMAPS}
+        text = _stamp_config_checksums(text, hashes)
+    if MYSQL_SEED and name == "ruoyi-mysql":
+        text = _stamp_mysql_seed(text, _mysql_seed_tag(ns))
+    app = _java_app(name)
+    if name in RESOURCE_PROFILE:
+        text = _stamp_resources(text, RESOURCE_PROFILE[name])
+    if app:
+        text = _stamp_startup_probe(text, _startup_budget_sec(name))
+    if HOT_SWAP and app:
+        text = _stamp_hot_swap(text, Path(app.jar).name)
+        # the content tag changes with every jar; a swap replaces the jar without a new pod spec
+        spec = re.sub(r"^([ \t]+image:[ \t]*)\S+", r"\1-", text, count=1, flags=re.M)
+        digest = hashlib.sha256(spec.encode("utf-8")).hexdigest()[:16]
+        text = re.sub(r"^metadata:[ \t]*\n", lambda m: f'{m.group(0)}  annotations:\n    {SPEC_HASH_ANNOTATION}: "{digest}"\n', text, count=1, flags=re.M)
+    return text
+
+
+def _java_app(deployment: str) -> Optional[AppImage]:
+    image = next((s.image for s in SERVICES if s.deployment == deployment), None)
+    return next((a for a in APP_IMAGES if a.image == image and a.jar), None)
+
+
+def _hot_swap_supervisor(jar_name: str) -> str:
+    """Container command: run the jar, and run it again if the JVM was stopped for a hot swap.
+
+    Any other JVM exit ends the container as before, so crash loops still show up as restarts.
+    """
+    return (
+        f"cd {HOT_SWAP_DIR}\n"
+        "trap 'kill -TERM $pid 2>/dev/null; wait $pid; exit 143' TERM INT\n"
+        "while :; do\n"
+        f"  rm -f {HOT_SWAP_MARKER}\n"
+        f"  java -jar {jar_name} & pid=$!\n"
+        f"  echo $pid > {HOT_SWAP_PID_FILE}\n"
+        "  wait $pid; code=$?\n"
+        f"  [ -f {HOT_SWAP_MARKER} ] || exit $code\n"
+        "done\n"
+    )
+
+
+def _stamp_hot_swap(text: str, jar_name: str) -> str:
+    """Insert the supervisor `command` after the container's image line (json is valid yaml flow style)."""
+    m = re.search(r"^( *)image:.*\n", text, re.M)
+    if not m:
+        return text
+    command = json.dumps(["sh", "-c", _hot_swap_supervisor(jar_name)])
+    return text[: m.end()] + f"{m.group(1)}command: {command}\n" + text[m.end():]
+
+
+def _set_probe_field(text: str, probe: str, field: str, value: int) -> str:
+    """Set e.g. readinessProbe.initialDelaySeconds of the (first) container."""
+    pattern = rf"^( *){probe}:[ \t]*\n(?:\1 +\S.*\n)*?\1 +{field}:[ \t]*\S+"
+    return re.sub(pattern, lambda m: m.group(0)[: m.group(0).rindex(":") + 1] + f" {value}", text, count=1, flags=re.M)
+
+
+def _startup_budget_sec(deployment: str) -> int:
+    """How long a startupProbe lets the service start: 3x its last measured start-up, in whole minutes."""
+    try:
+        entry = json.loads(_startup_times_path().read_text(encoding="utf-8")).get(deployment) or {}
+    except (OSError, ValueError):
+        entry = {}
+    measured = entry.get(_java_image_mode()) or max(entry.values(), default=None)
+    if measured is None:
+        return STARTUP_PROBE_DEFAULT_SEC
+    return -(-max(STARTUP_PROBE_MIN_SEC, 3 * measured) // 60) * 60
+
+
+def _stamp_startup_probe(text: str, budget_sec: int) -> str:
+    """Add a startupProbe with the readinessProbe's check, polled often for budget_sec.
+
+    Readiness and liveness only start once it succeeds, so their fixed initial delays are dropped:
+    the pod turns Ready as soon as the service answers instead of after a guessed delay.
+    """
+    m = re.search(r"^( *)readinessProbe:[ \t]*\n((?:\1 +\S.*\n)+)", text, re.M)
+    if not m:
+        return text
+    indent = m.group(1)
+    check: List[str] = []
+    keep = False
+    for line in m.group(2).splitlines(keepends=True):
+        key = re.match(rf"{indent}  (\w+):", line)
+        if key:
+            keep = key.group(1) in ("httpGet", "tcpSocket", "exec", "grpc")
+        if keep:
+            check.append(line)
+    probe = (
+        f"{indent}startupProbe:\n"
+        + "".join(check)
+        + f"{indent}  periodSeconds: {STARTUP_PROBE_PERIOD_SEC}\n"
+        + f"{indent}  timeoutSeconds: 2\n"
+        + f"{indent}  failureThreshold: {-(-budget_sec // STARTUP_PROBE_PERIOD_SEC)}\n"
+    )
+    text = text[: m.start()] + probe + text[m.start():]
+    for kind in ("readinessProbe", "livenessProbe"):
+        text = _set_probe_field(text, kind, "initialDelaySeconds", 0)
+    return text
+
+
+def _stamp_resources(text: str, profile: dict) -> str:
+    """Replace the (first) container's resources with a resource profile entry; its `java_opts` become
+    JAVA_TOOL_OPTIONS, which every java launch in the container (entrypoint, --hot-swap, --appcds) picks up.
+    A container without a resources or env block gets one."""
+    m = re.search(r"^ *containers:[ \t]*\n( *)- ", text, re.M)
+    if not m:
+        return text
+    field = m.group(1) + "  "
+    # the first container runs until the next line indented no deeper than its list item
+    end = re.compile(rf"^ {{0,{len(m.group(1))}}}\S", re.M).search(text, m.end())
+    start, stop = m.start(1), end.start() if end else len(text)
+    container = text[start:stop]
+
+    lines = [f"{field}resources:\n"]
+    for kind in ("requests", "limits"):
+        values = profile.get(kind) or {}
+        if values:
+            lines.append(f"{field}  {kind}:\n")
+            lines.extend(f"{field}    {k}: {v}\n" for k, v in sorted(values.items()))
+    resources = "".join(lines)
+    container, found = re.subn(rf"^{field}resources:[ \t]*\n(?:{field} +\S.*\n)*", lambda _: resources, container, count=1, flags=re.M)
+    if not found:
+        container += resources
+
+    opts = profile.get("java_opts")
+    if opts:
+        env = re.search(rf"^{field}env:[ \t]*\n( *)- ", container, re.M)
+        item = env.group(1) if env else field + "  "
+        var = f"{item}- name: JAVA_TOOL_OPTIONS\n{item}  value: {json.dumps(opts)}\n"
+        if env:
+            container = container[: env.start(1)] + var + container[env.start(1):]
+        else:
+            container += f"{field}env:\n{var}"
+    return text[:start] + container + text[stop:]
+
+
+def _json_stream(pipe: Iterable[str]) -> Iterator[dict]:
+    """Decode the concatenated, pretty-printed json objects written by `kubectl get --watch -o json`."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    for line in pipe:
+        buf += line
+        # top-level objects end with a bare closing brace; only then try to decode
+        if line.rstrip() != "}":
+            continue
+        try:
+            obj, _ = decoder.raw_decode(buf.strip())
+        except ValueError:
+            continue
+        buf = ""
+        yield obj
+
+
+def _deployment_ready(d: dict) -> bool:
+    """Same criteria as `kubectl rollout status`."""
+    meta, spec, st = d.get("metadata", {}), d.get("spec", {}), d.get("status", {})
+    if st.get("observedGeneration", 0) < meta.get("generation", 0):
+        return False
+    replicas = spec.get("replicas", 1)
+    updated = st.get("updatedReplicas", 0)
+    return updated >= replicas and st.get("replicas", 0) <= updated and st.get("availableReplicas", 0) >= updated
+
+
+def _pod_problem(pod: dict) -> Tuple[Optional[str], bool]:
+    """(waiting reason worth reporting, whether it is fatal) for a pod."""
+    for cs in (pod.get("status") or {}).get("containerStatuses") or []:
+        waiting = (cs.get("state") or {}).get("waiting") or {}
+        reason = waiting.get("reason")
+        if not reason or reason == "ContainerCreating":
+            continue
+        restarts = cs.get("restartCount", 0)
+        if reason in FATAL_WAIT_REASONS:
+            return f"{reason}: {waiting.get('message', '')}".rstrip(": "), True
+        if reason == "CrashLoopBackOff":
+            return f"CrashLoopBackOff (restarts {restarts})", restarts >= MAX_RESTARTS
+        return reason, False
+    return None, False
+
+
+def _k8s_time(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _pod_startup_sec(pod: dict) -> Optional[float]:
+    """Seconds from the current containers' start to the pod turning Ready (status timestamps, 1s resolution)."""
+    status = pod.get("status") or {}
+    ready = next((c for c in status.get("conditions") or [] if c.get("type") == "Ready" and c.get("status") == "True"), None)
+    started = [_k8s_time(((cs.get("state") or {}).get("running") or {}).get("startedAt")) for cs in status.get("containerStatuses") or []]
+    ready_at = _k8s_time(ready.get("lastTransitionTime")) if ready else None
+    if ready_at is None or not started or None in started or ready_at < max(started):
+        return None
+    return ready_at - max(started)
+
+
+def _java_image_mode() -> str:
+    return "appcds" if APPCDS else "layered" if LAYERED_IMAGES else "jar"
+
+
+def _startup_times_path() -> Path:
+    return _cache_dir() / "startup-times.json"
+
+
+_STARTUP_LOCK = threading.Lock()
+
+
+def _record_startup_times(times: Dict[str, float]) -> None:
+    """Remember start-up time per deployment and java image mode; print it next to the other modes' last value."""
+    if not times:
+        return
+    with _STARTUP_LOCK:
+        path = _startup_times_path()
+        try:
+            known = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            known = {}
+        for d, sec in sorted(times.items()):
+            mode = _java_image_mode()
+            entry = known.setdefault(d, {})
+            others = ", ".join(f"{m} {v:.0f}s" for m, v in sorted(entry.items()) if m != mode)
+            print(f"[startup] {d}: {sec:.0f}s start-to-ready ({mode}{'; last ' + others if others else ''})")
+            entry[mode] = round(sec, 1)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(known, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+class ReadinessMonitor:
+    """Waits for Deployments by following watch streams instead of serial rollout status calls.
+
+    kubectl can only watch one resource type per call, so there is one stream each for deployments,
+    replicasets and pods, merged into a single event loop. Each deployment is reported the moment it is
+    ready; a pod of its current ReplicaSet stuck in an unrecoverable state fails the wait right away with
+    its last log lines (pods of the previous ReplicaSet, still terminating after a roll, are ignored).
+    """
+
+    KINDS = ("Deployment", "ReplicaSet", "Pod")
+
+    def __init__(self, ns: str, deployments: Iterable[str], timeout_sec: int) -> None:
+        self.ns = ns
+        self.pending = list(dict.fromkeys(deployments))
+        self.deployments = list(self.pending)
+        self.timeout_sec = timeout_sec
+        self.events: "queue.Queue[Tuple[str, Optional[dict]]]" = queue.Queue()
+        self.deploys: Dict[str, dict] = {}
+        self.replicasets: Dict[str, dict] = {}
+        self.pods: Dict[str, dict] = {}
+        self.reported: Dict[str, Optional[str]] = {}
+        # start-to-ready of pods created during this run, per deployment
+        self.startups: Dict[str, float] = {}
+        self.closers: Dict[str, Callable[[], None]] = {}
+        # why the last stream of a kind ended: kubectl's stderr, or the API's ERROR event
+        self.errors: Dict[str, Callable[[], str]] = {}
+        self.started: Dict[str, float] = {}
+        self.quick_exits: Dict[str, int] = {}
+
+    def _start(self, kind: str) -> None:
+        if kind in self.closers:
+            self.closers[kind]()
+        self.started[kind] = time.time()
+        if KUBE:
+            stream, self.closers[kind] = KUBE.watch(self.ns, kind)
+            self.errors[kind] = lambda: ""
+        else:
+            stream, self.closers[kind] = self._kubectl_watch(kind)
+
+        def pump() -> None:
+            for obj in stream:
+                self.events.put((kind, obj))
+            self.events.put((kind, None))  # stream ended (watch timeout, api server restart, ...)
+
+        threading.Thread(target=pump, name=f"watch-{kind}", daemon=True).start()
+
+    def _kubectl_watch(self, kind: str) -> Tuple[Iterator[dict], Callable[[], None]]:
+        plural = KUBE_RESOURCES[kind][1]
+        cmd = [_exe("kubectl"), "-n", self.ns, "get", plural, "--watch", "--output-watch-events", "-o", "json"]
+        err = tempfile.TemporaryFile()
+        with TRACE.span(_cmd_label(cmd), "cmd", cmd=" ".join(cmd)):
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, text=True, encoding="utf-8", errors="replace")
+
+        def close() -> None:
+            if p.poll() is None:
+                p.terminate()
+            try:
+                p.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+            err.close()
+
+        def stderr() -> str:
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                p.wait(timeout=1)
+            err.seek(0)
+            return err.read().decode("utf-8", errors="replace").strip()[-500:]
+
+        self.errors[kind] = stderr
+        return _json_stream(p.stdout), close
+
+    def _stop(self) -> None:
+        for close in self.closers.values():
+            close()
+
+    def _restart_delay(self, kind: str) -> float:
+        """Backoff before resuming an ended stream; raises when it keeps ending right after it starts."""
+        quick = time.time() - self.started[kind] < WATCH_QUICK_EXIT_SEC
+        n = self.quick_exits[kind] = self.quick_exits.get(kind, 0) + 1 if quick else 0
+        if n >= WATCH_MAX_QUICK_EXITS:
+            raise RuntimeError(
+                f"{kind} watch in namespace {self.ns} ended right after starting {n} times in a row: "
+                + (self.errors[kind]() or "no error output")
+            )
+        return WATCH_RESTART_BACKOFF_SEC * 2**n
+
+    def _template_hash(self, deployment: str) -> Optional[str]:
+        """pod-template-hash of the deployment's current ReplicaSet (the one of its current revision)."""
+        meta = (self.deploys.get(deployment) or {}).get("metadata") or {}
+        revision = (meta.get("annotations") or {}).get(DEPLOYMENT_REVISION_ANNOTATION)
+        for rs in self.replicasets.values():
+            rs_meta = rs.get("metadata") or {}
+            owned = any(r.get("kind") == "Deployment" and r.get("name") == deployment for r in rs_meta.get("ownerReferences") or [])
+            if owned and revision and (rs_meta.get("annotations") or {}).get(DEPLOYMENT_REVISION_ANNOTATION) == revision:
+                return (rs_meta.get("labels") or {}).get("pod-template-hash")
+        return None
+
+    def _owner(self, pod: dict, names: Optional[List[str]] = None) -> Optional[str]:
+        """The (by default still pending) deployment a pod of the current ReplicaSet belongs to."""
+        labels = (pod.get("metadata") or {}).get("labels") or {}
+        for name in self.pending if names is None else names:
+            selector = (((self.deploys.get(name) or {}).get("spec") or {}).get("selector") or {}).get("matchLabels")
+            if selector is None:
+                selector = {"app": name}  # all.yaml convention, until the deployment itself was seen
+            if selector and all(labels.get(k) == v for k, v in selector.items()):
+                # the previous ReplicaSet's pods (or pods of a ReplicaSet not seen yet) say nothing about this rollout
+                if "pod-template-hash" in labels and labels["pod-template-hash"] != self._template_hash(name):
+                    return None
+                return name
+        return None
+
+    def _fail(self, deployment: str, pod: dict, problem: str) -> RuntimeError:
+        name = pod["metadata"]["name"]
+        logs = ""
+        for previous in (True, False):
+            if KUBE:
+                logs = KUBE.logs(self.ns, name, tail=30, previous=previous).strip()
+            else:
+                cmd = [_exe("kubectl"), "-n", self.ns, "logs", name, "--all-containers", "--tail=30"]
+                if previous:
+                    cmd.append("--previous")
+                logs = _run_capture(cmd, check=False).strip()
+            if logs:
+                break
+        return RuntimeError(
+            f"Deployment {deployment} can not become ready: pod {name} is {problem}\n"
+            f"--- last log lines of {name} ---\n{logs or '(no logs)'}"
+        )
+
+    def wait(self) -> None:
+        if not self.pending:
+            return
+        start = time.time()
+        deadline = start + self.timeout_sec
+        for kind in self.KINDS:
+            self._start(kind)
+        restarts: Dict[str, float] = {}
+        stores = {"Deployment": self.deploys, "ReplicaSet": self.replicasets, "Pod": self.pods}
+        try:
+            while self.pending:
+                now = time.time()
+                left = deadline - now
+                if left <= 0:
+                    raise RuntimeError(self._timeout_message())
+                for kind, at in list(restarts.items()):
+                    if at <= now:
+                        del restarts[kind]
+                        self._start(kind)  # resume the watch; it lists current objects again first
+                try:
+                    kind, event = self.events.get(timeout=max(0.05, min([left, 5] + [at - now for at in restarts.values()])))
+                except queue.Empty:
+                    continue
+                if event is None:
+                    restarts[kind] = time.time() + self._restart_delay(kind)
+                    continue
+                obj = event.get("object") or {}
+                if event.get("type") == "ERROR":
+                    # e.g. 410 Gone: the stream ends next and is resumed; keep the reason in case it keeps failing
+                    message = f"{obj.get('code', '?')} {obj.get('reason', '')}: {obj.get('message', '')}"
+                    self.errors[kind] = lambda m=message: m
+                    continue
+                name = (obj.get("metadata") or {}).get("name", "")
+                store = stores[kind]
+                if event.get("type") == "DELETED":
+                    store.pop(name, None)
+                else:
+                    store[name] = obj
+                self._check(start)
+        finally:
+            self._stop()
+        _record_startup_times(self.startups)
+
+    def _note_startup(self, pod: dict) -> None:
+        """Keep start-to-ready of java service pods created during this run (with some slack for the node's clock)."""
+        meta = pod["metadata"]
+        created = _k8s_time(meta.get("creationTimestamp"))
+        if meta.get("deletionTimestamp") or created is None or created < TRACE.t0 - 10:
+            return
+        sec = _pod_startup_sec(pod)
+        owner = self._owner(pod, self.deployments)
+        if sec is not None and owner and _java_app(owner):
+            self.startups[owner] = sec
+
+    def _check(self, start: float) -> None:
+        for pod in self.pods.values():
+            self._note_startup(pod)
+        for d in list(self.pending):
+            if d in self.deploys and _deployment_ready(self.deploys[d]):
+                startup = self.startups.get(d)
+                self.pending.remove(d)
+                now = time.time()
+                TRACE.add(f"rollout:{d}", "rollout", start, now, **({"startup_sec": startup} if startup is not None else {}))
+                print(f"[ready] {d} ({now - start:.1f}s{'' if startup is None else f', pod started in {startup:.0f}s'})")
+        for pod in list(self.pods.values()):
+            owner = self._owner(pod)
+            if owner is None:
+                continue
+            problem, fatal = _pod_problem(pod)
+            pod_name = pod["metadata"]["name"]
+            if problem != self.reported.get(pod_name):
+                self.reported[pod_name] = problem
+                if problem:
+                    print(f"[pods] {pod_name}: {problem}")
+            if fatal:
+                raise self._fail(owner, pod, problem or "failing")
+
+    def _timeout_message(self) -> str:
+        lines = [f"Timed out after {self.timeout_sec}s waiting for: {', '.join(self.pending)}"]
+        for pod in self.pods.values():
+            if self._owner(pod):
+                phase = (pod.get("status") or {}).get("phase", "?")
+                problem, _ = _pod_problem(pod)
+                lines.append(f"  {pod['metadata']['name']}: {phase}{' / ' + problem if problem else ''}")
+        return "\n".join(lines)
+
+
+def _wait_rollout(ns: str, deployments: Iterable[str], timeout_sec: int = 600) -> None:
+    ReadinessMonitor(ns, deployments, timeout_sec).wait()
+
+
+def _live_pods(ns: str, label_selector: str) -> List[dict]:
+    # Skip pods on their way out: after a config-triggered roll the old pod lingers while terminating.
+    if KUBE:
+        pods = (KUBE.get(ns, "Pod", labelSelector=label_selector) or {}).get("items") or []
+    else:
+        out = _run_capture([_exe("kubectl"), "-n", ns, "get", "pod", "-l", label_selector, "-o", "json"])
+        pods = json.loads(out or "{}").get("items") or []
+    return [p for p in pods if not p["metadata"].get("deletionTimestamp")]
+
+
+def _get_single_pod_name(ns: str, label_selector: str) -> str:
+    live = _live_pods(ns, label_selector)
+    live.sort(key=lambda p: (p.get("status") or {}).get("phase") != "Running")
+    name = live[0]["metadata"]["name"] if live else ""
+    if not name:
+        raise RuntimeError(f"No pod found for selector: {label_selector} in ns={ns}")
+    return name
+
+
+def _pod_exec(
+    ns: str,
+    pod: str,
+    argv: List[str],
+    check: bool = True,
+    capture: bool = False,
+    stdin: Optional[bytes] = None,
+    timeout: float = KUBE_EXEC_TIMEOUT_SEC,
+) -> Tuple[int, str]:
+    """(exit code, stdout) of `kubectl exec pod -- argv`; stdout goes to the console unless captured.
+    With the API backend the exec fails after `timeout` seconds without any data."""
+    if KUBE:
+        code, out, err = KUBE.exec(ns, pod, argv, stdin=stdin, timeout=timeout)
+        sys.stderr.write(err)
+        if not capture:
+            sys.stdout.write(out)
+            out = ""
+    else:
+        p = _subprocess(
+            [_exe("kubectl"), "-n", ns, "exec", *(["-i"] if stdin is not None else []), pod, "--"] + argv,
+            input=stdin,
+            stdout=subprocess.PIPE if capture else sys.stdout,
+            stderr=sys.stderr,
+        )
+        code, out = p.returncode, (p.stdout or b"").decode("utf-8", errors="replace")
+    if check and code != 0:
+        raise RuntimeError(f"Command failed ({code}): kubectl exec {pod} -- {' '.join(argv)}")
+    return code, out
+
+
+def _mysql_exec(ns: str, pod: str, shell_cmd: str, check: bool = True) -> CmdResult:
+    argv = ["sh", "-lc", shell_cmd]
+    code, _ = _pod_exec(ns, pod, argv, check=check)
+    return CmdResult(cmd=argv, returncode=code)
+
+
+def _mysql_sql(ns: str, pod: str, database: str, sql: str, check: bool = True) -> CmdResult:
+    # Run a single SQL statement (safe quoting for our fixed strings)
+    argv = [
+        "mysql",
+        "--default-character-set=utf8mb4",
+        "-uroot",
+        "-ppassword",
+        f"--database={database}",
+        "-e",
+        sql,
+    ]
+    code, _ = _pod_exec(ns, pod, argv, check=check)
+    return CmdResult(cmd=argv, returncode=code)
+
+
+@dataclass(frozen=True)
+class NacosConfig:
+    data_id: str
+    group: str
+    content: str
+    type: str = ""
+    tenant: str = ""
+
+
+_SQL_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "0": "\0", "b": "\b", "Z": "\x1a"}
+
+
+def _sql_tuple(text: str, start: int) -> Tuple[List[Optional[str]], int]:
+    """Parse one `(v1, 'v2', NULL, ...)` value tuple of a mysqldump INSERT starting at text[start] == "(".
+
+    Returns the values (string literals unescaped, NULL as None, numbers as text) and the index after ")".
+    """
+    values: List[Optional[str]] = []
+    i, n = start + 1, len(text)
+    while i < n:
+        while text[i] in " \t\r\n,":
+            i += 1
+        if text[i] == ")":
+            return values, i + 1
+        if text[i] == "'":
+            buf: List[str] = []
+            i += 1
+            while True:
+                c = text[i]
+                if c == "\\":
+                    buf.append(_SQL_ESCAPES.get(text[i + 1], text[i + 1]))
+                    i += 2
+                elif c == "'" and text[i + 1 : i + 2] == "'":
+                    buf.append("'")
+                    i += 2
+                elif c == "'":
+                    i += 1
+                    break
+                else:
+                    buf.append(c)
+                    i += 1
+            values.append("".join(buf))
+        else:
+            m = re.compile(r"[^,)\s]+").match(text, i)
+            values.append(None if m.group(0).upper() == "NULL" else m.group(0))
+            i = m.end()
+    raise ValueError("unterminated sql value tuple")
+
+
+def _nacos_configs_from_sql(sql: str) -> List[NacosConfig]:
+    """config_info rows of a (patched) Nacos sql dump: the desired state of every data_id it ships."""
+    configs: List[NacosConfig] = []
+    for m in re.finditer(r"insert\s+into\s+`?config_info`?\s*\(([^)]*)\)\s*values\s*", sql, re.I):
+        columns = [c.strip(" `") for c in m.group(1).split(",")]
+        i = m.end()
+        while i < len(sql) and sql[i] == "(":
+            values, i = _sql_tuple(sql, i)
+            row = dict(zip(columns, values))
+            configs.append(
+                NacosConfig(
+                    data_id=row["data_id"] or "",
+                    group=row.get("group_id") or "DEFAULT_GROUP",
+                    content=row.get("content") or "",
+                    type=row.get("type") or "",
+                    tenant=row.get("tenant_id") or "",
+                )
+            )
+            while i < len(sql) and sql[i] in ", \t\r\n":
+                i += 1
+    return configs
+
+
+class NacosClient:
+    """Nacos open API (configs, service instances) over one keep-alive connection."""
+
+    def __init__(self, base_url: str) -> None:
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname or "127.0.0.1", url.port or 80
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def _request(self, method: str, params: Dict[str, str], api: str = NACOS_CONFIG_API) -> Tuple[int, str]:
+        body = urllib.parse.urlencode(params)
+        path, data = (f"{api}?{body}", None) if method == "GET" else (api, body)
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if data else {}
+        with TRACE.span(f"nacos {method}", "api", data_id=params.get("dataId", "")) as span:
+            for attempt in (1, 2):
+                try:
+                    self.conn.request(method, path, body=data, headers=headers)
+                    resp = self.conn.getresponse()
+                    text = resp.read().decode("utf-8", errors="replace")
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    self.conn.close()  # reconnects on the next request
+                    if attempt == 2:
+                        raise
+            span["status"] = resp.status
+        return resp.status, text
+
+    def get(self, cfg: NacosConfig) -> Optional[str]:
+        status, text = self._request("GET", {"dataId": cfg.data_id, "group": cfg.group, "tenant": cfg.tenant})
+        if status == 404:
+            return None
+        if status != 200:
+            raise RuntimeError(f"Nacos get {cfg.data_id} failed ({status}): {text[:200]}")
+        return text
+
+    def publish(self, cfg: NacosConfig) -> None:
+        params = {"dataId": cfg.data_id, "group": cfg.group, "content": cfg.content, "tenant": cfg.tenant}
+        if cfg.type:
+            params["type"] = cfg.type
+        status, text = self._request("POST", params)
+        if status != 200 or text.strip() != "true":
+            raise RuntimeError(f"Nacos publish {cfg.data_id} failed ({status}): {text[:200]}")
+
+    def instances(self, service: str) -> List[dict]:
+        """Registered instances of a discovery service (none while it is unknown to Nacos)."""
+        status, text = self._request("GET", {"serviceName": service}, NACOS_NAMING_API)
+        if status != 200:
+            return []
+        return json.loads(text).get("hosts") or []
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+@contextlib.contextmanager
+def _port_forward(ns: str, target: str, remote_port: int, timeout_sec: int = 30) -> Iterator[int]:
+    """`kubectl port-forward` to a random local port for the duration of the block; yields that port."""
+    cmd = [_exe("kubectl"), "-n", ns, "port-forward", target, f":{remote_port}"]
+    with TRACE.span(_cmd_label(cmd), "cmd", cmd=" ".join(cmd)):
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace")
+    lines: "queue.Queue[str]" = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in p.stdout], name="port-forward", daemon=True).start()
+    try:
+        port = None
+        deadline = time.time() + timeout_sec
+        while port is None:
+            try:
+                line = lines.get(timeout=max(0.1, deadline - time.time()))
+            except queue.Empty:
+                raise RuntimeError(f"kubectl port-forward {target} did not start within {timeout_sec}s")
+            m = re.search(r"Forwarding from 127\.0\.0\.1:(\d+)", line)
+            if m:
+                port = int(m.group(1))
+            elif p.poll() is not None:
+                raise RuntimeError(f"kubectl port-forward {target} failed: {line.strip()}")
+        yield port
+    finally:
+        p.terminate()
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def _sync_nacos_configs(client: NacosClient, desired: List[NacosConfig], retry_sec: int = 60) -> int:
+    """Publish every config whose content in Nacos differs from the desired one; returns how many."""
+    changed = 0
+    deadline = time.time() + retry_sec
+    for cfg in desired:
+        while True:
+            try:
+                current = client.get(cfg)
+                break
+            except (OSError, http.client.HTTPException, RuntimeError) as e:
+                # nacos answers its port (refused, then 5xx/503) before the config service is up
+                if time.time() > deadline:
+                    raise RuntimeError(f"Nacos config service not ready after {retry_sec}s: {e}") from e
+                time.sleep(2)
+        if current == cfg.content:
+            continue
+        client.publish(cfg)
+        changed += 1
+        print(f"[nacos] published {cfg.data_id} ({'new' if current is None else 'changed'})")
+    print(f"[nacos] {len(desired)} configs checked, {changed} published")
+    return changed
+
+
+def _sync_nacos(ns: str, nacos_url: Optional[str] = None) -> None:
+    """Bring the Nacos configs in line with the patched ry-config dump through the open API, so running
+    services hot-refresh instead of Nacos (and everything behind it) being restarted."""
+    desired: List[NacosConfig] = []
+    for name, text in _configmap_data(ns, "ruoyi-mysql-init").items():
+        if name in MYSQL_IMPORTS and MYSQL_IMPORTS[name][0] == "ry-config":
+            desired += _nacos_configs_from_sql(text)
+    if not desired:
+        return
+    with contextlib.ExitStack() as stack:
+        if not nacos_url:
+            _wait_rollout(ns, ["ruoyi-nacos"], timeout_sec=900)
+            port = stack.enter_context(_port_forward(ns, "svc/ruoyi-nacos", NACOS_PORT))
+            nacos_url = f"http://127.0.0.1:{port}"
+        client = stack.enter_context(contextlib.closing(NacosClient(nacos_url)))
+        _sync_nacos_configs(client, desired)
+
+
+def _mysql_init_script(files: List[str], shas: Optional[Dict[str, str]] = None) -> str:
+    """Shell script run in the mysql pod: import each sql file only when its tables are missing or its
+    fingerprint (sha256 of the mounted, patched file) differs from the one recorded at the last import.
+
+    Tables present without any recorded fingerprint were imported by the mysql entrypoint from the same
+    mounted files when the pod first started: the fingerprint is recorded and nothing is imported again.
+    With `shas` (file -> sha256 of the ConfigMap data) it first waits for the kubelet to refresh the
+    mounted files, which lags a ConfigMap update by up to a minute.
+    """
+
+    def tables_cond(db: str, tables: Iterable[str]) -> str:
+        return " OR ".join(f"(table_schema='{db}' AND table_name='{t}')" for t in tables)
+
+    expected = " OR ".join(tables_cond(*MYSQL_IMPORTS[f]) for f in files)
+    lines = [
+        "set -e",
+        "M='mysql --default-character-set=utf8mb4 -uroot -ppassword'",
+        "D=/docker-entrypoint-initdb.d",
+        "$M -e 'CREATE DATABASE IF NOT EXISTS ruoyi_deploy; "
+        f"CREATE TABLE IF NOT EXISTS {MYSQL_FINGERPRINT_TABLE} "
+        "(file VARCHAR(128) PRIMARY KEY, sha256 CHAR(64) NOT NULL, applied_at DATETIME NOT NULL)'",
+        # one round trip for every table we rely on plus the recorded fingerprints
+        f'state=$($M -N -B -e "SELECT CONCAT(table_schema,\'.\',table_name) FROM information_schema.tables WHERE {expected}; '
+        f"SELECT CONCAT(file,'=',sha256) FROM {MYSQL_FINGERPRINT_TABLE}\")",
+    ]
+    for f in files:
+        db, tables = MYSQL_IMPORTS[f]
+        present = " && ".join(f'echo "$state" | grep -qxF \'{db}.{t}\'' for t in tables)
+        if shas and f in shas:
+            lines += [
+                f"for i in $(seq 90); do [ \"$(sha256sum $D/{f} | cut -c1-64)\" = {shas[f]} ] && break; sleep 2; done",
+                f"[ \"$(sha256sum $D/{f} | cut -c1-64)\" = {shas[f]} ] || {{ echo '[mysql] {f}: mounted file still outdated after 180s'; exit 5; }}",
+            ]
+        lines += [
+            f"sha=$(sha256sum $D/{f} | cut -c1-64)",
+            f'if {present} && echo "$state" | grep -qxF "{f}=$sha"; then',
+            f"  echo '[mysql] {f}: up to date'",
+            f'elif {present} && ! echo "$state" | grep -q "^{f}="; then',
+            f"  echo '[mysql] {f}: imported by the mysql entrypoint, recording its fingerprint'",
+            f"  $M -e \"REPLACE INTO {MYSQL_FINGERPRINT_TABLE} VALUES ('{f}', '$sha', NOW())\"",
+            "else",
+            f"  echo '[mysql] {f}: importing into {db}'",
+            f"  $M -e 'CREATE DATABASE IF NOT EXISTS `{db}` DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;'",
+            # retry with --force once (statements like a bare CREATE DATABASE fail on a partial import)
+            f"  $M {db} < $D/{f} || $M --force {db} < $D/{f} || {{ echo '[mysql] {f}: import failed'; exit 4; }}",
+            f'  n=$($M -N -B -e "SELECT COUNT(*) FROM information_schema.tables WHERE {tables_cond(db, tables)}")',
+            f"  if [ \"$n\" != {len(tables)} ]; then echo '[mysql] {f}: tables missing after import: {', '.join(tables)}'; exit 3; fi",
+            f"  $M -e \"REPLACE INTO {MYSQL_FINGERPRINT_TABLE} VALUES ('{f}', '$sha', NOW())\"",
+            "fi",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def _mysql_seed_files(ns: str) -> Dict[str, str]:
+    """Build context of the seeded mysql image, keyed by file name.
+
+    The sql files are the ConfigMap payload byte for byte and init.sh is the script _ensure_mysql_initialized
+    runs, so the fingerprints recorded at build time are exactly the ones it later finds up to date.
+    """
+    sql = _configmap_data(ns, "ruoyi-mysql-init")
+    files = [f for f in MYSQL_IMPORTS if f in sql]
+    base = _node_base_images(["ruoyi-mysql"])
+    seed = "\n".join(
+        [
+            "set -e",
+            f"S={MYSQL_SEED_DATADIR}",
+            # the client tools (and init.sh) find the temporary server through this
+            "export MYSQL_UNIX_PORT=/tmp/mysql-seed.sock",
+            'mkdir -p "$S" && chown mysql:mysql "$S"',
+            'mysqld --initialize-insecure --user=mysql --datadir="$S"',
+            'mysqld --user=mysql --datadir="$S" --skip-networking --socket="$MYSQL_UNIX_PORT" &',
+            "for i in $(seq 120); do mysqladmin -uroot ping >/dev/null 2>&1 && break; sleep 1; done",
+            # what the image entrypoint does on first start (MYSQL_ROOT_PASSWORD / MYSQL_DATABASE of the manifest)
+            "mysql_tzinfo_to_sql /usr/share/zoneinfo 2>/dev/null | mysql -uroot mysql",
+            "mysql -uroot -e \"ALTER USER 'root'@'localhost' IDENTIFIED BY 'password'; "
+            "CREATE USER 'root'@'%' IDENTIFIED BY 'password'; GRANT ALL ON *.* TO 'root'@'%' WITH GRANT OPTION; "
+            'CREATE DATABASE IF NOT EXISTS \\`ry-cloud\\`; FLUSH PRIVILEGES"',
+            "sh /seed/init.sh",
+            "mysqladmin -uroot -ppassword shutdown",
+            "wait",
+        ]
+    )
+    dockerfile = (
+        "# generated by deploy/minikube/deploy.py (--mysql-seed), do not edit\n"
+        f"FROM {base[0] if base else 'mysql:5.7'}\n"
+        f"COPY {' '.join(files)} /docker-entrypoint-initdb.d/\n"
+        "COPY seed.sh init.sh /seed/\n"
+        "RUN sh /seed/seed.sh\n"
+    )
+    return dict({f: sql[f] for f in files}, **{"seed.sh": seed + "\n", "init.sh": _mysql_init_script(files), "dockerfile": dockerfile})
+
+
+def _mysql_seed_tag(ns: str) -> str:
+    files = _mysql_seed_files(ns)
+    digest = hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{MYSQL_SEED_REPO}:{digest}"
+
+
+def _build_mysql_seed(ns: str) -> None:
+    """Build the seeded mysql image: a throwaway server imports the patched sql into MYSQL_SEED_DATADIR."""
+    tag = _mysql_seed_tag(ns)
+    with _host_lock(MYSQL_SEED_REPO):  # the sql is namespace independent: every namespace shares the image
+        if tag in _built_image_ids():
+            print(f"[mysql-seed] {tag} was just built by a concurrent deploy")
+            return
+        ctx = _cache_dir() / "mysql-seed"
+        shutil.rmtree(ctx, ignore_errors=True)
+        ctx.mkdir(parents=True)
+        for name, content in _mysql_seed_files(ns).items():
+            (ctx / name).write_bytes(content.encode("utf-8"))
+        print(f"[mysql-seed] building {tag}")
+        _docker_build(tag, ctx)
+
+
+def _stamp_mysql_seed(text: str, tag: str) -> str:
+    """Add the init container restoring the seeded datadir into an empty mysql-data volume.
+
+    An initialized datadir makes the image entrypoint skip its own init (and the initdb.d imports),
+    so mysql is ready as soon as the server is up: the readiness probe starts early accordingly.
+    """
+    m = re.search(r"^( *)containers:[ \t]*\n", text, re.M)
+    if not m:
+        return text
+    indent = m.group(1)
+    restore = f"[ -d /var/lib/mysql/mysql ] || cp -a {MYSQL_SEED_DATADIR}/. /var/lib/mysql/"
+    init = "".join(
+        f"{indent}{line}\n"
+        for line in (
+            "initContainers:",
+            "  - name: mysql-seed",
+            f"    image: {tag}",
+            "    imagePullPolicy: IfNotPresent",
+            f"    command: {json.dumps(['sh', '-c', restore])}",
+            "    volumeMounts:",
+            "      - name: mysql-data",
+            "        mountPath: /var/lib/mysql",
+        )
+    )
+    text = text[: m.start()] + init + text[m.start():]
+    return _set_probe_field(text, "readinessProbe", "initialDelaySeconds", 2)
+
+
+def _ensure_mysql_initialized(ns: str) -> List[str]:
+    """Initialize the databases if needed; returns the sql files that were (re)imported."""
+    # Make sure mysql is ready first.
+    _wait_rollout(ns, ["ruoyi-mysql"], timeout_sec=600)
+
+    mysql_pod = _get_single_pod_name(ns, "app=ruoyi-mysql")
+
+    # Nacos needs ry-config.config_info, the modules need ry-cloud.sys_config/sys_job: checking that the
+    # databases exist is not enough. Everything runs as one exec session; an initialized database with
+    # unchanged sql files is left alone (re-importing would also reset its data).
+    files = [f for f in MYSQL_IMPORTS if (_repo_root() / "sql" / f).exists()]
+    sql = _configmap_data(ns, "ruoyi-mysql-init")
+    expected = {f: hashlib.sha256(sql[f].encode("utf-8")).hexdigest() for f in files if f in sql}
+    code, out = _pod_exec(ns, mysql_pod, ["sh", "-c", _mysql_init_script(files, expected)], check=False, capture=True)
+    sys.stdout.write(out)
+    if code != 0:
+        last = out.strip().splitlines()[-1] if out.strip() else ""
+        raise RuntimeError(f"MySQL init incomplete (exit {code}): {last}")
+    return [f for f in files if f"[mysql] {f}: importing" in out]
+
+
+def _init_nacos_config(ns: str, state: Dict[str, bool]) -> None:
+    """Flags state["nacos_stale"] when ry-config was (re)imported behind Nacos' back."""
+    imported = _ensure_mysql_initialized(ns)
+    if any(MYSQL_IMPORTS[f][0] == "ry-config" for f in imported):
+        state["nacos_stale"] = True
+
+
+def _restart_nacos_if_stale(ns: str, state: Dict[str, bool]) -> None:
+    if not state.get("nacos_stale"):
+        print("[nacos] ry-config unchanged, skipping nacos restart")
+        return
+    if not _deployment_exists(ns, "ruoyi-nacos"):
+        print("[nacos] not deployed yet, it starts on the imported ry-config")
+        return
+    _restart_and_wait(ns, "ruoyi-nacos", timeout_sec=900)
+
+
+def _deployment_exists(ns: str, deployment: str) -> bool:
+    if KUBE:
+        return KUBE.get(ns, "Deployment", deployment) is not None
+    out = _run_capture(
+        [_exe("kubectl"), "-n", ns, "get", "deployment", deployment, "--ignore-not-found", "-o", "name"], check=False
+    )
+    return bool(out.strip())
+
+
+def _rollout_restart(ns: str, deployment: str) -> None:
+    if KUBE:
+        KUBE.restart(ns, deployment)
+        return
+    _run([_exe("kubectl"), "-n", ns, "rollout", "restart", f"deploy/{deployment}"])
+
+
+def _restart_and_wait(ns: str, deployment: str, timeout_sec: int = 600) -> None:
+    _rollout_restart(ns, deployment)
+    _wait_rollout(ns, [deployment], timeout_sec=timeout_sec)
+
+
+def _jar_deps_hash(jar: Path) -> str:
+    """Digest of a fat jar's loader and third-party libraries (names + crc), i.e. all but project code."""
+    h = hashlib.sha256()
+    with zipfile.ZipFile(jar) as zf:
+        for info in sorted(zf.infolist(), key=lambda i: i.filename):
+            if _jar_layer(info.filename) in ("spring-boot-loader", "dependencies", "snapshot-dependencies"):
+                h.update(f"{info.filename}:{info.CRC}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _live_spec_hash(ns: str, deployment: str) -> str:
+    if KUBE:
+        obj = KUBE.get(ns, "Deployment", deployment) or {}
+        return ((obj.get("metadata") or {}).get("annotations") or {}).get(SPEC_HASH_ANNOTATION, "")
+    key = SPEC_HASH_ANNOTATION.replace(".", "\\.")
+    return _run_capture(
+        [_exe("kubectl"), "-n", ns, "get", "deployment", deployment, "--ignore-not-found", "-o",
+         "jsonpath={.metadata.annotations." + key + "}"],
+        check=False,
+    ).strip()
+
+
+def _hot_swap_jar(ns: str, svc: Service, app: AppImage, text: str) -> None:
+    """Stream the jar into the running container, restart the JVM there and wait until it listens again."""
+    data = (_repo_root() / app.jar).read_bytes()
+    name = Path(app.jar).name
+    port = re.search(r"containerPort:\s*(\d+)", text).group(1)
+    pod = _get_single_pod_name(ns, f"app={svc.deployment}")
+    script = (
+        f"set -e\ncd {HOT_SWAP_DIR}\n"
+        f"head -c {len(data)} > .{name}.swap\n"
+        f'[ "$(wc -c < .{name}.swap)" -eq {len(data)} ] || {{ echo "short jar upload"; exit 5; }}\n'
+        f"mv .{name}.swap {name}\n"
+        f"old=$(cat {HOT_SWAP_PID_FILE})\n"
+        f"touch {HOT_SWAP_MARKER}\n"
+        "kill $old\n"
+        "for i in $(seq 600); do\n"
+        f'  [ "$(cat {HOT_SWAP_PID_FILE})" != "$old" ] && (exec 3<>/dev/tcp/127.0.0.1/{port}) 2>/dev/null && exit 0\n'
+        "  sleep 0.5\n"
+        "done\n"
+        f'echo "java not listening on {port} after 300s"; exit 4\n'
+    )
+    start = time.time()
+    _pod_exec(ns, pod, ["bash", "-c", script], stdin=data)
+    print(f"[hot-swap] {svc.name}: {_fmt_size(len(data))} into {pod}, JVM listening again after {time.time() - start:.1f}s")
+
+
+def _pod_has_jar(ns: str, svc: Service, app: AppImage) -> bool:
+    """Whether the running container holds exactly the local jar. The swapped jar only lives in the container:
+    a restarted container (crash, OOM kill, rescheduled pod) is back to the jar baked into its image."""
+    name = Path(app.jar).name
+    try:
+        pod = _get_single_pod_name(ns, f"app={svc.deployment}")
+        _, out = _pod_exec(ns, pod, ["sha256sum", f"{HOT_SWAP_DIR}/{name}"], check=False, capture=True)
+    except RuntimeError:
+        return False
+    h = hashlib.sha256()
+    with (_repo_root() / app.jar).open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(chunk)
+    if out.split()[:1] == [h.hexdigest()]:
+        return True
+    print(f"[hot-swap] {svc.name}: container was restarted since the last swap and runs the image's jar again")
+    return False
+
+
+def _swap_or_rollout(ns: str, svc: Service, app: AppImage, cache: BuildCache) -> None:
+    """--hot-swap task: put the current jar into the running pod, or roll out a new image when that is unsafe.
+
+    A swap needs the live Deployment to be exactly what we would apply (it runs the supervisor) and the
+    jar's third-party libraries to match the image's; otherwise the image is rebuilt and rolled as usual.
+    """
+    text = next(t for k, n, t in _manifest_docs() if k == "Deployment" and n == svc.deployment)
+    rendered = _render_deployment(ns, svc.deployment, text)
+    want = re.search(rf'{re.escape(SPEC_HASH_ANNOTATION)}: "(\w+)"', rendered).group(1)
+    spec_changed = _live_spec_hash(ns, svc.deployment) != want
+    if spec_changed:
+        reason = "Deployment spec changed"
+    elif cache.get(app.image, "swapped_hash") == _source_hash(app) and _pod_has_jar(ns, svc, app):
+        print(f"[hot-swap] {svc.name}: running pod already has the current jar")
+        return
+    elif cache.get(app.image, "deps_hash") != _jar_deps_hash(_repo_root() / app.jar):
+        reason = "dependencies changed"
+    else:
+        try:
+            _hot_swap_jar(ns, svc, app, text)
+            cache.update(app.image, swapped_hash=_source_hash(app))
+            return
+        except RuntimeError as e:
+            reason = f"swap failed ({e})"
+    print(f"[hot-swap] {svc.name}: {reason}, rolling out a new image instead")
+    _copy_assets([app])
+    _build_image(app, cache)
+    if IMAGE_BACKEND == "host":
+        _minikube_load(_image_tag(app), cache, key=app.image)
+    if spec_changed or CONTENT_TAGS:
+        _kubectl_apply_services(ns, [svc])  # the changed pod template (or image tag) rolls by itself
+    else:
+        _rollout_restart(ns, svc.deployment)
+
+
+def _wait_upstream(ns: str, upstream: List[Service]) -> None:
+    try:
+        _wait_rollout(ns, [s.deployment for s in upstream], timeout_sec=600)
+    except RuntimeError as e:
+        raise RuntimeError(
+            "Upstream dependencies are not ready (run a full deploy first?): "
+            + ", ".join(s.name for s in upstream)
+            + f"\n{e}"
+        )
+
+
+def _startup_waves(services: Iterable[Service]) -> List[List[Service]]:
+    """Services grouped by STARTUP_WAVES in start order; empty waves are dropped."""
+    index = {name: i for i, wave in enumerate(STARTUP_WAVES) for name in wave}
+    waves: List[List[Service]] = [[] for _ in STARTUP_WAVES]
+    for s in services:
+        waves[index.get(s.name, len(STARTUP_WAVES) - 1)].append(s)
+    return [w for w in waves if w]
+
+
+def _wait_nacos_registration(
+    ns: str, services: List[Service], nacos_url: Optional[str] = None, timeout_sec: int = NACOS_REGISTRATION_TIMEOUT_SEC
+) -> None:
+    """Wait until the current pods of each service are registered and healthy in Nacos discovery: a Ready pod
+    serves http, but the gateway and feign clients only find it once it is registered."""
+    if not services:
+        return
+    pending = {
+        s.deployment: {(p.get("status") or {}).get("podIP") for p in _live_pods(ns, f"app={s.deployment}")} - {None}
+        for s in services
+    }
+    with contextlib.ExitStack() as stack:
+        if not nacos_url:
+            port = stack.enter_context(_port_forward(ns, "svc/ruoyi-nacos", NACOS_PORT))
+            nacos_url = f"http://127.0.0.1:{port}"
+        client = stack.enter_context(contextlib.closing(NacosClient(nacos_url)))
+        deadline = time.time() + timeout_sec
+        while True:
+            for deployment, ips in list(pending.items()):
+                try:
+                    hosts = client.instances(deployment)  # spring.application.name == Deployment name
+                except (OSError, http.client.HTTPException):
+                    hosts = []
+                healthy = {h.get("ip") for h in hosts if h.get("healthy") and h.get("enabled", True)}
+                if ips and ips <= healthy:
+                    print(f"[nacos] {deployment} registered ({', '.join(sorted(ips))})")
+                    del pending[deployment]
+            if not pending:
+                return
+            if time.time() > deadline:
+                raise RuntimeError(f"Not registered in Nacos after {timeout_sec}s: {', '.join(sorted(pending))}")
+            time.sleep(1)
+
+
+def _wait_wave(
+    ns: str, wave: List[Service], nacos_url: Optional[str], label: str, registered: Optional[List[Service]] = None
+) -> None:
+    """A startup wave is up once its Deployments are ready and its java services (or just those of
+    `registered`, when earlier waves were checked already) are registered in Nacos."""
+    checked = wave if registered is None else registered
+    _wait_rollout(ns, [s.deployment for s in wave], timeout_sec=900)
+    _wait_nacos_registration(ns, [s for s in checked if _java_app(s.deployment)], nacos_url)
+    print(f"[wave] {label} up: {', '.join(s.name for s in checked)}")
+
+
+def _task_class(name: str) -> str:
+    return next((cls for prefix, cls in TASK_CLASSES.items() if name.startswith(prefix)), "light")
+
+
+def _available_memory_gb() -> Optional[float]:
+    """Memory available for new work (MemAvailable on Linux, free pages elsewhere), or None if unknown."""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / (1024 * 1024)
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024**3
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _workers_needed(tasks: List[Task], costs: Dict[str, float]) -> Dict[str, int]:
+    """Per heavy class, the workers its planned work needs to fit the window the critical path leaves it.
+
+    A class's tasks can start no earlier than their longest chain of predecessors and must end before
+    their longest chain of dependents would stretch the pipeline; more workers than work / window only
+    make the concurrent docker builds (or loads) compete for cpu and disk without shortening the run.
+    """
+    by_name = {t.name: t for t in tasks}
+    ranks = _task_ranks(tasks, costs)
+    critical = max(ranks.values(), default=0.0)
+    heads: Dict[str, float] = {}
+
+    def cost(name: str) -> float:
+        return costs.get(name, DEFAULT_TASK_COST[_task_class(name)])
+
+    def head(name: str, seen: Tuple[str, ...] = ()) -> float:
+        if name not in heads:
+            if name in seen or name not in by_name:
+                return 0.0
+            heads[name] = max((head(d, seen + (name,)) + cost(d) for d in by_name[name].deps), default=0.0)
+        return heads[name]
+
+    needed: Dict[str, int] = {}
+    for cls in TASK_MEMORY_GB:
+        members = [t.name for t in tasks if _task_class(t.name) == cls]
+        if not members:
+            continue
+        start = min(head(n) for n in members)
+        end = max(critical - ranks[n] + cost(n) for n in members)
+        work = sum(cost(n) for n in members)
+        needed[cls] = min(len(members), max(1, math.ceil(work / max(end - start, 1.0))))
+    return needed
+
+
+def _size_pools(
+    args: argparse.Namespace, tasks: List[Task], costs: Dict[str, float]
+) -> Tuple[int, Dict[str, int], int]:
+    """(total pipeline workers, per-class limits, mvn threads) from CPU count and free memory.
+
+    The build/load limits are then narrowed to what the planned tasks need by their learned costs
+    (_workers_needed). Explicit --jobs/--build-jobs/--load-jobs/--mvn-threads always win.
+    """
+    cpus = os.cpu_count() or 2
+    mem = _available_memory_gb()
+
+    def by_memory(cls: str, n: int) -> int:
+        return n if mem is None else min(n, int(mem / TASK_MEMORY_GB[cls]))
+
+    # docker builds are cpu + disk bound; image loads mostly stream to the node's disk
+    host = {
+        "build": max(1, by_memory("build", max(1, cpus // 2))),
+        "load": max(1, by_memory("load", min(4, max(1, cpus // 4)))),
+    }
+    needed = _workers_needed(tasks, costs)
+    limits = {cls: min(n, needed.get(cls, n)) for cls, n in host.items()}
+    if args.build_jobs:
+        limits["build"] = args.build_jobs
+    if args.load_jobs:
+        limits["load"] = args.load_jobs
+    limits["compile"] = 2  # mvn + npm, each parallel on its own
+    jobs = args.jobs or max(4, limits["build"] + limits["load"] + 2)
+    mvn_threads = args.mvn_threads if args.mvn_threads is not None else max(1, min(cpus // 2, 16))
+    mem_text = f"{mem:.1f} GiB available" if mem is not None else "memory unknown"
+    sized = ", ".join(
+        f"{cls} {limits[cls]}" + (f" of {host[cls]} for the planned work" if limits[cls] < host[cls] else "") for cls in host
+    )
+    print(f"[pool] {cpus} cpus, {mem_text} -> {jobs} workers ({sized}), mvn -T {mvn_threads or 'off'}")
+    return jobs, limits, mvn_threads
+
+
+def _task_costs_path() -> Path:
+    return _cache_dir() / "task-times.json"
+
+
+def _load_task_costs() -> Dict[str, float]:
+    try:
+        return {k: float(v) for k, v in json.loads(_task_costs_path().read_text(encoding="utf-8")).items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def _save_task_costs(costs: Dict[str, float], tasks: List[Task]) -> None:
+    """Fold this run's durations into the learned costs (exponential moving average)."""
+    learned = dict(costs)
+    for t in tasks:
+        if t.finished:
+            prev = learned.get(t.name)
+            learned[t.name] = round(t.duration if prev is None else 0.5 * prev + 0.5 * t.duration, 3)
+    path = _task_costs_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(learned, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _task_ranks(tasks: List[Task], costs: Dict[str, float]) -> Dict[str, float]:
+    """Expected seconds from a task's start to the end of the pipeline along its longest dependent chain."""
+    dependents: Dict[str, List[str]] = {t.name: [] for t in tasks}
+    for t in tasks:
+        for d in t.deps:
+            dependents.setdefault(d, []).append(t.name)
+    ranks: Dict[str, float] = {}
+
+    def rank(name: str, seen: Tuple[str, ...] = ()) -> float:
+        if name not in ranks:
+            if name in seen:  # cycle; _run_pipeline reports it
+                return 0.0
+            own = costs.get(name, DEFAULT_TASK_COST[_task_class(name)])
+            ranks[name] = own + max((rank(d, seen + (name,)) for d in dependents.get(name, [])), default=0.0)
+        return ranks[name]
+
+    for t in tasks:
+        rank(t.name)
+    return ranks
+
+
+def _run_pipeline(
+    tasks: List[Task],
+    max_workers: int,
+    limits: Optional[Dict[str, int]] = None,
+    costs: Optional[Dict[str, float]] = None,
+) -> None:
+    """Run each task as soon as all of its deps finished, at most max_workers at a time.
+
+    Heavy task classes additionally respect their own limit. When more tasks are ready than there are
+    slots, the one heading the longest expected remaining chain (learned costs) starts first.
+    The first failure stops scheduling new tasks; already running ones finish and the error is re-raised.
+    """
+    by_name = {t.name: t for t in tasks}
+    for t in tasks:
+        for d in t.deps:
+            if d not in by_name:
+                raise RuntimeError(f"Pipeline task {t.name} depends on unknown task {d}")
+    limits = limits or {}
+    ranks = _task_ranks(tasks, costs or {})
+
+    def run_task(t: Task) -> None:
+        t.started = time.time()
+        try:
+            with TRACE.span(t.name, "task", deps=",".join(t.deps), cls=_task_class(t.name)):
+                t.fn()
+        finally:
+            t.finished = time.time()
+
+    pending = {t.name: set(t.deps) for t in tasks}
+    done: set = set()
+    error: Optional[BaseException] = None
+    busy: Dict[str, int] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        running: Dict[concurrent.futures.Future, Task] = {}
+        while True:
+            if error is None:
+                ready = sorted((n for n, deps in pending.items() if deps <= done), key=lambda n: -ranks[n])
+                for name in ready:
+                    cls = _task_class(name)
+                    if len(running) >= max_workers or busy.get(cls, 0) >= limits.get(cls, max_workers):
+                        continue
+                    del pending[name]
+                    busy[cls] = busy.get(cls, 0) + 1
+                    running[ex.submit(run_task, by_name[name])] = by_name[name]
+            if not running:
+                break
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in finished:
+                t = running.pop(f)
+                busy[_task_class(t.name)] -= 1
+                exc = f.exception()
+                if exc is None:
+                    done.add(t.name)
+                    continue
+                print(f"[pipeline] {t.name} failed: {exc}")
+                if error is None:
+                    error = exc
+
+    if error is not None:
+        raise error
+    if pending:
+        raise RuntimeError("Pipeline has unsatisfiable deps (cycle?): " + ", ".join(sorted(pending)))
+
+
+def _critical_path(tasks: List[Task]) -> List[Task]:
+    """Chain of tasks that gated the finish: from the last task to finish, follow the latest-finishing dep."""
+    by_name = {t.name: t for t in tasks}
+    ran = [t for t in tasks if t.finished]
+    if not ran:
+        return []
+    cur = max(ran, key=lambda t: t.finished)
+    path = [cur]
+    while cur.deps:
+        cur = max((by_name[d] for d in cur.deps), key=lambda t: t.finished)
+        path.append(cur)
+    return list(reversed(path))
+
+
+def _write_trace_report(path: Path) -> None:
+    summary = TRACE.write(path)
+    par = summary["parallelism"]
+    api = f"{summary['api_requests']} API requests, " if summary["api_requests"] else ""
+    print(
+        f"[trace] {summary['commands']} commands ({summary['failed_commands']} failed), {api}"
+        f"wall {summary['wall_sec']:.1f}s, parallelism avg {par['tasks_avg']} / peak {par['tasks_peak']} tasks"
+    )
+    for label, agg in list(summary["by_command"].items())[:8]:
+        print(f"  {label:<28} x{agg['count']:<3} {agg['total_sec']:8.1f}s")
+    print(f"[trace] report written to {path}")
+
+
+def _print_pipeline_report(tasks: List[Task], wall_sec: float) -> None:
+    busy = sum(t.duration for t in tasks)
+    print(f"[pipeline] {len(tasks)} tasks, wall {wall_sec:.1f}s, busy {busy:.1f}s")
+    print("[pipeline] critical path:")
+    for t in _critical_path(tasks):
+        print(f"  {t.name:<24} {t.duration:8.1f}s")
+
+
+def _plan_pipeline(
+    ns: str,
+    targets: List[Service],
+    upstream: List[Service],
+    cache: BuildCache,
+    build_sources: bool,
+    build_images: bool,
+    selective: bool,
+    nacos_url: Optional[str] = None,
+    redeploy_only: bool = False,
+) -> List[Task]:
+    """Build the task graph for one deploy.
+
+    Each app image is its own chain (mvn/npm -> copy -> docker build -> minikube load -> apply),
+    while base infra (namespace, configmaps, mysql/redis/nacos, DB init) runs alongside the builds.
+    Deployments are applied in STARTUP_WAVES: a wave's applies also wait for the previous wave to be up.
+    In selective mode (--services) upstream deps are only waited on. App images are deployed under content
+    tags, so a Deployment whose image changed rolls when applied; with the manifest's fixed tags
+    (--skip-build/--only-apply) reloaded targets are restarted instead.
+    With redeploy_only (--watch iterations) only the app chains run, and only the Deployments whose image
+    changed are applied (or restarted).
+    """
+    tasks: List[Task] = []
+    names = {s.name for s in targets}
+    apps = {a.image: a for a in _apps_for(targets)}
+    app_targets = [s for s in targets if s.image]
+    infra_targets = [s for s in targets if not s.image]
+
+    # ---- app image chains ----
+    to_build: set = set()
+    to_load: set = set()
+    hot: set = set()
+    last_step: Dict[str, str] = {}
+    if build_sources and apps:
+        stale_java, stale_ui = _stale_sources(cache, apps.values())
+        if stale_java:
+            tasks.append(Task("mvn", lambda: _build_java(cache, stale_java)))
+        else:
+            print("[cache] backend jars up to date, skipping mvn")
+        if stale_ui:
+            tasks.append(Task("npm", lambda: _build_ui(cache, stale_ui)))
+        else:
+            print("[cache] ui dist up to date, skipping npm")
+
+        # --hot-swap: rebuilt jars go straight into the running pods, their images are left stale
+        if HOT_SWAP and selective:
+            hot = {a.image for a in apps.values() if a.jar}
+        rebuild = [a for a in apps.values() if a.image not in hot]
+        to_build = set(_images_needing_build(cache, rebuild)) if build_images and rebuild else set()
+        if build_images and rebuild and not to_build:
+            print("[cache] all images up to date, skipping docker build")
+        if IMAGE_BACKEND == "host":
+            to_load = set(_images_needing_load(cache, rebuild)) | to_build if rebuild else set()
+            if not to_load:
+                print("[cache] minikube already has the current images, skipping image load")
+        else:
+            print(f"[backend] {IMAGE_BACKEND}: images are built inside minikube, no image load needed")
+
+        if not redeploy_only:
+            tasks.append(Task("copy:sql", _copy_sql_assets))
+        java_base: Dict[str, object] = {}
+        for svc in app_targets:
+            app = apps[svc.image]
+            src_dep: Tuple[str, ...] = ("mvn",) if app in stale_java else ("npm",) if app in stale_ui else ()
+            if app.image in hot:
+                tasks.append(Task(f"swap:{svc.name}", lambda s=svc, a=app: _swap_or_rollout(ns, s, a, cache), src_dep))
+                continue
+            layered = LAYERED_IMAGES and app.jar is not None
+            appcds = APPCDS and app.jar is not None
+            step = src_dep
+            if not layered and not appcds:
+                tasks.append(Task(f"copy:{svc.name}", lambda a=app: _copy_assets([a]), src_dep))
+                step = (f"copy:{svc.name}",)
+            if app.image in to_build:
+                context: Optional[Path] = None
+                if layered:
+                    # the shared base reads every built jar, so it waits for the whole mvn run
+                    if not any(t.name == "java-base" for t in tasks):
+                        tasks.append(
+                            Task(
+                                "java-base",
+                                lambda: java_base.update(zip(("tag", "libs"), _build_java_base())),
+                                ("mvn",) if stale_java else (),
+                            )
+                        )
+                    tasks.append(Task(f"layers:{svc.name}", lambda a=app: _explode_jar(a, java_base), ("java-base",) + src_dep))
+                    step = (f"layers:{svc.name}",)
+                    context = _layered_context(app)
+                if appcds:
+                    tasks.append(Task(f"cds:{svc.name}", lambda a=app: _appcds_context(a), src_dep))
+                    step = (f"cds:{svc.name}",)
+                    context = _appcds_dir(app)
+                tasks.append(Task(f"build:{svc.name}", lambda a=app, c=context: _build_image(a, cache, c), step))
+                step = (f"build:{svc.name}",)
+            if app.image in to_load:
+                tasks.append(Task(f"load:{svc.name}", lambda a=app: _minikube_load(_image_tag(a), cache, key=a.image), step))
+                step = (f"load:{svc.name}",)
+            if step:
+                last_step[svc.name] = step[0]
+
+    if redeploy_only:
+        for svc in app_targets:
+            if svc.image not in to_load | to_build:
+                continue
+            if CONTENT_TAGS:
+                tasks.append(Task(f"apply:{svc.name}", lambda s=svc: _kubectl_apply_services(ns, [s]), (last_step[svc.name],)))
+            else:
+                tasks.append(Task(f"restart:{svc.name}", lambda s=svc: _rollout_restart(ns, s.deployment), (last_step[svc.name],)))
+        deployments = [s.deployment for s in app_targets]
+        tasks.append(Task("rollout", lambda: _wait_rollout(ns, deployments, timeout_sec=900), tuple(t.name for t in tasks)))
+        return tasks
+
+    # ---- base infra ----
+    wait_deps: Tuple[str, ...] = ()
+    if upstream:
+        tasks.append(Task("wait:upstream", lambda: _wait_upstream(ns, upstream)))
+        wait_deps = ("wait:upstream",)
+
+    infra_deps: Tuple[str, ...] = ()
+    node_images = _minikube_image_tags() if IMAGE_BACKEND == "host" and infra_targets else None
+    if IMAGE_BACKEND == "host" and infra_targets:
+        # Otherwise the node pulls mysql/redis/nacos from the network again although the host already has them.
+        for img in _node_base_images(s.deployment for s in infra_targets):
+            if node_images is not None and img not in node_images:
+                tasks.append(Task(f"preload:{img}", lambda i=img: _minikube_load(i)))
+                infra_deps += (f"preload:{img}",)
+    if MYSQL_SEED and "mysql" in names:
+        # Tagged by the sql hash: built once per sql change, and a new tag rolls mysql onto the new data.
+        seed = _mysql_seed_tag(ns)
+        seed_step: Tuple[str, ...] = ()
+        if seed not in _built_image_ids():
+            tasks.append(Task("seed:mysql", lambda: _build_mysql_seed(ns)))
+            seed_step = ("seed:mysql",)
+        else:
+            print(f"[cache] {seed} up to date, skipping mysql seed build")
+        if IMAGE_BACKEND == "host" and (seed_step or (node_images is not None and seed not in node_images)):
+            tasks.append(Task(f"preload:{seed}", lambda: _minikube_load(seed), seed_step))
+            seed_step = (f"preload:{seed}",)
+        infra_deps += seed_step
+    if not selective or names & {"mysql", "nacos"}:
+        # Create/Update configmaps for mysql init and nacos config (must happen before pods start)
+        tasks.append(Task("configmaps", lambda: _apply_configmaps(ns)))
+        infra_deps += ("configmaps",)
+
+    # ---- startup waves ----
+    # Builds keep running throughout; only applying a wave waits until the previous one is up.
+    waves = _startup_waves(targets)
+    nacos_state: Dict[str, bool] = {}
+    gate: Tuple[str, ...] = wait_deps
+    for i, wave in enumerate(waves):
+        wave_names = {s.name for s in wave}
+        infra = [s for s in wave if not s.image]
+        done: List[str] = []
+        if i == 0:
+            # the namespace goes first, with whatever infra starts first
+            tasks.append(Task("apply:infra", lambda w=infra: _kubectl_apply_services(ns, w, include_namespace=not selective), infra_deps))
+            done.append("apply:infra")
+        else:
+            for svc in infra:
+                # nacos starts on an initialized ry-config (a nacos already running is restarted first if it changed)
+                deps = infra_deps + gate + (("nacos:restart",) if svc.name == "nacos" and "mysql" in names else ())
+                tasks.append(Task(f"apply:{svc.name}", lambda s=svc: _kubectl_apply_services(ns, [s]), deps))
+                done.append(f"apply:{svc.name}")
+        if "mysql" in wave_names:
+            # Ensure mysql schema/config DB are initialized, then restart nacos (depends on ry-config) -- but only
+            # if ry-config was (re)imported: a changed nacos-conf ConfigMap already rolls nacos via its checksum.
+            mysql_applied = "apply:infra" if i == 0 else "apply:mysql"
+            tasks.append(Task("mysql:init", lambda: _init_nacos_config(ns, nacos_state), (mysql_applied,)))
+            tasks.append(Task("nacos:restart", lambda: _restart_nacos_if_stale(ns, nacos_state), ("mysql:init",) + wait_deps))
+            done += ["mysql:init", "nacos:restart"]
+        if names & {"mysql", "nacos"} and ("nacos" in wave_names or ("nacos" not in names and "mysql" in wave_names)):
+            # Config content (in-cluster hosts etc.) is synced through the Nacos API before any service starts
+            # on it; services already running hot-refresh it.
+            tasks.append(Task("nacos:config", lambda: _sync_nacos(ns, nacos_url), tuple(done) + gate))
+            done.append("nacos:config")
+
+        for svc in wave:
+            if not svc.image:
+                continue
+            if svc.image in hot:
+                done.append(f"swap:{svc.name}")  # applied (if its spec changed) by its swap task
+                continue
+            deps = ("apply:infra",) + gate + ((last_step[svc.name],) if svc.name in last_step else ())
+            tasks.append(Task(f"apply:{svc.name}", lambda s=svc: _kubectl_apply_services(ns, [s]), deps))
+            done.append(f"apply:{svc.name}")
+            # A new content tag rolls by itself; the manifest's fixed tags (e.g. :jre17-1) need a restart.
+            if selective and not CONTENT_TAGS and svc.image in to_load | to_build:
+                tasks.append(Task(f"restart:{svc.name}", lambda s=svc: _rollout_restart(ns, s.deployment), (f"apply:{svc.name}",)))
+                done.append(f"restart:{svc.name}")
+
+        if i < len(waves) - 1:
+            label = f"{i + 1}/{len(waves)}"
+            tasks.append(Task(f"wave:{i + 1}", lambda w=wave, n=label: _wait_wave(ns, w, nacos_url, n), tuple(done)))
+            gate = (f"wave:{i + 1}",)
+
+    # the last wave: every target ready, and registered in nacos
+    last, label = (waves[-1] if waves else []), f"{len(waves)}/{len(waves)}"
+    tasks.append(Task("rollout", lambda: _wait_wave(ns, targets, nacos_url, label, registered=last), tuple(t.name for t in tasks)))
+    return tasks
+
+
+def _source_snapshot(roots: Iterable[Path]) -> Dict[str, Tuple[int, int]]:
+    """(mtime, size) of every hashed file under roots; cheap enough to poll every second."""
+    snap: Dict[str, Tuple[int, int]] = {}
+    for root in roots:
+        if root.is_file():
+            st = root.stat()
+            snap[str(root)] = (st.st_mtime_ns, st.st_size)
+            continue
+        for base, dirs, names in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in HASH_EXCLUDE_DIRS]
+            for n in names:
+                if n in HASH_EXCLUDE_FILES:
+                    continue
+                try:
+                    st = os.stat(os.path.join(base, n))
+                except OSError:
+                    continue  # removed while walking
+                snap[os.path.join(base, n)] = (st.st_mtime_ns, st.st_size)
+    return snap
+
+
+def _forget_hashes(changed: Iterable[str]) -> None:
+    """Drop memoized hashes of the changed files and of every directory containing them."""
+    changed = [Path(c) for c in changed]
+    with _HASH_MEMO_LOCK:
+        for key in list(_HASH_MEMO):
+            k = Path(key)
+            if any(c == k or k in c.parents for c in changed):
+                del _HASH_MEMO[key]
+
+
+def _watch(
+    ns: str,
+    targets: List[Service],
+    cache: BuildCache,
+    jobs: int,
+    limits: Dict[str, int],
+    costs: Dict[str, float],
+) -> int:
+    """Redeploy the app services whose sources change, until Ctrl+C.
+
+    Tools, kube client, base images and pool sizes stay resolved from the initial deploy; each
+    iteration only rebuilds the affected jars/images and rolls their Deployments. A failed iteration is
+    reported and watching goes on; only Ctrl+C stops it.
+    """
+    app_targets = [s for s in targets if s.image]
+    apps = {a.image: a for a in _apps_for(app_targets)}
+    sources = {s.name: _source_paths(apps[s.image]) for s in app_targets}
+    roots = sorted({p for paths in sources.values() for p in paths})
+    snap = _source_snapshot(roots)
+    print(f"[watch] watching {len(snap)} files of {', '.join(sources)}; Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            time.sleep(WATCH_POLL_SEC)
+            cur = _source_snapshot(roots)
+            if cur == snap:
+                continue
+            # an editor save or `git checkout` touches several files; wait until they settle
+            while True:
+                time.sleep(WATCH_DEBOUNCE_SEC)
+                settled = _source_snapshot(roots)
+                if settled == cur:
+                    break
+                cur = settled
+            changed = {p for p in snap.keys() | cur.keys() if snap.get(p) != cur.get(p)}
+            snap = cur
+            _forget_hashes(changed)
+            affected = [
+                s for s in app_targets if any(p == c or p in c.parents for c in map(Path, changed) for p in sources[s.name])
+            ]
+            if not affected:
+                continue
+            names = ", ".join(s.name for s in affected)
+            print(f"[watch] {len(changed)} file(s) changed -> redeploying {names}", flush=True)
+            start = time.time()
+            with TRACE.span("watch", services=names):
+                tasks: List[Task] = []
+                try:
+                    tasks = _plan_pipeline(
+                        ns, affected, [], cache, build_sources=True, build_images=True, selective=True, redeploy_only=True
+                    )
+                    _run_pipeline(tasks, max_workers=jobs, limits=limits, costs=costs)
+                except Exception as e:
+                    # keep watching: the next save usually fixes a compile error, the next poll a flaky tool or API
+                    print(f"[watch] redeploy of {names} failed: {type(e).__name__}: {e}", flush=True)
+                    continue
+                finally:
+                    _print_pipeline_report(tasks, time.time() - start)
+                    _save_task_costs(costs, tasks)
+            print(f"[watch] {names} running {time.time() - start:.1f}s after the change settled", flush=True)
+    except KeyboardInterrupt:
+        print("[watch] stopped")
+    return 0
+
+
+def _print_access(ns: str) -> None:
+    # Print url from minikube service
+    _run([_exe("minikube"), "service", "-n", ns, "ruoyi-nginx", "--url"], check=False)
+
+
+@dataclass(frozen=True)
+class BenchRoute:
+    """One request of the --bench mix: GET BENCH_API_PREFIX + path, picked with probability ~ weight."""
+
+    name: str
+    path: str
+    weight: int = 1
+
+
+@dataclass(frozen=True)
+class BenchWorkload:
+    """bench-workload.json: `concurrency` workers, each logged in on its own keep-alive connection, loop
+    over the weighted routes; samples of the first `warmup_sec` (JIT, connection pools) are dropped."""
+
+    routes: Tuple[BenchRoute, ...]
+    concurrency: int = 16
+    duration_sec: float = 30.0
+    warmup_sec: float = 5.0
+    tolerance: float = 0.2
+    username: str = "admin"
+    password: str = "admin123"
+
+
+def _bench_workload_path() -> Path:
+    return Path(__file__).resolve().parent / "bench-workload.json"
+
+
+def _bench_baseline_path() -> Path:
+    return _cache_dir() / "http-bench-baseline.json"
+
+
+def _load_bench_workload(path: Path) -> BenchWorkload:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        routes = tuple(BenchRoute(**r) for r in data.pop("routes"))
+        workload = BenchWorkload(routes=routes, **data)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(f"Invalid bench workload {path}: {e}")
+    if not routes or workload.concurrency < 1 or workload.duration_sec <= 0:
+        raise RuntimeError(f"Invalid bench workload {path}: needs routes, concurrency >= 1 and duration_sec > 0")
+    return workload
+
+
+def _json_body(payload: bytes) -> dict:
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class GatewayClient:
+    """The RuoYi api behind nginx (BENCH_API_PREFIX) over one keep-alive connection."""
+
+    def __init__(self, base_url: str) -> None:
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname or "127.0.0.1", url.port or 80
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self.headers: Dict[str, str] = {}
+
+    def call(
+        self, method: str, path: str, body: Optional[dict] = None, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, bytes, float]:
+        """(status, body, seconds) of one request; a keep-alive connection closed by nginx is reopened once."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {**self.headers, **(headers or {})}
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+        for attempt in (1, 2):
+            start = time.perf_counter()
+            try:
+                self.conn.request(method, BENCH_API_PREFIX + path, body=data, headers=headers)
+                resp = self.conn.getresponse()
+                payload = resp.read()
+                return resp.status, payload, time.perf_counter() - start
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()  # reconnects on the next request
+                if attempt == 2:
+                    raise
+        raise AssertionError("unreachable")
+
+    def captcha(self) -> Optional[str]:
+        """uuid of a fresh login captcha; None when the gateway has captchas disabled."""
+        status, payload, _ = self.call("GET", "/code", headers={"Accept": "text/plain"})
+        data = _json_body(payload)
+        if status != 200 or data.get("code") != 200:
+            raise RuntimeError(f"Captcha request failed ({status}): {payload[:200].decode('utf-8', 'replace')}")
+        return data.get("uuid") if data.get("captchaEnabled") else None
+
+    def login(self, username: str, password: str, code: str = "", uuid: str = "") -> float:
+        """Log in through ruoyi-auth; later calls carry the token. Returns the login latency."""
+        body = {"username": username, "password": password, "code": code, "uuid": uuid}
+        status, payload, sec = self.call("POST", "/auth/login", body)
+        token = (_json_body(payload).get("data") or {}).get("access_token")
+        if status != 200 or not token:
+            raise RuntimeError(f"Login as {username} failed ({status}): {payload[:200].decode('utf-8', 'replace')}")
+        self.headers["Authorization"] = f"Bearer {token}"
+        return sec
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _captcha_answers(ns: str, uuids: List[str]) -> List[str]:
+    """Answers to the given captchas, read back from redis in one exec."""
+    pod = _get_single_pod_name(ns, "app=ruoyi-redis")
+    _, out = _pod_exec(ns, pod, ["redis-cli", "--raw", "MGET", *(CAPTCHA_CODE_KEY + u for u in uuids)], capture=True)
+    # the services' redis serializer stores strings json-encoded: "12" -> "\"12\""
+    answers = [json.loads(v) if v else "" for v in out.splitlines()]
+    if len(answers) != len(uuids) or not all(answers):
+        raise RuntimeError(f"Could not read {len(uuids)} login captchas from redis (got {answers})")
+    return answers
+
+
+def _nginx_url(ns: str) -> Optional[str]:
+    """http://<minikube ip>:<node port> of ruoyi-nginx, if reachable from this host (the docker driver
+    on macOS/Windows only exposes it through a tunnel)."""
+    if KUBE:
+        svc = KUBE.get(ns, "Service", "ruoyi-nginx") or {}
+    else:
+        out = _run_capture([_exe("kubectl"), "-n", ns, "get", "service", "ruoyi-nginx", "-o", "json"], check=False)
+        svc = _json_body(out.encode("utf-8"))
+    ports = [p["nodePort"] for p in (svc.get("spec") or {}).get("ports") or [] if p.get("nodePort")]
+    ip = _run_capture([_exe("minikube"), "ip"], check=False).strip()
+    if not ports or not ip:
+        return None
+    try:
+        socket.create_connection((ip, ports[0]), timeout=2).close()
+    except OSError:
+        return None
+    return f"http://{ip}:{ports[0]}"
+
+
+def _latency_stats(latencies: List[float], errors: int, window_sec: Optional[float]) -> dict:
+    """Request count, errors, throughput (successful requests/s) and nearest-rank latency percentiles."""
+    lat = sorted(latencies)
+
+    def pct(q: float) -> float:
+        return round(lat[max(0, math.ceil(q * len(lat)) - 1)] * 1000, 1) if lat else 0.0
+
+    return {
+        "requests": len(lat) + errors,
+        "errors": errors,
+        "rps": round(len(lat) / window_sec, 1) if window_sec else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def _http_bench(ns: str, base_url: str, workload: BenchWorkload) -> dict:
+    """Run the workload against base_url: log every worker in, then loop over the weighted routes.
+
+    One thread per connection, each with one request in flight, like every other concurrent step here
+    (the requests block in socket I/O, which releases the GIL). The client only checks bytes and records
+    a float per request, so it keeps up at dev-cluster rates; whether it did is measured rather than
+    assumed: the time spent in requests over the window gives the concurrency achieved (Little's law).
+    """
+    clients = [GatewayClient(base_url) for _ in range(workload.concurrency)]
+    with contextlib.ExitStack() as stack:
+        for c in clients:
+            stack.callback(c.close)
+        uuids = [c.captcha() for c in clients]
+        codes = _captcha_answers(ns, uuids) if uuids[0] else [""] * len(clients)
+        routes = {r.name: ([], [0]) for r in workload.routes}  # name -> (latencies, [errors])
+        weights = [r.weight for r in workload.routes]
+        lock = threading.Lock()
+        busy = [0.0]  # seconds spent in measured requests, over all workers
+
+        def login(i: int) -> float:
+            return clients[i].login(workload.username, workload.password, codes[i], uuids[i] or "")
+
+        def worker(i: int) -> None:
+            client, rng = clients[i], random.Random(i)
+            ok: Dict[str, List[float]] = {name: [] for name in routes}
+            errors = dict.fromkeys(routes, 0)
+            in_requests = 0.0
+            while True:
+                now = time.monotonic()
+                if now >= stop_at:
+                    break
+                route = rng.choices(workload.routes, weights)[0]
+                try:
+                    status, payload, sec = client.call("GET", route.path)
+                    # RuoYi reports auth/permission errors as HTTP 200 with its own code
+                    good = status == 200 and b'"code":200' in payload
+                except (OSError, http.client.HTTPException):
+                    good, sec = False, time.monotonic() - now
+                if now < measure_from:
+                    continue
+                in_requests += sec
+                if good:
+                    ok[route.name].append(sec)
+                else:
+                    errors[route.name] += 1
+            with lock:
+                busy[0] += in_requests
+                for name, (lat, err) in routes.items():
+                    lat.extend(ok[name])
+                    err[0] += errors[name]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix="bench") as pool:
+            logins = list(pool.map(login, range(len(clients))))
+            measure_from = time.monotonic() + workload.warmup_sec
+            stop_at = measure_from + workload.duration_sec
+            list(pool.map(worker, range(len(clients))))
+
+    stats = {BENCH_LOGIN_ROUTE: _latency_stats(logins, 0, None)}
+    stats.update({name: _latency_stats(lat, err[0], workload.duration_sec) for name, (lat, err) in routes.items()})
+    every = [x for lat, _ in routes.values() for x in lat]
+    total = _latency_stats(every, sum(err[0] for _, err in routes.values()), workload.duration_sec)
+    return {
+        "url": base_url,
+        "concurrency": workload.concurrency,
+        "concurrency_achieved": round(busy[0] / workload.duration_sec, 2),
+        "duration_sec": workload.duration_sec,
+        "routes": stats,
+        "total": total,
+    }
+
+
+def _print_bench(results: dict) -> None:
+    print(f"{'route':<18}{'reqs':>8}{'errors':>8}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, r in [*results["routes"].items(), ("total", results["total"])]:
+        rps = "-" if r["rps"] is None else f"{r['rps']:.1f}"
+        print(
+            f"{name:<18}{r['requests']:>8}{r['errors']:>8}{rps:>9}"
+            f"{r['p50_ms']:>8.1f}ms{r['p95_ms']:>8.1f}ms{r['p99_ms']:>8.1f}ms"
+        )
+
+
+def _bench_regressions(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Routes whose p50/p95 grew, or whose error count grew, beyond the baseline; total throughput drops."""
+    regressions = []
+    current = {**results["routes"], "total": results["total"]}
+    before = {**baseline.get("routes", {}), "total": baseline.get("total")}
+    for name, r in current.items():
+        base = before.get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if r[metric] > base[metric] * (1 + tolerance) + BENCH_SLACK_MS:
+                regressions.append(f"{name}.{metric}: {base[metric]:g} -> {r[metric]:g}")
+        if r["errors"] > base["errors"]:
+            regressions.append(f"{name}.errors: {base['errors']} -> {r['errors']}")
+    rps, base_rps = results["total"]["rps"], (baseline.get("total") or {}).get("rps")
+    if base_rps and rps < base_rps * (1 - tolerance):
+        regressions.append(f"total.rps: {base_rps:g} -> {rps:g}")
+    return regressions
+
+
+def _run_bench(
+    ns: str, workload: BenchWorkload, url: Optional[str], baseline_path: Path, save_baseline: bool = False
+) -> int:
+    """Load-test the deployed stack and compare with the stored baseline; 1 on regressions."""
+    with contextlib.ExitStack() as stack:
+        url = url or _nginx_url(ns)
+        if not url:
+            print("[bench] node port not reachable from this host, going through kubectl port-forward (adds latency)")
+            url = f"http://127.0.0.1:{stack.enter_context(_port_forward(ns, 'svc/ruoyi-nginx', 80))}"
+        print(
+            f"[bench] {url}{BENCH_API_PREFIX}: {workload.concurrency} connections, "
+            f"{workload.duration_sec:g}s after {workload.warmup_sec:g}s warm-up",
+            flush=True,
+        )
+        with TRACE.span("http bench", "bench", url=url, concurrency=workload.concurrency) as span:
+            results = _http_bench(ns, url, workload)
+            span.update(rps=results["total"]["rps"], p95_ms=results["total"]["p95_ms"])
+    _print_bench(results)
+    achieved = results["concurrency_achieved"]
+    print(f"[bench] concurrency: {workload.concurrency} configured, {achieved:.1f} requests in flight on average")
+    if achieved < BENCH_MIN_CONCURRENCY_SHARE * workload.concurrency:
+        print(
+            "[bench] warning: the client did not keep every connection busy (slow logins, connection errors "
+            "or a saturated client host); latencies and throughput understate the configured load"
+        )
+
+    errors = results["total"]["errors"]
+    if errors:
+        print(f"[bench] {errors} of {results['total']['requests']} requests failed")
+    if save_baseline or (not baseline_path.exists() and not errors):
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[bench] baseline saved to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        return 1
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline.get("concurrency") != workload.concurrency:
+        print(f"[bench] baseline {baseline_path} was taken with {baseline.get('concurrency')} connections, not comparing")
+        return 0
+    regressions = _bench_regressions(results, baseline, workload.tolerance)
+    for line in regressions:
+        print(f"[bench] regression {line}")
+    if regressions:
+        return 1
+    print(f"[bench] no regressions vs {baseline_path} (tolerance {workload.tolerance:.0%})")
+    return 0
+
+
+def _resource_profile_path() -> Path:
+    return _cache_dir() / "resource-profile.json"
+
+
+def _load_resource_profile(path: Path) -> Dict[str, dict]:
+    try:
+        profile = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Invalid resource profile {path}: {e}")
+    known = {s.deployment for s in SERVICES}
+    if not isinstance(profile, dict) or not all(isinstance(v, dict) for v in profile.values()):
+        raise RuntimeError(f"Invalid resource profile {path}: expected {{deployment: {{requests, limits, java_opts}}}}")
+    unknown = sorted(set(profile) - known)
+    if unknown:
+        raise RuntimeError(f"Invalid resource profile {path}: unknown deployments {', '.join(unknown)}")
+    return profile
+
+
+def _cpu_millis(quantity: Optional[str]) -> Optional[int]:
+    if not quantity:
+        return None
+    q = str(quantity)
+    return int(q[:-1]) if q.endswith("m") else int(float(q) * 1000)
+
+
+def _memory_mib(quantity: Optional[str]) -> Optional[int]:
+    m = re.fullmatch(r"([0-9.]+)([KMGT]i?)?", str(quantity or ""))
+    if not m:
+        return None
+    units = {None: 1, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12, "Ki": 1 << 10, "Mi": 1 << 20, "Gi": 1 << 30, "Ti": 1 << 40}
+    return int(float(m.group(1)) * units[m.group(2)] / (1 << 20))
+
+
+def _round_up(value: float, step: int) -> int:
+    return int(-(-value // step) * step)
+
+
+def _cgroup_sample(ns: str, pod: str) -> Optional[Dict[str, float]]:
+    """CPU seconds, CFS periods (all / throttled) and memory (MiB) of the pod's container since it started."""
+    _, out = _pod_exec(ns, pod, ["sh", "-c", CGROUP_STATS_SCRIPT], check=False, capture=True)
+    raw: Dict[str, int] = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            raw[parts[0]] = int(parts[1])
+    if "usage_usec" not in raw and "cpuacct_usage" not in raw:
+        return None
+    memory = raw.get("memory_current", raw.get("memory_usage", 0))
+    inactive = raw.get("inactive_file", raw.get("total_inactive_file", 0))
+    return {
+        "at": time.time(),
+        "cpu_sec": raw["usage_usec"] / 1e6 if "usage_usec" in raw else raw["cpuacct_usage"] / 1e9,
+        "periods": raw.get("nr_periods", 0),
+        "throttled": raw.get("nr_throttled", 0),
+        # working set as the kubelet counts it: page cache that can be dropped is left out
+        "working_set_mi": max(0, memory - inactive) / (1 << 20),
+        "peak_mi": raw.get("memory_peak", raw.get("memory_max_usage", memory)) / (1 << 20),
+    }
+
+
+def _tuned_resources(deployment: str, pod: dict, first: Dict[str, float], second: Dict[str, float], since: float) -> dict:
+    """Profile entry for one deployment from two samples: start-up (container start to `first`) and the
+    window between the samples. CPU limits only change when start-up was observed, i.e. the container
+    started during this deploy (after `since`)."""
+    resources = (((pod.get("spec") or {}).get("containers") or [{}])[0]).get("resources") or {}
+    limits = resources.get("limits") or {}
+    cpu_limit, mem_limit = _cpu_millis(limits.get("cpu")), _memory_mib(limits.get("memory"))
+    started = [_k8s_time(((cs.get("state") or {}).get("running") or {}).get("startedAt")) for cs in (pod.get("status") or {}).get("containerStatuses") or []]
+    started_at = max((t for t in started if t is not None), default=None)
+    fresh = started_at is not None and started_at >= since - 1
+    observed: Dict[str, object] = {}
+    if fresh:
+        observed["startup_sec"] = _pod_startup_sec(pod)
+        observed["startup_cpu"] = round(first["cpu_sec"] / max(1.0, first["at"] - started_at), 2)
+        observed["throttled"] = round(first["throttled"] / first["periods"], 2) if first["periods"] else 0.0
+    window_cpu = (second["cpu_sec"] - first["cpu_sec"]) / max(1.0, second["at"] - first["at"])
+    working_set = max(first["working_set_mi"], second["working_set_mi"])
+    observed.update(
+        window_cpu=round(window_cpu, 3),
+        working_set_mi=round(working_set),
+        peak_mi=round(max(first["peak_mi"], second["peak_mi"])),
+    )
+
+    if cpu_limit and fresh and observed["throttled"] > RESOURCE_THROTTLE_RATIO:
+        cpu_limit = min(cpu_limit * 2, max(cpu_limit, RESOURCE_MAX_CPU_M))
+    cpu_request = max(RESOURCE_MIN_CPU_M, _round_up(window_cpu * 1000 * 1.2, 10))
+    mem_request = max(RESOURCE_MIN_MEMORY_MI, _round_up(working_set * 1.1, 16))
+    entry: Dict[str, object] = {}
+    if _java_app(deployment):
+        mem_limit = max(JAVA_MIN_LIMIT_MI, _round_up(working_set * JAVA_LIMIT_HEADROOM, 64))
+        entry["java_opts"] = f"-Xmx{int(mem_limit * JAVA_HEAP_SHARE)}m"
+    elif mem_limit and working_set * 1.25 > mem_limit:
+        mem_limit = _round_up(working_set * 1.25, 64)
+    entry["requests"] = {
+        "cpu": f"{min(cpu_request, cpu_limit or cpu_request)}m",
+        "memory": f"{min(mem_request, mem_limit or mem_request)}Mi",
+    }
+    tuned_limits: Dict[str, str] = {}
+    if cpu_limit:
+        tuned_limits["cpu"] = f"{cpu_limit}m"
+    if mem_limit:
+        tuned_limits["memory"] = f"{mem_limit}Mi"
+    entry["limits"] = tuned_limits
+    entry["observed"] = observed
+    return entry
+
+
+def _tune_resources(ns: str, deployments: List[str], since: float, window: Optional[Callable[[], int]] = None) -> int:
+    """Sample the deployments' pods, run `window` (the --bench load, or an idle wait) and sample again, then
+    merge tuned entries into .cache/resource-profile.json. Returns the window's exit code."""
+    pods: Dict[str, dict] = {}
+    for d in deployments:
+        running = [p for p in _live_pods(ns, f"app={d}") if (p.get("status") or {}).get("phase") == "Running"]
+        if running:
+            pods[d] = running[0]
+
+    def sample_all() -> Dict[str, Optional[Dict[str, float]]]:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(pods)), thread_name_prefix="cgroup") as pool:
+            return dict(zip(pods, pool.map(lambda d: _cgroup_sample(ns, pods[d]["metadata"]["name"]), pods)))
+
+    with TRACE.span("resources sample"):
+        first = sample_all()
+    code = 0
+    if window:
+        code = window()
+    else:
+        print(f"[resources] sampling an idle window of {RESOURCE_IDLE_WINDOW_SEC}s (add --bench to sample under load)", flush=True)
+        time.sleep(RESOURCE_IDLE_WINDOW_SEC)
+    with TRACE.span("resources sample"):
+        second = sample_all()
+
+    tuned: Dict[str, dict] = {}
+    for d, pod in pods.items():
+        if not first.get(d) or not second.get(d):
+            print(f"[resources] {d}: no cgroup stats readable in the container, skipped")
+            continue
+        entry = tuned[d] = _tuned_resources(d, pod, first[d], second[d], since)
+        obs = entry["observed"]
+        startup = (
+            f"start-up {obs['startup_sec'] or 0:.0f}s at {obs['startup_cpu']:.2f} cpu, {obs['throttled']:.0%} throttled; "
+            if "startup_cpu" in obs else "start-up not observed (pod not restarted); "
+        )
+        limits = entry["limits"]
+        print(
+            f"[resources] {d}: {startup}window {obs['window_cpu']:.2f} cpu, working set {obs['working_set_mi']}Mi"
+            f" -> requests {entry['requests']['cpu']}/{entry['requests']['memory']},"
+            f" limits {limits.get('cpu', '-')}/{limits.get('memory', '-')}"
+            + (f", {entry['java_opts']}" if "java_opts" in entry else "")
+        )
+    if not tuned:
+        return code
+    path = _resource_profile_path()
+    try:
+        profile = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        profile = {}
+    profile.update(tuned)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(profile, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+    print(f"[resources] profile written to {path}; apply it with --resource-profile {path}")
+    return code
+
+
+def _cleanup(ns: str) -> None:
+    if not KUBE:
+        _run([_exe("kubectl"), "delete", "ns", ns, "--ignore-not-found=true"], check=False)
+        return
+    KUBE.delete(None, "Namespace", ns)
+    # like `kubectl delete`, wait until the namespace is actually gone
+    deadline = time.time() + 300
+    while KUBE.get(None, "Namespace", ns) is not None and time.time() < deadline:
+        time.sleep(2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Deploy RuoYi-Cloud to minikube")
+    parser.add_argument(
+        "--namespace",
+        default=MANIFEST_NAMESPACE,
+        help="Namespace to deploy into; several namespaces can be deployed side by side (and concurrently) "
+        "on one cluster, each with its own app image tags",
+    )
+    parser.add_argument("--skip-build", action="store_true", help="Skip docker build")
+    parser.add_argument("--only-apply", action="store_true", help="Only kubectl apply and wait")
+    parser.add_argument("--cleanup", action="store_true", help="Delete namespace and exit")
+    parser.add_argument(
+        "--services",
+        default=None,
+        help="Comma separated services to (re)deploy, e.g. auth,system. "
+        "Only their jars/images are built and only their Deployments are rolled; "
+        "upstream deps (mysql/redis/nacos/...) are just waited on.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After deploying, keep running: rebuild and restart a service whenever its sources change",
+    )
+    parser.add_argument(
+        "--hot-swap",
+        action="store_true",
+        help="Dev mode: with --services/--watch, stream rebuilt jars into the running pods and restart only the JVM "
+        "(falls back to a new image when the Deployment spec or third-party dependencies changed)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore the incremental build cache and rebuild/reload everything",
+    )
+    parser.add_argument(
+        "--image-backend",
+        choices=IMAGE_BACKENDS,
+        default="host",
+        help="host: docker build + minikube image load; "
+        "minikube-docker: build in the node's docker daemon (docker-env, docker runtime only); "
+        "minikube-build: minikube image build (any runtime). The minikube backends skip image load.",
+    )
+    parser.add_argument(
+        "--layered-images",
+        action="store_true",
+        help="Build java images from exploded jars on a shared dependency base image, "
+        "so a code change only rebuilds/transfers a thin application layer",
+    )
+    parser.add_argument(
+        "--appcds",
+        action="store_true",
+        help="Build java images with a class data sharing archive from a training start (slower builds, "
+        "faster pod start-up); start-up times are reported per service",
+    )
+    parser.add_argument(
+        "--mysql-seed",
+        action="store_true",
+        help="Start mysql from a prebuilt image holding the initialized databases (built once per sql hash) "
+        "instead of importing the sql into every fresh pod",
+    )
+    parser.add_argument(
+        "--kube-backend",
+        choices=("kubectl", "api"),
+        default="kubectl",
+        help="kubectl: fork kubectl per call; api: talk to the API server directly (falls back to kubectl)",
+    )
+    parser.add_argument(
+        "--nacos-url",
+        default=None,
+        help="Nacos base url for the config sync (default: kubectl port-forward to svc/ruoyi-nacos)",
+    )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="After deploying, load-test the api through nginx (/prod-api: login, then system list endpoints), "
+        "report throughput and p50/p95/p99 per route and compare with the stored baseline (exit 1 on regressions)",
+    )
+    parser.add_argument("--bench-url", default=None, help="nginx base url for --bench (default: node ip + node port)")
+    parser.add_argument(
+        "--bench-workload",
+        default=None,
+        help="Workload json for --bench (default: deploy/minikube/bench-workload.json)",
+    )
+    parser.add_argument(
+        "--bench-baseline",
+        default=None,
+        help="Baseline json for --bench (default: deploy/minikube/.cache/http-bench-baseline.json, "
+        "written by the first run without errors)",
+    )
+    parser.add_argument("--bench-save-baseline", action="store_true", help="Store this --bench run as the new baseline")
+    parser.add_argument(
+        "--tune-resources",
+        action="store_true",
+        help="After deploying, sample the pods' cgroup cpu/memory (start-up, then the --bench or an idle window) "
+        "and write tuned requests/limits and java heap flags to deploy/minikube/.cache/resource-profile.json",
+    )
+    parser.add_argument(
+        "--resource-profile",
+        default=None,
+        help="Apply a resource profile json (as written by --tune-resources) to the Deployments",
+    )
+    parser.add_argument(
+        "--max-restarts",
+        type=int,
+        default=MAX_RESTARTS,
+        help="Fail the readiness wait once a pod crash-loops this many times (image pull errors fail at once)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Max pipeline tasks (mvn/npm/docker build/minikube load/kubectl) running at once (default: from cpus/memory)",
+    )
+    parser.add_argument("--build-jobs", type=int, default=None, help="Max concurrent docker builds (default: from cpus/memory)")
+    parser.add_argument("--load-jobs", type=int, default=None, help="Max concurrent minikube image loads (default: from cpus/memory)")
+    parser.add_argument(
+        "--pull-jobs",
+        type=int,
+        default=BASE_PULL_JOBS,
+        help=f"Max concurrent docker pulls of missing base images (default: {BASE_PULL_JOBS})",
+    )
+    parser.add_argument(
+        "--mvn-threads",
+        type=int,
+        default=None,
+        help="Maven -T thread count, 0 to build single-threaded (default: half the cpus, at most 16)",
+    )
+    parser.add_argument(
+        "--trace-out",
+        default=None,
+        help="Where to write the Chrome-trace json run report (default: deploy/minikube/.cache/trace.json)",
+    )
+    parser.add_argument("--docker-bin", default=None)
+    parser.add_argument("--kubectl-bin", default=None)
+    parser.add_argument("--minikube-bin", default=None)
+    parser.add_argument("--mvn-bin", default=None)
+    parser.add_argument("--node-bin", default=None)
+    parser.add_argument("--npm-bin", default=None)
+    args = parser.parse_args()
+
+    trace_name = "trace.json" if args.namespace == MANIFEST_NAMESPACE else f"trace-{args.namespace}.json"
+    trace_out = Path(args.trace_out) if args.trace_out else _cache_dir() / trace_name
+    try:
+        return _deploy(args)
+    finally:
+        _write_trace_report(trace_out)
+
+
+def _deploy(args: argparse.Namespace) -> int:
+    global TOOL_BIN, IMAGE_BACKEND, NODE_DOCKER_ENV, LAYERED_IMAGES, MAX_RESTARTS, KUBE, MVN_THREADS, HOT_SWAP, APPCDS, MYSQL_SEED
+    global RESOURCE_PROFILE, CONTENT_TAGS, BASE_PULL_JOBS
+    with TRACE.span("tools"):
+        TOOL_BIN = _ensure_tools(args)
+    if args.kube_backend == "api":
+        with TRACE.span("kube-client"):
+            KUBE = _connect_kube_client()
+    IMAGE_BACKEND = args.image_backend
+    LAYERED_IMAGES = args.layered_images
+    HOT_SWAP = args.hot_swap
+    APPCDS = args.appcds
+    MYSQL_SEED = args.mysql_seed
+    if LAYERED_IMAGES and APPCDS:
+        raise RuntimeError("--layered-images and --appcds are alternative java image layouts, pick one")
+    if HOT_SWAP and (LAYERED_IMAGES or APPCDS):
+        raise RuntimeError("--hot-swap swaps fat jars and can not be combined with --layered-images/--appcds")
+    MAX_RESTARTS = args.max_restarts
+    BASE_PULL_JOBS = max(1, args.pull_jobs)
+    if IMAGE_BACKEND == "host" and not args.cleanup:
+        with TRACE.span("base-images"):
+            _ensure_base_images()
+    elif IMAGE_BACKEND == "minikube-docker" and not args.cleanup:
+        # The node daemon pulls base images itself while building.
+        with TRACE.span("docker-env"):
+            NODE_DOCKER_ENV = _minikube_docker_env()
+
+    if args.cleanup:
+        with TRACE.span("cleanup"):
+            _cleanup(args.namespace)
+        return 0
+
+    if not _k8s_yaml().exists():
+        raise RuntimeError(f"k8s manifest not found: {_k8s_yaml()}")
+
+    # Namespaces are DNS labels.
+    if not re.fullmatch(r"[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?", args.namespace):
+        raise RuntimeError(f"Invalid namespace {args.namespace!r}: lowercase letters, digits and '-', at most 63")
+    # --skip-build/--only-apply deploy the images the manifest names, built by an earlier run or by hand
+    CONTENT_TAGS = not (args.skip_build or args.only_apply)
+
+    if args.resource_profile:
+        RESOURCE_PROFILE = _load_resource_profile(Path(args.resource_profile))
+    workload = None
+    if args.bench:
+        workload = _load_bench_workload(Path(args.bench_workload) if args.bench_workload else _bench_workload_path())
+    if args.watch and (args.only_apply or args.skip_build):
+        raise RuntimeError("--watch rebuilds images and can not be combined with --only-apply/--skip-build")
+    if args.services:
+        targets, upstream = _resolve_services(args.services)
+        print("[services] targets: " + ", ".join(s.name for s in targets))
+        if upstream:
+            print("[services] upstream (wait only): " + ", ".join(s.name for s in upstream))
+    else:
+        targets, upstream = list(SERVICES), []
+
+    # Incremental: each stage only runs for images whose content hash changed since the last run.
+    cache = BuildCache(_cache_dir() / "build-cache.json", enabled=not args.no_cache)
+    with TRACE.span("plan"):
+        tasks = _plan_pipeline(
+            args.namespace,
+            targets,
+            upstream,
+            cache,
+            build_sources=not args.only_apply,
+            build_images=not args.only_apply and not args.skip_build,
+            selective=bool(args.services),
+            nacos_url=args.nacos_url,
+        )
+    costs = _load_task_costs()
+    jobs, limits, MVN_THREADS = _size_pools(args, tasks, costs)
+    start = time.time()
+    try:
+        with TRACE.span("pipeline", jobs=jobs, **{f"{k}_jobs": v for k, v in limits.items()}):
+            _run_pipeline(tasks, max_workers=jobs, limits=limits, costs=costs)
+    finally:
+        _print_pipeline_report(tasks, time.time() - start)
+        _save_task_costs(costs, tasks)
+    with TRACE.span("access"):
+        _print_access(args.namespace)
+    bench: Optional[Callable[[], int]] = None
+    if workload:
+        baseline = Path(args.bench_baseline) if args.bench_baseline else _bench_baseline_path()
+
+        def run_bench() -> int:
+            return _run_bench(args.namespace, workload, args.bench_url, baseline, save_baseline=args.bench_save_baseline)
+
+        bench = run_bench
+
+    code = 0
+    if args.tune_resources:
+        code = _tune_resources(args.namespace, [s.deployment for s in targets], start, bench)
+    elif bench:
+        code = bench()
+    if args.watch:
+        return _watch(args.namespace, targets, cache, jobs, limits, costs)
+    return code
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+"""Checks of deploy.py that need no cluster or build tools.
+
+Run from the repo root:
+
+  python -m unittest discover deploy/minikube
+"""
+
+import re
+import unittest
+
+import deploy
+
+
+def _field(text: str, pattern: str) -> str:
+    m = re.search(pattern, text, re.M)
+    return m.group(1) if m else ""
+
+
+class NamespaceRenderingTest(unittest.TestCase):
+    """Two namespaces deployed side by side: shared content-tagged images, isolated objects."""
+
+    OTHER = "feat-x"
+
+    def setUp(self) -> None:
+        self.saved = deploy.CONTENT_TAGS
+        deploy.CONTENT_TAGS = True
+
+    def tearDown(self) -> None:
+        deploy.CONTENT_TAGS = self.saved
+
+    def render(self, ns: str) -> dict:
+        return {(kind, name): text for kind, name, text in deploy._render_service_docs(ns, deploy.SERVICES, True)}
+
+    def test_images_are_shared(self) -> None:
+        base, other = self.render(deploy.MANIFEST_NAMESPACE), self.render(self.OTHER)
+        for svc in deploy.SERVICES:
+            if not svc.image:
+                continue
+            key = ("Deployment", svc.deployment)
+            image = _field(base[key], r"^\s+image:\s*(\S+)")
+            self.assertTrue(image.startswith(svc.image + "-"), image)  # content tag on top of the manifest tag
+            self.assertEqual(image, _field(other[key], r"^\s+image:\s*(\S+)"))
+
+    def test_objects_are_isolated(self) -> None:
+        base, other = self.render(deploy.MANIFEST_NAMESPACE), self.render(self.OTHER)
+        self.assertEqual({k for k in base if k[0] != "Namespace"}, {k for k in other if k[0] != "Namespace"})
+        for (kind, name), text in other.items():
+            if kind == "Namespace":
+                self.assertEqual(name, self.OTHER)
+                self.assertEqual(_field(text, r"^metadata:\s*\n\s+name:\s*(\S+)"), self.OTHER)
+                continue
+            self.assertEqual(_field(text, r"^  namespace:\s*(\S+)"), self.OTHER, f"{kind} {name}")
+            self.assertEqual(_field(base[(kind, name)], r"^  namespace:\s*(\S+)"), deploy.MANIFEST_NAMESPACE)
+            self.assertNotIn("nodePort:", text, f"{kind} {name} would clash with {deploy.MANIFEST_NAMESPACE}'s node port")
+
+    def test_manifest_tags_without_content_tags(self) -> None:
+        deploy.CONTENT_TAGS = False
+        other = self.render(self.OTHER)
+        for svc in deploy.SERVICES:
+            if svc.image:
+                self.assertEqual(_field(other[("Deployment", svc.deployment)], r"^\s+image:\s*(\S+)"), svc.image)
+
+
+if __name__ == "__main__":
+    unittest.main()